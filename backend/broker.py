@@ -0,0 +1,183 @@
+"""
+Diffusion temps réel des évènements (nouveaux messages) vers les WebSockets connectés.
+
+Chaque WebSocket s'abonne au canal "user:<id>" de son utilisateur. crud.create_message
+publie sur les canaux des deux participants ; le Broker distribue aux abonnés de ce
+processus, et le backend transporte la publication vers les autres workers :
+
+- InMemoryBackend : un seul processus (par défaut). Plusieurs Broker branchés sur la
+  même instance se comportent comme plusieurs workers, ce qui permet de tester la
+  diffusion entre workers sans infrastructure.
+- PostgresBackend : LISTEN/NOTIFY sur la base déjà utilisée par l'API, pour les
+  déploiements multi-workers (BROKER_BACKEND=postgres).
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Messages en attente par connexion ; au-delà, un client trop lent perd les plus anciens
+SUBSCRIBER_QUEUE_SIZE = 100
+
+Deliver = Callable[[str, dict], None]
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class BrokerBackend:
+    """Transport des publications entre processus."""
+
+    async def start(self, deliver: Deliver):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, event: dict):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class InMemoryBackend(BrokerBackend):
+    def __init__(self):
+        self._receivers: list[Deliver] = []
+
+    async def start(self, deliver: Deliver):
+        self._receivers.append(deliver)
+
+    async def publish(self, channel: str, event: dict):
+        for deliver in list(self._receivers):
+            deliver(channel, event)
+
+    async def stop(self):
+        self._receivers.clear()
+
+
+class PostgresBackend(BrokerBackend):
+    """LISTEN/NOTIFY via asyncpg : une connexion qui écoute, une qui publie."""
+
+    CHANNEL = "rezo_events"
+    # NOTIFY refuse les charges de plus de 8000 octets
+    MAX_PAYLOAD_BYTES = 7900
+
+    def __init__(self, dsn: str):
+        self._dsn = dsn
+        self._listener = None
+        self._publisher = None
+        self._publish_lock = asyncio.Lock()
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        import asyncpg # type: ignore
+
+        self._deliver = deliver
+        self._listener = await asyncpg.connect(self._dsn)
+        await self._listener.add_listener(self.CHANNEL, self._on_notify)
+        self._publisher = await asyncpg.connect(self._dsn)
+
+    async def publish(self, channel: str, event: dict):
+        payload = json.dumps({"channel": channel, "event": event}, default=str)
+        if len(payload.encode()) > self.MAX_PAYLOAD_BYTES:
+            # Trop gros pour NOTIFY : on n'envoie que la référence, le client relit via l'API
+            payload = json.dumps({"channel": channel, "event": _reference(event)}, default=str)
+        async with self._publish_lock:
+            await self._publisher.execute("SELECT pg_notify($1, $2)", self.CHANNEL, payload)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed broker notification")
+            return
+        self._deliver(data["channel"], data["event"])
+
+    async def stop(self):
+        if self._listener is not None:
+            await self._listener.close()
+        if self._publisher is not None:
+            await self._publisher.close()
+
+
+def _reference(event: dict) -> dict:
+    message = event.get("message") or {}
+    return {"type": event.get("type"), "conversation_id": message.get("conversation_id"), "id": message.get("id")}
+
+
+class Broker:
+    def __init__(self, backend: Optional[BrokerBackend] = None):
+        self.backend = backend or InMemoryBackend()
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self._deliver)
+
+    async def stop(self):
+        await self.backend.stop()
+        self._loop = None
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(channel, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(channel)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[channel]
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def publish(self, channel: str, event: dict):
+        await self.backend.publish(channel, event)
+
+    def publish_threadsafe(self, channel: str, event: dict):
+        """
+        Publication depuis du code synchrone (crud tourne dans le threadpool de FastAPI).
+        Ne bloque pas : la publication est confiée à la boucle du serveur. Sans boucle
+        démarrée (scripts, shell), l'évènement est simplement ignoré.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self.publish(channel, event), loop)
+        future.add_done_callback(_log_failure)
+
+    def _deliver(self, channel: str, event: dict):
+        for queue in list(self._subscribers.get(channel, ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Broker publish failed: %s", future.exception())
+
+
+def create_backend() -> BrokerBackend:
+    if os.getenv("BROKER_BACKEND", "memory") == "postgres":
+        from sqlalchemy.engine import make_url # type: ignore
+        from database import SQLALCHEMY_DATABASE_URL
+        # asyncpg attend une URL postgresql:// sans nom de pilote SQLAlchemy
+        dsn = make_url(SQLALCHEMY_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresBackend(dsn)
+    return InMemoryBackend()
+
+
+broker = Broker(create_backend())
+
+
+def publish_to_users(user_ids, event: dict):
+    """Point d'entrée du code synchrone (crud) : un évènement vers les canaux de ces utilisateurs."""
+    for user_id in user_ids:
+        broker.publish_threadsafe(user_channel(user_id), event)
@@ -0,0 +1,245 @@
+"""
+Caches en mémoire du processus.
+
+user_cache garde, par id, l'instantané (schemas.User) de l'utilisateur authentifié :
+get_current_user s'en sert pour ne pas relire la table users à chaque requête.
+crud l'invalide à chaque modification de l'utilisateur (update_user, deactivate_user).
+
+response_cache garde les réponses sérialisées des listes du catalogue (GET /offers/,
+GET /formations/) avec leur ETag. Chaque espace ("offers", "formations") a un numéro de
+génération qui fait partie de la clé : crud l'incrémente après le commit de chaque écriture
+du catalogue, ce qui rend d'un coup toutes les pages de l'espace obsolètes. Le numéro est lu
+avant la requête en base, si bien qu'une page calculée pendant une écriture est rangée sous
+l'ancienne génération et n'est jamais resservie.
+
+Le stockage est derrière ResponseStore :
+- MemoryResponseStore : LRU du processus, borné en nombre d'entrées et en octets (par défaut).
+  Ses générations sont propres au processus : une écriture servie par un autre worker ne les
+  fait pas avancer. Ses entrées expirent donc après RESPONSE_CACHE_MEMORY_TTL_SECONDS (10 s),
+  ce qui borne le retard d'un worker sur les écritures des autres ;
+- RedisResponseStore : partagé entre workers (RESPONSE_CACHE_BACKEND=redis, REDIS_URL). Avec
+  plusieurs workers, c'est lui qu'il faut (un avertissement est journalisé sinon, d'après
+  WEB_CONCURRENCY).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+user_cache = TTLCache(ttl=60, maxsize=10000)
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    body: bytes
+
+
+def make_etag(body: bytes) -> str:
+    """ETag fort : empreinte du contenu, stable d'un processus et d'un redémarrage à l'autre."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match se compare en mode faible (RFC 9110) : le préfixe W/ est ignoré."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+class ResponseStore:
+    def generation(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    def invalidate(self, namespace: str):
+        """Passe à la génération suivante : les entrées existantes de l'espace ne sont plus lues."""
+        raise NotImplementedError
+
+    def get(self, namespace: str, generation: int, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    def set(self, namespace: str, generation: int, key: str, response: CachedResponse):
+        raise NotImplementedError
+
+
+class MemoryResponseStore(ResponseStore):
+    def __init__(self, maxsize: int, max_bytes: int, ttl: float):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()  # clé -> (échéance, réponse)
+        self._generations: dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            # Les anciennes générations ne seront plus lues : autant libérer la place tout de suite
+            for item_key in [item_key for item_key in self._items if item_key[0] == namespace]:
+                self._bytes -= len(self._items.pop(item_key)[1].body)
+
+    def get(self, namespace, generation, key):
+        item_key = (namespace, generation, key)
+        with self._lock:
+            item = self._items.get(item_key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                # Expirée : peut-être modifiée depuis via un autre worker
+                del self._items[item_key]
+                self._bytes -= len(item[1].body)
+                return None
+            self._items.move_to_end(item_key)
+            return item[1]
+
+    def set(self, namespace, generation, key, response):
+        if len(response.body) > self.max_bytes:
+            return
+        item_key = (namespace, generation, key)
+        with self._lock:
+            if generation != self._generations.get(namespace, 0):
+                return  # page calculée avant une écriture
+            previous = self._items.pop(item_key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1].body)
+            self._items[item_key] = (time.monotonic() + self.ttl, response)
+            self._bytes += len(response.body)
+            while len(self._items) > self.maxsize or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class RedisResponseStore(ResponseStore):
+    """
+    Générations et réponses dans Redis, partagées par tous les workers. Les entrées expirent
+    après `ttl` secondes : celles des générations dépassées disparaissent d'elles-mêmes.
+    """
+
+    PREFIX = "rezo:response-cache:"
+
+    def __init__(self, url: str, ttl: int):
+        import redis # type: ignore
+
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def generation(self, namespace):
+        return int(self._redis.get(f"{self.PREFIX}generation:{namespace}") or 0)
+
+    def invalidate(self, namespace):
+        self._redis.incr(f"{self.PREFIX}generation:{namespace}")
+
+    def get(self, namespace, generation, key):
+        value = self._redis.get(f"{self.PREFIX}{namespace}:{generation}:{key}")
+        if value is None:
+            return None
+        etag, _, body = value.partition(b"\n")
+        return CachedResponse(etag.decode(), body)
+
+    def set(self, namespace, generation, key, response):
+        value = response.etag.encode() + b"\n" + response.body
+        self._redis.set(f"{self.PREFIX}{namespace}:{generation}:{key}", value, ex=self.ttl)
+
+
+class ResponseCache:
+    def __init__(self, store: ResponseStore):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, namespace: str) -> int:
+        return self.store.generation(namespace)
+
+    def get(self, namespace: str, generation: int, key: str) -> Optional[CachedResponse]:
+        response = self.store.get(namespace, generation, key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, namespace: str, generation: int, key: str, body: bytes) -> CachedResponse:
+        response = CachedResponse(make_etag(body), body)
+        self.store.set(namespace, generation, key, response)
+        return response
+
+    def invalidate(self, namespace: str):
+        self.store.invalidate(namespace)
+
+
+def create_response_store() -> ResponseStore:
+    if os.getenv("RESPONSE_CACHE_BACKEND", "memory") == "redis":
+        return RedisResponseStore(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            ttl=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+        )
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning(
+            "Response cache kept per process with %s workers: pages may lag writes from other "
+            "workers by up to RESPONSE_CACHE_MEMORY_TTL_SECONDS (set RESPONSE_CACHE_BACKEND=redis)",
+            os.getenv("WEB_CONCURRENCY"),
+        )
+    return MemoryResponseStore(
+        maxsize=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.getenv("RESPONSE_CACHE_MEMORY_TTL_SECONDS", "10")),
+    )
+
+
+response_cache = ResponseCache(create_response_store())
@@ -0,0 +1,148 @@
+"""
+Import en masse d'offres (entreprises) et de formations (universités).
+
+Le fichier (CSV avec en-tête, ou NDJSON : un objet JSON par ligne) est lu au fil de
+l'envoi, sans jamais être gardé en entier : chaque enregistrement est validé par le schéma
+de création dès qu'il est complet, les lignes valides sont insérées par lots de CHUNK_SIZE
+(un INSERT multi-lignes et un commit par lot), les invalides sont comptées et rapportées
+avec leur numéro de ligne. La mémoire reste bornée par un lot, quelle que soit la taille
+du fichier.
+
+Un lot validé reste en base même si la suite du fichier est invalide : le résumé dit
+combien de lignes ont été insérées.
+"""
+import codecs
+import csv
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+from pydantic import BaseModel, ValidationError # type: ignore
+
+from database import run_db
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/csv": CSV,
+    "application/x-ndjson": NDJSON,
+    "application/ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+}
+
+
+def detect_format(content_type: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """Format explicite (?format=csv|ndjson), sinon d'après le Content-Type. None si inconnu."""
+    if requested:
+        return requested if requested in (CSV, NDJSON) else None
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return CONTENT_TYPES.get(media_type)
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # utf-8-sig : ignore le BOM des CSV exportés par Excel
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _records(chunks: AsyncIterator[bytes], file_format: str) -> AsyncIterator[tuple[int, Optional[dict], Optional[list]]]:
+    """(numéro de ligne, champs, erreurs) pour chaque enregistrement non vide du fichier."""
+    header = None
+    record, record_line, line_number = "", 0, 0
+    async for line in _lines(chunks):
+        line_number += 1
+        if file_format == NDJSON:
+            if not line.strip():
+                continue
+            try:
+                fields = json.loads(line)
+            except ValueError:
+                yield line_number, None, [{"field": None, "message": "Invalid JSON"}]
+                continue
+            if not isinstance(fields, dict):
+                yield line_number, None, [{"field": None, "message": "Expected a JSON object"}]
+                continue
+            yield line_number, fields, None
+            continue
+
+        # CSV : un enregistrement peut couvrir plusieurs lignes (champ entre guillemets contenant
+        # un saut de ligne) ; il est complet quand le nombre de guillemets est pair.
+        if not record:
+            record_line = line_number
+        record += line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_line, None, [{"field": None, "message": f"Expected {len(header)} columns, got {len(values)}"}]
+            continue
+        # Cellule vide : champ absent (None), comme une clé omise en NDJSON
+        yield record_line, {name: value if value.strip() else None for name, value in zip(header, values)}, None
+    if record.strip():
+        yield record_line, None, [{"field": None, "message": "Unterminated quoted field"}]
+
+
+async def import_items(
+    db,
+    chunks: AsyncIterator[bytes],
+    file_format: str,
+    schema: type[BaseModel],
+    owner_field: str,
+    owner_id: int,
+    insert,
+) -> dict:
+    """
+    Valide chaque enregistrement avec `schema` (le propriétaire vient de l'URL, pas du fichier)
+    et insère les valides par lots via `insert(db, owner_id, items)` (crud.create_company_offers,
+    crud.create_university_formations). Renvoie le résumé (schemas.ImportSummary).
+    """
+    summary = {"received": 0, "inserted": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    batch = []
+
+    async def flush():
+        summary["inserted"] += len(await run_db(db, insert, owner_id, batch))
+        batch.clear()
+        logger.info("Import %s=%s: %d rows inserted", owner_field, owner_id, summary["inserted"])
+
+    async for line_number, fields, errors in _records(chunks, file_format):
+        summary["received"] += 1
+        if errors is None:
+            try:
+                batch.append(schema.model_validate({**fields, owner_field: owner_id}))
+            except ValidationError as exc:
+                errors = [
+                    {"field": ".".join(str(part) for part in error["loc"]), "message": error["msg"]}
+                    for error in exc.errors()
+                ]
+        if errors is not None:
+            summary["failed"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append({"line": line_number, "errors": errors})
+            else:
+                summary["errors_truncated"] = True
+        if len(batch) >= CHUNK_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return summary
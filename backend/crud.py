@@ -1,9 +1,24 @@
-from sqlalchemy.orm import Session # type: ignore
-from passlib.context import CryptContext # type: ignore
+from sqlalchemy import case, func, insert, or_, select, tuple_, update # type: ignore
+from sqlalchemy.orm import Session, aliased, selectinload # type: ignore
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+import broker
 import models
+from cache import response_cache, user_cache
+import notifications
+import ranking
 import schemas
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def schema_columns(model, schema):
+    """
+    Colonnes de `model` correspondant aux champs de `schema`, dans le même ordre : lectures
+    projetées des grandes listes, sérialisées sans objets ORM ni validation (voir fastjson).
+    """
+    return [getattr(model, name) for name in schema.model_fields]
+
+def _row_dicts(rows):
+    return [row._asdict() for row in rows]
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
@@ -11,8 +26,74 @@ def get_user_by_email(db: Session, email: str):
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+PROFILE_MODELS = {
+    models.UserType.STUDENT: models.Student,
+    models.UserType.HIGH_SCHOOL: models.HighSchooler,
+    models.UserType.COMPANY: models.Company,
+    models.UserType.UNIVERSITY: models.University,
+}
+
+def get_users_with_profiles(db: Session, user_ids: list[int]):
+    """
+    Utilisateurs `user_ids` et leur profil selon leur type : une requête sur users, puis une
+    par table de profil présente dans le lot. Renvoie {user_id: (user, profil ou None)} ;
+    les ids inconnus sont absents.
+    """
+    users = db.query(models.User).filter(models.User.id.in_(user_ids)).all() if user_ids else []
+    ids_by_type = {}
+    for user in users:
+        ids_by_type.setdefault(user.user_type, []).append(user.id)
+    profiles = {}
+    for user_type, ids in ids_by_type.items():
+        profile_model = PROFILE_MODELS.get(user_type)
+        if profile_model is not None:
+            profiles.update((profile.user_id, profile) for profile in db.query(profile_model).filter(profile_model.user_id.in_(ids)))
+    return {user.id: (user, profiles.get(user.id)) for user in users}
+
+# Schéma de réponse du profil de chaque type, et ce qu'il possède (modèle, schéma, colonne du propriétaire)
+PROFILE_SCHEMAS = {
+    models.UserType.STUDENT: schemas.Student,
+    models.UserType.HIGH_SCHOOL: schemas.HighSchooler,
+    models.UserType.COMPANY: schemas.CompanySummary,
+    models.UserType.UNIVERSITY: schemas.UniversitySummary,
+}
+PROFILE_ITEMS = {
+    models.UserType.COMPANY: (models.Offer, schemas.Offer, "company_id"),
+    models.UserType.UNIVERSITY: (models.Formation, schemas.Formation, "university_id"),
+}
+
+def get_profile_page(
+    db: Session, user_id: int, item_fields: Optional[list[str]] = None, items_after: Optional[int] = None, items_limit: int = 20,
+):
+    """
+    Page de profil : l'utilisateur et son profil en une requête (jointures externes sur les
+    tables de profil, par user_id), puis, si `item_fields` est donné, une page de ses offres
+    ou formations par id croissant, réduite à ces colonnes (plus id ; celles d'un autre type
+    d'élément sont ignorées). Deux requêtes au plus, sans chargement paresseux. Renvoie
+    (user, profil, lignes) ou None.
+    """
+    profile_models = list(PROFILE_MODELS.values())
+    query = db.query(models.User, *profile_models)
+    for profile_model in profile_models:
+        query = query.outerjoin(profile_model, profile_model.user_id == models.User.id)
+    row = query.filter(models.User.id == user_id).first()
+    if row is None:
+        return None
+    user, *profiles = row
+    profile = next((profile for profile in profiles if profile is not None), None)
+    rows = None
+    if item_fields is not None and profile is not None and user.user_type in PROFILE_ITEMS:
+        item_model, item_schema, owner_column = PROFILE_ITEMS[user.user_type]
+        names = [name for name in dict.fromkeys([*item_fields, "id"]) if name in item_schema.model_fields]
+        columns = [getattr(item_model, name) for name in names]
+        items = db.query(*columns).filter(getattr(item_model, owner_column) == profile.id, _live(item_model))
+        if items_after is not None:
+            items = items.filter(item_model.id > items_after)
+        rows = _row_dicts(items.order_by(item_model.id).limit(items_limit))
+    return user, profile, rows
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    # Le hachage est calculé par l'appelant hors de la boucle d'évènements (voir passwords.py)
     db_user = models.User(
         email=user.email,
         hashed_password=hashed_password,
@@ -21,27 +102,13 @@ def create_user(db: Session, user: schemas.UserCreate):
         last_name=user.last_name,
     )
     db.add(db_user)
-    db.commit() # Commit to get the user ID
-    db.refresh(db_user)
+    db.flush() # INSERT ... RETURNING id, sans commit : l'utilisateur et son profil sont écrits ensemble
 
     # Create the associated profile based on user_type
-    if user.user_type == models.UserType.STUDENT:
-        db_profile = models.Student(user_id=db_user.id)
-    elif user.user_type == models.UserType.HIGH_SCHOOL:
-        db_profile = models.HighSchooler(user_id=db_user.id)
-    elif user.user_type == models.UserType.COMPANY:
-        db_profile = models.Company(user_id=db_user.id)
-    elif user.user_type == models.UserType.UNIVERSITY:
-        db_profile = models.University(user_id=db_user.id)
-    else:
-        # Handle unknown user type if necessary
-        db_profile = None
-
-    if db_profile:
-        db.add(db_profile)
-        db.commit()
-        db.refresh(db_profile)
-
+    profile_model = PROFILE_MODELS.get(user.user_type)
+    if profile_model:
+        db.add(profile_model(user_id=db_user.id))
+    db.commit()
     return db_user
 
 def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
@@ -53,8 +120,26 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
         setattr(db_user, key, value)
     db.commit()
     db.refresh(db_user)
+    user_cache.invalidate(user_id)
     return db_user
 
+def deactivate_user(db: Session, user_id: int):
+    db_user = get_user(db, user_id)
+    if not db_user:
+        return None
+    db_user.is_active = False
+    db_user.device_token = None
+    db.commit()
+    db.refresh(db_user)
+    user_cache.invalidate(user_id)
+    return db_user
+
+def update_user_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
 def update_user_device_token(db: Session, user_id: int, token: str):
     db_user = get_user(db, user_id)
     if db_user:
@@ -84,6 +169,8 @@ def update_student_profile(db: Session, user_id: int, profile_data: schemas.Stud
     for key, value in update_data.items():
         setattr(db_profile, key, value)
     db.commit()
+    if "skills" in update_data:
+        refresh_profile_shortlists(db, "offers", user_id, db_profile.skills)
     db.refresh(db_profile)
     return db_profile
 
@@ -108,6 +195,8 @@ def update_high_schooler_profile(db: Session, user_id: int, profile_data: schema
     for key, value in update_data.items():
         setattr(db_profile, key, value)
     db.commit()
+    if "strong_subjects" in update_data:
+        refresh_profile_shortlists(db, "formations", user_id, db_profile.strong_subjects)
     db.refresh(db_profile)
     return db_profile
 
@@ -122,18 +211,30 @@ def get_company(db: Session, company_id: int):
     return db.query(models.Company).filter(models.Company.id == company_id).first()
 
 def get_company_by_user_id(db: Session, user_id: int):
-    return db.query(models.Company).filter(models.Company.user_id == user_id).first()
+    # offers est sérialisée dans la réponse : chargée ici (requis en mode async, voir database.run_db)
+    return db.query(models.Company).options(selectinload(models.Company.offers)).filter(models.Company.user_id == user_id).first()
 
 def update_company_profile(db: Session, user_id: int, profile_data: schemas.CompanyUpdate):
     db_profile = get_company_by_user_id(db, user_id)
     if not db_profile:
         return None
     update_data = profile_data.dict(exclude_unset=True)
+    industry_changed = "industry" in update_data and update_data["industry"] != db_profile.industry
+    if industry_changed:
+        # Les offres en ligne de l'entreprise passent d'un secteur à l'autre dans les facettes
+        live_offers = db.query(func.count(models.Offer.id)).filter(
+            models.Offer.company_id == db_profile.id, models.Offer.closed_at.is_(None)
+        ).scalar()
+        _bump_facets(db, "offers", Counter({
+            ("industry", db_profile.industry): -live_offers,
+            ("industry", update_data["industry"]): live_offers,
+        }))
     for key, value in update_data.items():
         setattr(db_profile, key, value)
     db.commit()
-    db.refresh(db_profile)
-    return db_profile
+    if industry_changed:
+        response_cache.invalidate("offers")
+    return get_company_by_user_id(db, user_id)
 
 def create_university(db: Session, university: schemas.UniversityCreate):
     db_university = models.University(**university.dict())
@@ -146,7 +247,7 @@ def get_university(db: Session, university_id: int):
     return db.query(models.University).filter(models.University.id == university_id).first()
 
 def get_university_by_user_id(db: Session, user_id: int):
-    return db.query(models.University).filter(models.University.user_id == user_id).first()
+    return db.query(models.University).options(selectinload(models.University.formations)).filter(models.University.user_id == user_id).first()
 
 def update_university_profile(db: Session, user_id: int, profile_data: schemas.UniversityUpdate):
     db_profile = get_university_by_user_id(db, user_id)
@@ -156,117 +257,924 @@ def update_university_profile(db: Session, user_id: int, profile_data: schemas.U
     for key, value in update_data.items():
         setattr(db_profile, key, value)
     db.commit()
-    db.refresh(db_profile)
-    return db_profile
+    return get_university_by_user_id(db, user_id)
 
 def create_company_offer(db: Session, offer: schemas.OfferCreate, company_id: int):
-    db_offer = models.Offer(**offer.dict(), company_id=company_id)
+    db_offer = models.Offer(**offer.dict(exclude={"company_id"}), company_id=company_id)
     db.add(db_offer)
+    _bump_facets(db, "offers", _offer_facet_deltas(db, company_id, [offer]))
     db.commit()
     db.refresh(db_offer)
+    ranking.offer_index.add(db_offer.id, db_offer.title, db_offer.description)
+    response_cache.invalidate("offers")
     return db_offer
 
-def get_offers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Offer).offset(skip).limit(limit).all()
+def create_company_offers(db: Session, company_id: int, offers: list[schemas.OfferCreate]):
+    """Insertion en masse (imports) : un INSERT multi-lignes et un commit par lot. Renvoie les ids."""
+    rows = db.execute(
+        insert(models.Offer).returning(models.Offer.id, models.Offer.title, models.Offer.description),
+        [{**offer.dict(exclude={"company_id"}), "company_id": company_id} for offer in offers],
+    ).all()
+    _bump_facets(db, "offers", _offer_facet_deltas(db, company_id, offers))
+    db.commit()
+    ranking.offer_index.add_many(rows)
+    response_cache.invalidate("offers")
+    return [row.id for row in rows]
+
+def get_offers(
+    db: Session, skip: int = 0, limit: int = 100, as_rows: bool = False,
+    industry: Optional[str] = None, q: Optional[str] = None, level: Optional[str] = None,
+):
+    if as_rows:
+        query = db.query(*schema_columns(models.Offer, schemas.Offer))
+        return _row_dicts(_filter_offers(query, industry, q, level).order_by(models.Offer.id).offset(skip).limit(limit))
+    return _filter_offers(db.query(models.Offer), industry, q, level).order_by(models.Offer.id).offset(skip).limit(limit).all()
+
+def get_catalog_rows_after(db: Session, model, schema, after: Optional[int] = None, limit: int = 1000):
+    """Exports du catalogue : lignes en ligne projetées par id croissant, à partir de l'id `after` (exclu)."""
+    query = db.query(*schema_columns(model, schema)).filter(_live(model))
+    if after is not None:
+        query = query.filter(model.id > after)
+    return _row_dicts(query.order_by(model.id).limit(limit))
+
+def get_offer_deck(
+    db: Session, user_id: int, cursor: Optional[int] = None, limit: int = 20,
+    industry: Optional[str] = None, q: Optional[str] = None, level: Optional[str] = None,
+):
+    """
+    Pile de swipe d'un étudiant : offres qu'il n'a pas encore swipées, restreintes aux filtres.
+    Classées par pertinence avec ses compétences quand il en a renseigné (voir ranking.py),
+    sinon par id. Dans les deux cas le curseur est l'id de la dernière offre reçue.
+    """
+    student = get_student_by_user_id(db, user_id)
+    if student and ranking.has_terms(student.skills):
+        ranking.offer_index.sync(db)
+        swiped = db.query(models.Match.offer_id).filter(
+            models.Match.user_id == user_id, models.Match.offer_id.isnot(None)
+        )
+        return _ranked_deck(
+            ranking.offer_index, student.skills, [offer_id for (offer_id,) in swiped], cursor, limit,
+            lambda ids: _filter_offers(db.query(models.Offer), industry, q, level).filter(models.Offer.id.in_(ids)),
+            filtered=any(value is not None for value in (industry, q, level)),
+        )
+
+    # Sans profil exploitable : ordre par id, exclusion des matches dans la même requête (NOT EXISTS)
+    already_swiped = db.query(models.Match.id).filter(
+        models.Match.user_id == user_id,
+        models.Match.offer_id == models.Offer.id,
+    )
+    query = _filter_offers(db.query(models.Offer), industry, q, level).filter(~already_swiped.exists())
+    if cursor is not None:
+        query = query.filter(models.Offer.id > cursor)
+    return query.order_by(models.Offer.id).limit(limit).all()
 
 def create_university_formation(db: Session, formation: schemas.FormationCreate, university_id: int):
-    db_formation = models.Formation(**formation.dict(), university_id=university_id)
+    db_formation = models.Formation(**formation.dict(exclude={"university_id"}), university_id=university_id)
     db.add(db_formation)
+    _bump_facets(db, "formations", _level_deltas([formation]))
     db.commit()
     db.refresh(db_formation)
+    ranking.formation_index.add(db_formation.id, db_formation.title, db_formation.description)
+    response_cache.invalidate("formations")
     return db_formation
 
-def get_formations(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Formation).offset(skip).limit(limit).all()
+def create_university_formations(db: Session, university_id: int, formations: list[schemas.FormationCreate]):
+    rows = db.execute(
+        insert(models.Formation).returning(models.Formation.id, models.Formation.title, models.Formation.description),
+        [{**formation.dict(exclude={"university_id"}), "university_id": university_id} for formation in formations],
+    ).all()
+    _bump_facets(db, "formations", _level_deltas(formations))
+    db.commit()
+    ranking.formation_index.add_many(rows)
+    response_cache.invalidate("formations")
+    return [row.id for row in rows]
+
+def get_formations(
+    db: Session, skip: int = 0, limit: int = 100, as_rows: bool = False,
+    q: Optional[str] = None, level: Optional[str] = None,
+):
+    if as_rows:
+        query = db.query(*schema_columns(models.Formation, schemas.Formation))
+        return _row_dicts(_filter_catalog(query, models.Formation, q, level).order_by(models.Formation.id).offset(skip).limit(limit))
+    return _filter_catalog(db.query(models.Formation), models.Formation, q, level).order_by(models.Formation.id).offset(skip).limit(limit).all()
+
+def get_formation_deck(
+    db: Session, user_id: int, cursor: Optional[int] = None, limit: int = 20,
+    q: Optional[str] = None, level: Optional[str] = None,
+):
+    """Pile de swipe d'un lycéen : même principe que get_offer_deck, avec ses matières fortes."""
+    high_schooler = get_high_schooler_by_user_id(db, user_id)
+    if high_schooler and ranking.has_terms(high_schooler.strong_subjects):
+        ranking.formation_index.sync(db)
+        swiped = db.query(models.Match.formation_id).filter(
+            models.Match.user_id == user_id, models.Match.formation_id.isnot(None)
+        )
+        return _ranked_deck(
+            ranking.formation_index, high_schooler.strong_subjects, [formation_id for (formation_id,) in swiped], cursor, limit,
+            lambda ids: _filter_catalog(db.query(models.Formation), models.Formation, q, level).filter(models.Formation.id.in_(ids)),
+            filtered=q is not None or level is not None,
+        )
+
+    already_swiped = db.query(models.Match.id).filter(
+        models.Match.user_id == user_id,
+        models.Match.formation_id == models.Formation.id,
+    )
+    query = _filter_catalog(db.query(models.Formation), models.Formation, q, level).filter(~already_swiped.exists())
+    if cursor is not None:
+        query = query.filter(models.Formation.id > cursor)
+    return query.order_by(models.Formation.id).limit(limit).all()
+
+def _live(model):
+    """Éléments en ligne : ni clôturés, ni expirés (la purge de lifecycle.py clôture ces derniers ensuite)."""
+    return model.closed_at.is_(None) & (model.expires_at.is_(None) | (model.expires_at > func.now()))
+
+# Filtres des listes et des decks (None : pas de filtre), appliqués aux seuls éléments en ligne.
+# q : sous-chaîne du titre ou de la description, sans tenir compte de la casse ; level et
+# industry : valeur exacte (celles des facettes).
+def _filter_catalog(query, model, q: Optional[str] = None, level: Optional[str] = None):
+    query = query.filter(_live(model))
+    if level is not None:
+        query = query.filter(model.level == level)
+    if q is not None:
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.filter(or_(model.title.ilike(pattern, escape="\\"), model.description.ilike(pattern, escape="\\")))
+    return query
+
+def _filter_offers(query, industry: Optional[str] = None, q: Optional[str] = None, level: Optional[str] = None):
+    if industry is not None:
+        query = query.join(models.Company, models.Company.id == models.Offer.company_id).filter(models.Company.industry == industry)
+    return _filter_catalog(query, models.Offer, q, level)
+
+CATALOG_FACETS = {"offers": ("industry", "level"), "formations": ("level",)}
+
+def _level_deltas(items):
+    return Counter(("level", item.level) for item in items)
+
+def _offer_facet_deltas(db: Session, company_id: int, offers):
+    industry = db.query(models.Company.industry).filter(models.Company.id == company_id).scalar()
+    return _level_deltas(offers) + Counter({("industry", industry): len(offers)})
+
+def _bump_facets(db: Session, kind: str, deltas: Counter):
+    """
+    Applique `deltas` ({(facette, valeur): variation}) à models.CatalogFacet, dans la transaction
+    de l'appelant : un upsert multi-lignes, lignes triées (même ordre de verrouillage partout).
+    """
+    rows = [
+        {"kind": kind, "facet": facet, "value": value, "count": delta}
+        for (facet, value), delta in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1] or ""))
+        if value and delta
+    ]
+    if not rows:
+        return
+    statement = _insert(db, models.CatalogFacet)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=["kind", "facet", "value"],
+        set_={"count": models.CatalogFacet.count + statement.excluded.count},
+    ), rows)
+
+def get_catalog_facets(db: Session, kind: str):
+    """Facettes de "offers" ou "formations" : valeurs par nombre d'éléments décroissant."""
+    facets = {facet: [] for facet in CATALOG_FACETS[kind]}
+    for facet, value, count in db.query(models.CatalogFacet.facet, models.CatalogFacet.value, models.CatalogFacet.count).filter(
+        models.CatalogFacet.kind == kind, models.CatalogFacet.count > 0
+    ).order_by(models.CatalogFacet.facet, models.CatalogFacet.count.desc(), models.CatalogFacet.value):
+        facets.setdefault(facet, []).append({"value": value, "count": count})
+    return facets
+
+# Decks inverses : profils classés contre une offre (étudiants) ou une formation (lycéens),
+# lus dans des shortlists bornées (models.SHORTLIST_SIZE). Les calculs utilisent les index en
+# mémoire de ranking.py : ouvrir un deck ne lit que la shortlist. Une offre créée (ou dont la
+# shortlist a perdu un profil) attend, shortlisted_at vide, la tâche de fond de lifecycle.py :
+# son deck inverse peut donc avoir quelques secondes de retard, sans ralentir les écritures.
+class Shortlist(NamedTuple):
+    model: type
+    item_column: str
+    item_model: type
+    owner_model: type
+    owner_column: str
+    profile_model: type
+    item_index: ranking.RelevanceIndex
+    profile_index: ranking.ProfileIndex
+
+SHORTLISTS = {
+    "offers": Shortlist(
+        models.OfferShortlist, "offer_id", models.Offer, models.Company, "company_id",
+        models.Student, ranking.offer_index, ranking.student_index,
+    ),
+    "formations": Shortlist(
+        models.FormationShortlist, "formation_id", models.Formation, models.University, "university_id",
+        models.HighSchooler, ranking.formation_index, ranking.high_schooler_index,
+    ),
+}
+
+def _upsert_shortlist_rows(db: Session, spec: Shortlist, rows: list[dict]):
+    # Upsert : la tâche de fond et un PATCH de profil peuvent écrire la même ligne en même temps.
+    # Sur la table (pas le modèle) : executemany direct, sans le traitement ORM ligne à ligne.
+    statement = _insert(db, spec.model.__table__)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[spec.item_column, "user_id"], set_={"score": statement.excluded.score},
+    ), rows)
+
+def refresh_pending_shortlists(db: Session, kind: str, limit: int = 500):
+    """
+    Un lot de la tâche de fond : recalcule les shortlists de jusqu'à `limit` éléments en ligne en
+    attente (shortlisted_at vide), en un produit de matrices (ranking top_profiles) contre les
+    profils qui partagent un terme avec l'une d'elles. Renvoie leurs ids. SKIP LOCKED, comme la purge.
+    """
+    spec = SHORTLISTS[kind]
+    item_model = spec.item_model
+    items = db.query(item_model.id, item_model.title, item_model.description).filter(
+        item_model.shortlisted_at.is_(None), item_model.closed_at.is_(None)
+    ).order_by(item_model.id).limit(limit).with_for_update(skip_locked=True).all()
+    if not items:
+        return []
+    spec.item_index.sync(db)
+    spec.profile_index.sync(db)
+    spec.item_index.add_missing(items)
+    item_ids = [item.id for item in items]
+    terms = set().union(*(ranking.item_terms(item.title, item.description) for item in items))
+    best = spec.item_index.top_profiles(item_ids, spec.profile_index.candidates(terms), models.SHORTLIST_SIZE)
+
+    item_column = getattr(spec.model, spec.item_column)
+    db.query(spec.model).filter(item_column.in_(item_ids)).delete(synchronize_session=False)
+    rows = [
+        {spec.item_column: item_id, "user_id": user_id, "score": score}
+        for item_id, profiles in zip(item_ids, best) for user_id, score in profiles
+    ]
+    if rows:
+        _upsert_shortlist_rows(db, spec, rows)
+    db.query(item_model).filter(item_model.id.in_(item_ids)).update(
+        {item_model.shortlisted_at: func.now()}, synchronize_session=False
+    )
+    db.commit()
+    return item_ids
+
+def refresh_profile_shortlists(db: Session, kind: str, user_id: int, text: Optional[str]):
+    """
+    Replace un profil modifié dans les shortlists, dans la requête : seuls ses
+    models.SHORTLIST_SIZE éléments de meilleur score (ranking scores_for) sont examinés, il entre
+    dans leur shortlist si elle n'est pas pleine ou s'il dépasse le dernier score. Les autres
+    shortlists où il figurait sont remises en attente : la tâche de fond les recalcule en entier
+    (un autre profil y entre, ou lui s'il y garde sa place). Un élément hors de ses
+    SHORTLIST_SIZE premiers ne le reçoit qu'à son prochain calcul. Requêtes bornées par
+    SHORTLIST_SIZE, quel que soit le nombre d'éléments qui lui correspondent.
+    """
+    spec = SHORTLISTS[kind]
+    spec.item_index.sync(db)
+    spec.profile_index.sync(db)
+    spec.profile_index.add(user_id, text)
+    item_model = spec.item_model
+    item_column = getattr(spec.model, spec.item_column)
+    item_ids, scores = spec.item_index.scores_for(text, models.SHORTLIST_SIZE)
+    item_ids, scores = item_ids.tolist(), scores.tolist()
+    if item_ids:
+        # L'index peut garder un élément clôturé par un autre worker depuis son dernier sync()
+        live = {item_id for (item_id,) in db.query(item_model.id).filter(item_model.id.in_(item_ids), item_model.closed_at.is_(None))}
+        scores = [score for item_id, score in zip(item_ids, scores) if item_id in live]
+        item_ids = [item_id for item_id in item_ids if item_id in live]
+
+    # Avant de retirer ses lignes : les shortlists qu'il quitte, en sous-requête (jamais une liste IN non bornée)
+    left = select(item_column).where(spec.model.user_id == user_id)
+    if item_ids:
+        left = left.where(item_column.not_in(item_ids))
+    db.query(item_model).filter(item_model.id.in_(left)).update(
+        {item_model.shortlisted_at: None}, synchronize_session=False
+    )
+    db.query(spec.model).filter(spec.model.user_id == user_id).delete(synchronize_session=False)
+
+    entered, full = [], []
+    if item_ids:
+        bounds = {
+            item_id: (count, lowest)
+            for item_id, count, lowest in db.query(item_column, func.count(), func.min(spec.model.score))
+            .filter(item_column.in_(item_ids)).group_by(item_column)
+        }
+        for item_id, score in zip(item_ids, scores):
+            count, lowest = bounds.get(item_id, (0, None))
+            if count < models.SHORTLIST_SIZE or score > lowest:
+                entered.append({spec.item_column: item_id, "user_id": user_id, "score": score})
+                if count >= models.SHORTLIST_SIZE:
+                    full.append(item_id)
+    if entered:
+        _upsert_shortlist_rows(db, spec, entered)
+    if full:
+        # Une ligne de trop dans ces shortlists : on retire la dernière
+        ranked = db.query(
+            item_column.label("item_id"), spec.model.user_id,
+            func.row_number().over(partition_by=item_column, order_by=(spec.model.score.desc(), spec.model.user_id)).label("position"),
+        ).filter(item_column.in_(full)).subquery()
+        overflow = db.query(ranked.c.item_id, ranked.c.user_id).filter(ranked.c.position > models.SHORTLIST_SIZE)
+        db.query(spec.model).filter(tuple_(item_column, spec.model.user_id).in_(overflow)).delete(synchronize_session=False)
+    db.commit()
+
+def get_candidate_deck(db: Session, kind: str, owner_user_id: int, item_id: int, limit: int = 20):
+    """
+    Deck inverse d'une offre / formation de l'utilisateur `owner_user_id` : (score, user, profil)
+    par score décroissant, depuis la shortlist. None si l'élément n'est pas à lui.
+    """
+    spec = SHORTLISTS[kind]
+    if not _is_owner(db, spec, owner_user_id, item_id):
+        return None
+    profile_model = spec.profile_model
+    return db.query(spec.model.score, models.User, profile_model).join(
+        models.User, models.User.id == spec.model.user_id
+    ).join(profile_model, profile_model.user_id == models.User.id).filter(
+        getattr(spec.model, spec.item_column) == item_id, models.User.is_active.is_(True)
+    ).order_by(spec.model.score.desc(), spec.model.user_id).limit(limit).all()
+
+def _is_owner(db: Session, spec: Shortlist, owner_user_id: int, item_id: int):
+    owner, item_model = spec.owner_model, spec.item_model
+    return db.query(item_model.id).join(owner, owner.id == getattr(item_model, spec.owner_column)).filter(
+        item_model.id == item_id, owner.user_id == owner_user_id
+    ).first() is not None
+
+# Cycle de vie : clôture des offres / formations, par leur propriétaire ou, passé expires_at,
+# par la purge de lifecycle.py. Dans la même transaction : facettes décomptées, shortlists
+# supprimées et swipes déplacés de matches vers models.ArchivedMatch.
+ARCHIVED_MATCH_COLUMNS = {
+    "match_id": models.Match.id, "created_at": models.Match.created_at, "user_id": models.Match.user_id,
+    "offer_id": models.Match.offer_id, "formation_id": models.Match.formation_id, "is_like": models.Match.is_like,
+}
+
+def _close_items(db: Session, kind: str, item_ids: list[int]):
+    """
+    Clôture celles de `item_ids` encore ouvertes, commite et renvoie leurs ids. Le UPDATE ne
+    prend que les lignes sans closed_at : deux clôtures concurrentes (propriétaire et purge)
+    ne décomptent pas deux fois les facettes.
+    """
+    spec = SHORTLISTS[kind]
+    item_model = spec.item_model
+    closed = db.execute(
+        update(item_model).where(item_model.id.in_(item_ids), item_model.closed_at.is_(None))
+        .values(closed_at=func.now()).returning(item_model.id)
+    ).scalars().all()
+    if closed:
+        deltas = Counter()
+        for level, count in db.query(item_model.level, func.count()).filter(item_model.id.in_(closed)).group_by(item_model.level):
+            deltas["level", level] -= count
+        if kind == "offers":
+            for industry, count in db.query(models.Company.industry, func.count()).join(models.Offer.company).filter(
+                models.Offer.id.in_(closed)
+            ).group_by(models.Company.industry):
+                deltas["industry", industry] -= count
+        _bump_facets(db, kind, deltas)
+
+        match_column = getattr(models.Match, spec.item_column)
+        db.execute(insert(models.ArchivedMatch).from_select(
+            list(ARCHIVED_MATCH_COLUMNS), select(*ARCHIVED_MATCH_COLUMNS.values()).where(match_column.in_(closed)),
+        ))
+        db.query(models.Match).filter(match_column.in_(closed)).delete(synchronize_session=False)
+        db.query(spec.model).filter(getattr(spec.model, spec.item_column).in_(closed)).delete(synchronize_session=False)
+    db.commit()
+    if closed:
+        spec.item_index.remove_many(closed)
+        response_cache.invalidate(kind)
+    return closed
+
+def close_owned_item(db: Session, kind: str, owner_user_id: int, item_id: int):
+    """Clôture une offre / formation de `owner_user_id` et la renvoie (déjà clôturée : inchangée). None si elle n'est pas à lui."""
+    spec = SHORTLISTS[kind]
+    if not _is_owner(db, spec, owner_user_id, item_id):
+        return None
+    _close_items(db, kind, [item_id])
+    return db.query(spec.item_model).filter(spec.item_model.id == item_id).first()
+
+def close_expired_items(db: Session, kind: str, limit: int = 500):
+    """
+    Un lot de la purge : clôture jusqu'à `limit` éléments dont expires_at est passé, les plus
+    anciens d'abord, et renvoie leurs ids. SKIP LOCKED : les workers qui purgent en même temps
+    se partagent les lignes au lieu de s'attendre.
+    """
+    item_model = SHORTLISTS[kind].item_model
+    expired = db.query(item_model.id).filter(
+        item_model.closed_at.is_(None), item_model.expires_at <= func.now()
+    ).order_by(item_model.expires_at).limit(limit).with_for_update(skip_locked=True)
+    item_ids = [item_id for (item_id,) in expired]
+    return _close_items(db, kind, item_ids) if item_ids else []
+
+# Decks classés filtrés : fenêtre de candidats par élément demandé, et taille maximale d'une
+# fenêtre (donc de la liste IN de la requête de filtrage)
+DECK_RANK_WINDOW = 4
+DECK_RANK_MAX_WINDOW = 2000
+
+def _ranked_deck(index, profile_text: Optional[str], exclude: list[int], cursor: Optional[int], limit: int, rows_in, filtered: bool):
+    """
+    Page d'un deck classé : l'index classe les candidats une fois (ranking.RelevanceIndex.ranked),
+    puis `rows_in(ids)` (requête des filtres et des éléments en ligne, bornée à ces ids) ne garde
+    que ceux qui passent, remis dans l'ordre du classement. Tant que la page n'est pas pleine, on
+    passe à la tranche suivante du même classement, deux fois plus large : pas de nouveau calcul
+    des scores, et les requêtes suivent la sélectivité des filtres.
+    """
+    page = []
+    first = limit * DECK_RANK_WINDOW if filtered else limit
+    for ids in index.ranked(profile_text, exclude=exclude, cursor=cursor, first=first, largest=DECK_RANK_MAX_WINDOW):
+        rows = {row.id: row for row in rows_in(ids)} if ids else {}
+        page += [rows[item_id] for item_id in ids if item_id in rows]
+        if len(page) >= limit:
+            break
+    return page[:limit]
+
+def normalized_pair(user1_id: int, user2_id: int):
+    # Conversation.participant1_id est toujours le plus petit id (contrainte ck_conversations_participants_ordered)
+    return min(user1_id, user2_id), max(user1_id, user2_id)
+
+def _insert(db: Session, model):
+    """INSERT du dialecte de la session, pour on_conflict_do_nothing / on_conflict_do_update."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert # type: ignore
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert # type: ignore
+    return dialect_insert(model)
+
+def _get_or_create_conversation_id(db: Session, user1_id: int, user2_id: int):
+    """(id, créée ?) de la conversation entre deux utilisateurs ; sans commit. Sûr en concurrence."""
+    participant1_id, participant2_id = normalized_pair(user1_id, user2_id)
+    conversation_id = db.scalar(
+        _insert(db, models.Conversation)
+        .values(participant1_id=participant1_id, participant2_id=participant2_id)
+        .on_conflict_do_nothing(index_elements=["participant1_id", "participant2_id"])
+        .returning(models.Conversation.id)
+    )
+    if conversation_id is not None:
+        return conversation_id, True
+    return get_conversation_between_users(db, participant1_id, participant2_id).id, False
 
 def create_conversation(db: Session, conversation: schemas.ConversationCreate):
-    db_conversation = models.Conversation(**conversation.dict())
-    db.add(db_conversation)
+    # Une conversation existe au plus une fois par paire : on renvoie l'existante le cas échéant
+    conversation_id, _ = _get_or_create_conversation_id(db, conversation.participant1_id, conversation.participant2_id)
     db.commit()
-    db.refresh(db_conversation)
-    return db_conversation
+    return get_conversation(db, conversation_id)
 
 def get_conversation(db: Session, conversation_id: int):
-    return db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
+    return db.query(models.Conversation).options(selectinload(models.Conversation.messages)).filter(models.Conversation.id == conversation_id).first()
 
-def get_conversations_for_user(db: Session, user_id: int):
-    # Récupère toutes les conversations de l'utilisateur
-    conversations = db.query(models.Conversation).filter(
-        (models.Conversation.participant1_id == user_id) | (models.Conversation.participant2_id == user_id)
-    ).all()
+def get_conversations_for_user(db: Session, user_id: int, before: Optional[int] = None, limit: int = 20):
+    """
+    Boîte de réception en une seule requête : conversations triées par dernière activité,
+    jointes à l'autre participant et au dernier message (Conversation.last_message_id).
+    `before` est l'id de la dernière conversation reçue (pagination par curseur).
+    """
+    conversation = models.Conversation
+    other_participant = aliased(models.User)
+    last_message = aliased(models.Message)
+    other_participant_id = case(
+        (conversation.participant1_id == user_id, conversation.participant2_id),
+        else_=conversation.participant1_id,
+    )
 
-    detailed_conversations = []
-    for conv in conversations:
-        # Détermine qui est l'autre participant
-        other_participant_user = conv.participant2 if conv.participant1_id == user_id else conv.participant1
-        
-        # Récupère le dernier message de la conversation
-        last_message = db.query(models.Message).filter(models.Message.conversation_id == conv.id).order_by(models.Message.timestamp.desc()).first()
+    last_read, unread_count = _read_state_columns(user_id)
+    query = (
+        db.query(conversation.id, conversation.last_activity_at, last_read, unread_count, other_participant, last_message)
+        .join(other_participant, other_participant.id == other_participant_id)
+        .outerjoin(last_message, last_message.id == conversation.last_message_id)
+        .filter((conversation.participant1_id == user_id) | (conversation.participant2_id == user_id))
+    )
+    if before is not None:
+        anchor = db.query(conversation.last_activity_at).filter(conversation.id == before).scalar_subquery()
+        query = query.filter(tuple_(conversation.last_activity_at, conversation.id) < tuple_(anchor, before))
+    rows = query.order_by(conversation.last_activity_at.desc(), conversation.id.desc()).limit(limit).all()
 
-        detailed_conversations.append(schemas.ConversationDetail(
-            id=conv.id,
+    return [
+        schemas.ConversationDetail(
+            id=conversation_id,
             other_participant=other_participant_user,
-            last_message=last_message
-        ))
-    return detailed_conversations
+            last_message=last_message_row,
+            last_activity_at=last_activity_at,
+            last_read_message_id=last_read_message_id,
+            unread_count=unread,
+        )
+        for conversation_id, last_activity_at, last_read_message_id, unread, other_participant_user, last_message_row in rows
+    ]
 
 def get_conversation_between_users(db: Session, user1_id: int, user2_id: int):
+    participant1_id, participant2_id = normalized_pair(user1_id, user2_id)
     return db.query(models.Conversation).filter(
-        ((models.Conversation.participant1_id == user1_id) & (models.Conversation.participant2_id == user2_id)) |
-        ((models.Conversation.participant1_id == user2_id) & (models.Conversation.participant2_id == user1_id))
+        models.Conversation.participant1_id == participant1_id,
+        models.Conversation.participant2_id == participant2_id,
     ).first()
 
 
 def create_message(db: Session, message: schemas.MessageCreate):
     db_message = models.Message(**message.dict())
     db.add(db_message)
+    db.flush()
+    # Résumé et état de lecture de la conversation dans la même transaction que le message.
+    # La condition sur l'id évite qu'un message plus ancien, commité en retard, écrase le plus récent.
+    conversation = models.Conversation
+    newer = conversation.last_message_id.is_(None) | (conversation.last_message_id < db_message.id)
+    values = {
+        "last_message_id": case((newer, db_message.id), else_=conversation.last_message_id),
+        "last_activity_at": case((newer, func.now()), else_=conversation.last_activity_at),
+    }
+    for side in (1, 2):
+        # Répondre vaut lecture pour l'expéditeur ; le destinataire a un non-lu de plus,
+        # sauf s'il a déjà marqué lu au-delà de ce message
+        is_sender = getattr(conversation, f"participant{side}_id") == db_message.sender_id
+        last_read = getattr(conversation, f"participant{side}_last_read_message_id")
+        unread_count = getattr(conversation, f"participant{side}_unread_count")
+        after_last_read = last_read.is_(None) | (last_read < db_message.id)
+        values[f"participant{side}_last_read_message_id"] = case((is_sender & after_last_read, db_message.id), else_=last_read)
+        values[f"participant{side}_unread_count"] = case((is_sender, 0), (after_last_read, unread_count + 1), else_=unread_count)
+    participants = db.execute(
+        update(conversation)
+        .where(conversation.id == db_message.conversation_id)
+        .values(values)
+        .returning(conversation.participant1_id, conversation.participant2_id)
+    ).first()
     db.commit()
     db.refresh(db_message)
+
+    # Poussé aux WebSockets des deux participants (voir broker.py), après le commit
+    if participants is not None:
+        event = {"type": "message", "message": schemas.Message.model_validate(db_message).model_dump(mode="json")}
+        broker.publish_to_users(set(participants), event)
+        for user_id in set(participants) - {db_message.sender_id}:
+            notifications.notify(user_id, "Nouveau message", db_message.content[:120], {
+                "type": "message", "conversation_id": db_message.conversation_id,
+            })
     return db_message
 
-def get_messages_for_conversation(db: Session, conversation_id: int):
-    return db.query(models.Message).filter(models.Message.conversation_id == conversation_id).order_by(models.Message.timestamp).all()
+def _read_state_columns(user_id: int):
+    """Repère de lecture et non-lus de `user_id`, quel que soit son côté de la paire."""
+    conversation = models.Conversation
+    is_participant1 = conversation.participant1_id == user_id
+    return (
+        case((is_participant1, conversation.participant1_last_read_message_id), else_=conversation.participant2_last_read_message_id),
+        case((is_participant1, conversation.participant1_unread_count), else_=conversation.participant2_unread_count),
+    )
+
+def mark_conversation_read(db: Session, conversation_id: int, user_id: int, message_id: Optional[int] = None):
+    """
+    Marque la conversation lue par `user_id` jusqu'au message `message_id` (par défaut, et au
+    plus, le dernier message). Le repère ne recule jamais. Lu jusqu'au dernier message, le
+    compteur passe à 0 sans rien compter ; sinon il devient le nombre de messages de l'autre
+    participant après le repère (les non-lus restants, pas tout l'historique).
+    Renvoie {"last_read_message_id", "unread_count"}, ou None si l'utilisateur n'en est pas participant.
+    """
+    conversation = models.Conversation
+    row = db.query(conversation.participant1_id, conversation.participant2_id, conversation.last_message_id).filter(
+        conversation.id == conversation_id
+    ).first()
+    if row is None or user_id not in (row.participant1_id, row.participant2_id):
+        return None
+    side = 1 if row.participant1_id == user_id else 2
+    last_read = getattr(conversation, f"participant{side}_last_read_message_id")
+    unread_count = getattr(conversation, f"participant{side}_unread_count")
+    up_to = row.last_message_id if message_id is None or row.last_message_id is None else min(message_id, row.last_message_id)
+    state = None
+    if up_to is not None:
+        remaining = db.query(func.count(models.Message.id)).filter(
+            models.Message.conversation_id == conversation_id,
+            models.Message.id > up_to,
+            models.Message.sender_id != user_id,
+        ).scalar_subquery()
+        state = db.execute(
+            update(conversation)
+            .where(conversation.id == conversation_id, last_read.is_(None) | (last_read < up_to))
+            .values({last_read: up_to, unread_count: case((conversation.last_message_id <= up_to, 0), else_=remaining)})
+            .returning(last_read, unread_count)
+        ).first()
+    if state is None:  # conversation vide, ou déjà lue au-delà
+        state = db.query(last_read, unread_count).filter(conversation.id == conversation_id).first()
+    db.commit()
+    read_state = {"last_read_message_id": state[0], "unread_count": state[1]}
+    # Synchronise les badges des autres appareils de l'utilisateur (voir broker.py)
+    broker.publish_to_users({user_id}, {"type": "read", "conversation_id": conversation_id, **read_state})
+    return read_state
+
+def get_unread_summary(db: Session, user_id: int):
+    """Badge : non-lus par conversation (celles qui en ont), lus dans les compteurs, sans COUNT."""
+    conversation = models.Conversation
+    _, unread_count = _read_state_columns(user_id)
+    rows = db.query(conversation.id, unread_count).filter(
+        ((conversation.participant1_id == user_id) & (conversation.participant1_unread_count > 0))
+        | ((conversation.participant2_id == user_id) & (conversation.participant2_unread_count > 0))
+    ).all()
+    return {"total": sum(count for _, count in rows), "conversations": dict(rows)}
+
+def get_messages_for_conversation(
+    db: Session,
+    conversation_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = 30,
+    as_rows: bool = False,
+):
+    """
+    Une page de l'historique, toujours renvoyée dans l'ordre chronologique.
+    Sans curseur : les `limit` derniers messages. `before` / `after` sont des ids de message :
+    on renvoie les `limit` messages juste avant (pour remonter le fil) ou juste après.
+    Les curseurs comparent (timestamp, id), ce qui suit l'index (conversation_id, timestamp, id).
+    `as_rows` : dictionnaires des colonnes de schemas.Message au lieu d'objets ORM.
+    """
+    message = models.Message
+    entities = schema_columns(message, schemas.Message) if as_rows else [message]
+    query = db.query(*entities).filter(message.conversation_id == conversation_id)
+    position = tuple_(message.timestamp, message.id)
+
+    if after is not None:
+        anchor = db.query(message.timestamp).filter(
+            message.id == after, message.conversation_id == conversation_id
+        ).scalar_subquery()
+        page = query.filter(position > tuple_(anchor, after)).order_by(
+            message.timestamp, message.id
+        ).limit(limit).all()
+        return _row_dicts(page) if as_rows else page
+
+    if before is not None:
+        anchor = db.query(message.timestamp).filter(
+            message.id == before, message.conversation_id == conversation_id
+        ).scalar_subquery()
+        query = query.filter(position < tuple_(anchor, before))
+    page = query.order_by(message.timestamp.desc(), message.id.desc()).limit(limit).all()
+    page.reverse()
+    return _row_dicts(page) if as_rows else page
+
+def get_message_rows_after(db: Session, conversation_id: int, after: Optional[int] = None, limit: int = 1000):
+    """Exports / synchronisation : tout l'historique dans l'ordre chronologique, depuis le message `after` (exclu)."""
+    if after is not None:
+        return get_messages_for_conversation(db, conversation_id, after=after, limit=limit, as_rows=True)
+    message = models.Message
+    return _row_dicts(
+        db.query(*schema_columns(message, schemas.Message)).filter(message.conversation_id == conversation_id)
+        .order_by(message.timestamp, message.id).limit(limit)
+    )
+
+def _match_counterpart(db: Session, user_id: int, owner, item_id: int):
+    """
+    En une requête : user_id du propriétaire de l'offre/formation (`owner` : Offer.company ou
+    Formation.university), son titre, et l'id de la conversation déjà ouverte entre les deux
+    utilisateurs (None s'il n'y en a pas).
+    """
+    item_model, owner_model = owner.class_, owner.property.mapper.class_
+    conversation = models.Conversation
+    owner_user_id = owner_model.user_id
+    return db.query(owner_user_id, item_model.title, conversation.id).select_from(item_model).join(owner).outerjoin(
+        conversation,
+        ((conversation.participant1_id == user_id) & (conversation.participant2_id == owner_user_id)) |
+        ((conversation.participant1_id == owner_user_id) & (conversation.participant2_id == user_id)),
+    ).filter(item_model.id == item_id, _live(item_model)).order_by(conversation.id).first()
+
+def _record_swipe_stats(db: Session, swipes):
+    """
+    Incrémente les compteurs (models.OfferStats, FormationStats et leurs tables par jour) dans
+    la transaction du swipe. `swipes` : (offer_id, formation_id, nouveau swipe, like, conversation
+    ouverte) par swipe enregistré. Un upsert multi-lignes par table, lignes triées par élément
+    pour que des transactions concurrentes verrouillent les compteurs dans le même ordre.
+    """
+    deltas = {}
+    for offer_id, formation_id, is_new_swipe, is_like, opened_conversation in swipes:
+        delta = deltas.setdefault((offer_id, formation_id), Counter())
+        delta["swipes"] += is_new_swipe
+        delta["likes"] += is_new_swipe and is_like
+        delta["conversations_opened"] += opened_conversation
+    today = datetime.now(timezone.utc).date()
+    for item_column, totals_model, daily_model, position in (
+        ("offer_id", models.OfferStats, models.OfferDailyStats, 0),
+        ("formation_id", models.FormationStats, models.FormationDailyStats, 1),
+    ):
+        rows = [
+            {item_column: key[position], **{name: delta[name] for name in models.STAT_COUNTERS}}
+            for key, delta in sorted(deltas.items(), key=lambda item: item[0][position] or 0)
+            if key[position] is not None and any(delta.values())
+        ]
+        if not rows:
+            continue
+        for model, key_columns, values in (
+            (totals_model, [item_column], rows),
+            (daily_model, [item_column, "day"], [{**row, "day": today} for row in rows]),
+        ):
+            statement = _insert(db, model)
+            db.execute(statement.on_conflict_do_update(index_elements=key_columns, set_={
+                name: getattr(model, name) + getattr(statement.excluded, name) for name in models.STAT_COUNTERS
+            }), values)
+
+def _catalog_dashboard(db: Session, item_model, owner_column, owner_id: int, totals_model, daily_model, item_column: str, days: int):
+    """
+    Compteurs de chaque élément d'un propriétaire (offres d'une entreprise, formations d'une
+    université) et leur détail sur les `days` derniers jours : deux requêtes, en
+    O(éléments x jours) quel que soit le nombre de swipes.
+    """
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    counters = [func.coalesce(getattr(totals_model, name), 0).label(name) for name in models.STAT_COUNTERS]
+    rows = db.query(item_model.id, item_model.title, *counters).outerjoin(
+        totals_model, getattr(totals_model, item_column) == item_model.id
+    ).filter(owner_column == owner_id).order_by(item_model.id).all()
+    daily_item_id = getattr(daily_model, item_column)
+    daily = {}
+    for row in db.query(daily_item_id, daily_model.day, *(getattr(daily_model, name) for name in models.STAT_COUNTERS)).join(
+        item_model, daily_item_id == item_model.id
+    ).filter(owner_column == owner_id, daily_model.day >= since).order_by(daily_item_id, daily_model.day):
+        item_id, *values = row
+        daily.setdefault(item_id, []).append(dict(zip(("day", *models.STAT_COUNTERS), values)))
+    items = [{**row._asdict(), "daily": daily.get(row.id, [])} for row in rows]
+    totals = {name: sum(item[name] for item in items) for name in models.STAT_COUNTERS}
+    return {"owner_id": owner_id, "since": since, "totals": totals, "items": items}
+
+def get_company_dashboard(db: Session, user_id: int, days: int = 30):
+    company_id = db.query(models.Company.id).filter(models.Company.user_id == user_id).scalar()
+    if company_id is None:
+        return None
+    return _catalog_dashboard(
+        db, models.Offer, models.Offer.company_id, company_id,
+        models.OfferStats, models.OfferDailyStats, "offer_id", days,
+    )
+
+def get_university_dashboard(db: Session, user_id: int, days: int = 30):
+    university_id = db.query(models.University.id).filter(models.University.user_id == user_id).scalar()
+    if university_id is None:
+        return None
+    return _catalog_dashboard(
+        db, models.Formation, models.Formation.university_id, university_id,
+        models.FormationStats, models.FormationDailyStats, "formation_id", days,
+    )
 
 def create_match(db: Session, match_data: schemas.MatchCreate):
     """
     Enregistre un "like" d'un utilisateur sur une offre ou une formation.
     Si c'est une candidature (étudiant -> offre) ou un intérêt (lycéen -> formation),
     crée une conversation si elle n'existe pas déjà.
+    Une seule transaction : une lecture (propriétaire + conversation existante), puis les
+    INSERT ... ON CONFLICT DO NOTHING du match et, au besoin, de la conversation.
     """
-    db_match = models.Match(
-        user_id=match_data.user_id,
-        offer_id=match_data.offer_id,
-        formation_id=match_data.formation_id
-    )
-    db.add(db_match)
-    db.commit()
-    db.refresh(db_match)
-
     participant1_id = match_data.user_id
-    participant2_id = None
+    participant2_id = conversation_id = None
 
     # Cas d'une candidature à une offre
     if match_data.offer_id:
-        offer = db.query(models.Offer).filter(models.Offer.id == match_data.offer_id).first()
-        if offer and offer.company:
-            participant2_id = offer.company.user_id
-
+        counterpart = _match_counterpart(db, participant1_id, models.Offer.company, match_data.offer_id)
+        notification_title = "Nouvelle candidature"
     # Cas d'un intérêt pour une formation
     elif match_data.formation_id:
-        formation = db.query(models.Formation).filter(models.Formation.id == match_data.formation_id).first()
-        if formation and formation.university:
-            participant2_id = formation.university.user_id
-
-    if participant1_id and participant2_id:
-        # Vérifier si une conversation existe déjà
-        existing_conversation = get_conversation_between_users(db, participant1_id, participant2_id)
-        if existing_conversation:
-            return {"match": db_match, "is_new_conversation": False, "conversation_id": existing_conversation.id}
+        counterpart = _match_counterpart(db, participant1_id, models.Formation.university, match_data.formation_id)
+        notification_title = "Nouvel intérêt pour une formation"
+    else:
+        counterpart = None
+    if counterpart:
+        participant2_id, notification_body, conversation_id = counterpart
+    else:
+        item_model = models.Offer if match_data.offer_id else models.Formation
+        item_id = match_data.offer_id or match_data.formation_id
+        if db.query(item_model.id).filter(item_model.id == item_id, _live(item_model)).first() is None:
+            # Élément inconnu ou clôturé : rien à enregistrer
+            return None
+
+    # Un seul swipe par utilisateur et par élément : un swipe répété renvoie le match existant
+    match_key = [models.Match.user_id == match_data.user_id]
+    if match_data.offer_id:
+        conflict_columns = ["user_id", "offer_id"]
+        match_key.append(models.Match.offer_id == match_data.offer_id)
+    else:
+        conflict_columns = ["user_id", "formation_id"]
+        match_key.append(models.Match.formation_id == match_data.formation_id)
+    db_match = db.scalar(
+        _insert(db, models.Match)
+        .values(user_id=match_data.user_id, offer_id=match_data.offer_id, formation_id=match_data.formation_id)
+        .on_conflict_do_nothing(index_elements=conflict_columns)
+        .returning(models.Match)
+    )
+    is_new_match = db_match is not None
+    if db_match is None:
+        db_match = db.query(models.Match).filter(*match_key).one()
+
+    is_new_conversation = False
+    if participant1_id and participant2_id and conversation_id is None:
+        conversation_id, is_new_conversation = _get_or_create_conversation_id(db, participant1_id, participant2_id)
+    if is_new_match or is_new_conversation:
+        _record_swipe_stats(db, [(match_data.offer_id, match_data.formation_id, is_new_match, True, is_new_conversation)])
+    db.commit()
+
+    if not (participant1_id and participant2_id):
+        return {"match": db_match, "is_new_conversation": False, "conversation_id": None}
+
+    if is_new_match:
+        # Mis en file seulement : l'envoi se fait hors de la requête (voir notifications.py)
+        notifications.notify(participant2_id, notification_title, notification_body, {
+            "type": "match", "conversation_id": conversation_id,
+        })
+    return {"match": db_match, "is_new_conversation": is_new_conversation, "conversation_id": conversation_id}
+
+def _swipe_owners(db: Session, owner, item_ids: set[int]):
+    """{id de l'élément: (user_id du propriétaire ou None, titre)} pour les offres ou formations en ligne."""
+    if not item_ids:
+        return {}
+    item_model, owner_model = owner.class_, owner.property.mapper.class_
+    rows = db.query(item_model.id, owner_model.user_id, item_model.title).outerjoin(owner).filter(
+        item_model.id.in_(item_ids), _live(item_model)
+    )
+    return {item_id: (owner_user_id, title) for item_id, owner_user_id, title in rows}
+
+def create_match_batch(db: Session, user_id: int, items: list[schemas.SwipeItem]):
+    """
+    Swipes (likes et passes) d'un même utilisateur, envoyés en lot.
+    Même résultat que create_match élément par élément, mais en un nombre fixe de requêtes :
+    propriétaires des offres, des formations, swipes déjà enregistrés, conversations existantes,
+    puis un INSERT multi-lignes des conversations manquantes et un des matches, en une transaction.
+    Les doublons (dans le lot, déjà en base ou insérés en parallèle) ne sont pas réinsérés.
+    """
+    results: list[Optional[dict]] = [None] * len(items)
+    first_index = {}  # (offer_id, formation_id) -> premier élément du lot qui le swipe
+    for index, item in enumerate(items):
+        key = (item.offer_id, item.formation_id)
+        if (item.offer_id is None) == (item.formation_id is None):
+            results[index] = {"index": index, "status": "invalid"}
+        elif key in first_index:
+            results[index] = {"index": index, "status": "duplicate"}
+        else:
+            first_index[key] = index
+
+    offer_ids = {offer_id for offer_id, _ in first_index if offer_id is not None}
+    formation_ids = {formation_id for _, formation_id in first_index if formation_id is not None}
+    owners = {(item_id, None): owner for item_id, owner in _swipe_owners(db, models.Offer.company, offer_ids).items()}
+    owners.update({(None, item_id): owner for item_id, owner in _swipe_owners(db, models.Formation.university, formation_ids).items()})
+    already_swiped = {
+        (offer_id, formation_id) for offer_id, formation_id in db.query(models.Match.offer_id, models.Match.formation_id).filter(
+            models.Match.user_id == user_id,
+            or_(models.Match.offer_id.in_(offer_ids), models.Match.formation_id.in_(formation_ids)),
+        )
+    } if first_index else set()
+
+    to_insert = []
+    for key, index in first_index.items():
+        if key not in owners:
+            results[index] = {"index": index, "status": "not_found"}
+        elif key in already_swiped:
+            results[index] = {"index": index, "status": "duplicate"}
         else:
-            # Créer une nouvelle conversation
-            new_conversation_data = schemas.ConversationCreate(participant1_id=participant1_id, participant2_id=participant2_id)
-            new_conversation = create_conversation(db, new_conversation_data)
-            # TODO: Envoyer une notification push ici
-            return {"match": db_match, "is_new_conversation": True, "conversation_id": new_conversation.id}
+            to_insert.append((key, index))
+
+    # Conversations : une seule par propriétaire, existante ou créée pour le premier like
+    counterparts = {owners[key][0] for key, index in to_insert if items[index].is_like and owners[key][0] is not None}
+    conversations = {}
+    if counterparts:
+        conversation = models.Conversation
+        rows = db.query(conversation.id, conversation.participant1_id, conversation.participant2_id).filter(
+            ((conversation.participant1_id == user_id) & conversation.participant2_id.in_(counterparts)) |
+            ((conversation.participant2_id == user_id) & conversation.participant1_id.in_(counterparts))
+        ).order_by(conversation.id.desc())
+        for conversation_id, participant1_id, participant2_id in rows:
+            conversations[participant2_id if participant1_id == user_id else participant1_id] = conversation_id
+    new_counterparts = counterparts - conversations.keys()
+    opened_counterparts = set()
+    if new_counterparts:
+        created = db.execute(
+            _insert(db, models.Conversation)
+            .on_conflict_do_nothing(index_elements=["participant1_id", "participant2_id"])
+            .returning(models.Conversation.id, models.Conversation.participant1_id, models.Conversation.participant2_id),
+            [dict(zip(("participant1_id", "participant2_id"), normalized_pair(user_id, counterpart))) for counterpart in sorted(new_counterparts)],
+        )
+        for conversation_id, participant1_id, participant2_id in created:
+            counterpart = participant2_id if participant1_id == user_id else participant1_id
+            conversations[counterpart] = conversation_id
+            opened_counterparts.add(counterpart)
+        # Créées entre-temps par une autre requête : on les relit
+        for counterpart in new_counterparts - conversations.keys():
+            conversations[counterpart] = get_conversation_between_users(db, user_id, counterpart).id
+
+    match_ids = {}
+    if to_insert:
+        # Sans cible de conflit : ignore aussi bien (user_id, offer_id) que (user_id, formation_id) déjà pris
+        inserted = db.execute(
+            _insert(db, models.Match).on_conflict_do_nothing().returning(
+                models.Match.id, models.Match.offer_id, models.Match.formation_id
+            ),
+            [
+                {"user_id": user_id, "offer_id": key[0], "formation_id": key[1], "is_like": items[index].is_like}
+                for key, index in to_insert
+            ],
+        )
+        match_ids = {(offer_id, formation_id): match_id for match_id, offer_id, formation_id in inserted}
+        # Conversation ouverte : attribuée au premier like enregistré vers ce propriétaire (comme is_new_conversation)
+        opening = set(opened_counterparts)
+        swipes = []
+        for key, index in to_insert:
+            if key in match_ids:
+                owner_user_id = owners[key][0]
+                opened = items[index].is_like and owner_user_id in opening
+                if opened:
+                    opening.discard(owner_user_id)
+                swipes.append((*key, True, items[index].is_like, opened))
+        _record_swipe_stats(db, swipes)
+    db.commit()
 
-    return {"match": db_match, "is_new_conversation": False, "conversation_id": None}
+    for key, index in to_insert:
+        match_id = match_ids.get(key)
+        if match_id is None:
+            # Enregistré par une requête concurrente depuis la lecture de already_swiped
+            results[index] = {"index": index, "status": "duplicate"}
+            continue
+        result = {"index": index, "status": "created", "match_id": match_id}
+        owner_user_id, title = owners[key]
+        if items[index].is_like and owner_user_id is not None:
+            conversation_id = conversations[owner_user_id]
+            result["conversation_id"] = conversation_id
+            if owner_user_id in opened_counterparts:
+                # Signalée nouvelle sur le premier like seulement
+                opened_counterparts.discard(owner_user_id)
+                result["is_new_conversation"] = True
+            notification_title = "Nouvelle candidature" if key[0] is not None else "Nouvel intérêt pour une formation"
+            notifications.notify(owner_user_id, notification_title, title, {
+                "type": "match", "conversation_id": conversation_id,
+            })
+        results[index] = result
+    return {"created": len(match_ids), "results": results}
@@ -1,18 +1,65 @@
 import os
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine # type: ignore
+from sqlalchemy.engine import make_url # type: ignore
 from sqlalchemy.ext.declarative import declarative_base # type: ignore
-from sqlalchemy.orm import sessionmaker # type: ignore
+from sqlalchemy.orm import Session, sessionmaker # type: ignore
 
 POSTGRES_USER = os.getenv("POSTGRES_USER", "rezobd_user")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "rezobd_password")
 POSTGRES_SERVER = os.getenv("POSTGRES_SERVER", "localhost")
 POSTGRES_DB = os.getenv("POSTGRES_DB", "rezo")
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:5432/{POSTGRES_DB}"
+# Pool de connexions (par processus)
+POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
+POSTGRES_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", "20"))
+POSTGRES_POOL_PRE_PING = os.getenv("POSTGRES_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+POSTGRES_STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "0"))  # 0 : pas de limite
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# "sync" : Session classique, crud exécuté dans le threadpool de FastAPI.
+# "async" : AsyncSession sur asyncpg, crud exécuté sans thread (voir run_db).
+DATABASE_MODE = os.getenv("DATABASE_MODE", "sync")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# DATABASE_URL (URL SQLAlchemy complète) prend le pas sur les variables POSTGRES_*
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:5432/{POSTGRES_DB}"
+SQLALCHEMY_ASYNC_DATABASE_URL = make_url(SQLALCHEMY_DATABASE_URL).set(drivername="postgresql+asyncpg")
+
+pool_options = {
+    "pool_size": POSTGRES_POOL_SIZE,
+    "max_overflow": POSTGRES_MAX_OVERFLOW,
+    "pool_pre_ping": POSTGRES_POOL_PRE_PING,
+}
+
+def sync_connect_args(url) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        # SQLite (bancs d'essai, scripts/bench.py --sqlite) : connexions partagées entre les threads du pool
+        return {"check_same_thread": False}
+    if POSTGRES_STATEMENT_TIMEOUT_MS:
+        return {"options": f"-c statement_timeout={POSTGRES_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
+def async_connect_args() -> dict:
+    if POSTGRES_STATEMENT_TIMEOUT_MS:
+        return {"server_settings": {"statement_timeout": str(POSTGRES_STATEMENT_TIMEOUT_MS)}}
+    return {}
+
+# Le moteur synchrone sert toujours : create_all, threads de fond (notifications), scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=sync_connect_args(SQLALCHEMY_DATABASE_URL), **pool_options)
+
+# expire_on_commit=False dans les deux modes : ce que crud a écrit (et reçu par RETURNING)
+# reste lisible après le commit sans SELECT de rechargement
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_MODE == "async":
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine # type: ignore
+
+    async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, connect_args=async_connect_args(), **pool_options)
+    # Ici en plus, un rechargement implicite serait impossible hors de run_db
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
 
 Base = declarative_base()
 
@@ -23,3 +70,36 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dépendance des endpoints : la session du mode choisi par DATABASE_MODE
+get_session = get_async_db if DATABASE_MODE == "async" else get_db
+
+async def run_db(db, function, *args, **kwargs):
+    """
+    Exécute une fonction de crud (synchrone, `db` en premier argument) sans bloquer la boucle.
+    - mode async : AsyncSession.run_sync, les requêtes passent par asyncpg sur la boucle ;
+    - mode sync : threadpool de FastAPI, comme un endpoint `def`.
+    Les relations lues par les schémas de réponse doivent être chargées dans la fonction
+    (selectinload) : en mode async, aucun chargement paresseux n'est possible après coup.
+    """
+    if isinstance(db, Session):
+        from fastapi.concurrency import run_in_threadpool # type: ignore
+        return await run_in_threadpool(function, db, *args, **kwargs)
+    return await db.run_sync(function, *args, **kwargs)
+
+@asynccontextmanager
+async def session_scope():
+    """Session hors injection de dépendances (WebSocket, tâches de fond)."""
+    if DATABASE_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
@@ -0,0 +1,45 @@
+"""
+Sérialisation rapide des grandes listes (catalogue, historique des messages).
+
+Les endpoints concernés lisent des lignes projetées (crud.schema_columns : les colonnes du
+schéma de réponse, pas d'objets ORM) et les encodent directement avec orjson, sans passer
+par la validation du response_model. Les schémas restent le contrat : mêmes champs, même
+ordre, horodatages UTC en "...Z" comme pydantic. Sans orjson, repli sur le module json.
+
+ndjson() encode une ligne JSON par élément, pour les exports en flux (StreamingResponse).
+"""
+import json
+from datetime import datetime
+from typing import Any, Iterable
+
+from fastapi import Response # type: ignore
+
+try:
+    import orjson # type: ignore
+except ImportError:  # orjson est dans requirements.txt ; repli pour les environnements réduits
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat().replace("+00:00", "Z")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def ndjson(items: Iterable[Any]) -> bytes:
+    return b"".join(dumps(item) + b"\n" for item in items)
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
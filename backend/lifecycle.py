@@ -0,0 +1,106 @@
+"""
+Tâches de fond du catalogue : purge des offres et formations expirées, shortlists des decks inverses.
+
+Un thread dédié se réveille toutes les PURGE_INTERVAL_SECONDS et clôture, par lots de
+BATCH_SIZE (un commit par lot), les éléments dont expires_at est passé : crud.close_expired_items
+décompte leurs facettes, supprime leurs shortlists et archive leurs swipes (matches ->
+matches_archive). Les lectures excluent déjà les éléments expirés (crud._live) : la purge ne
+change pas ce que voient les clients, elle garde matches et les index partiels à la taille du
+catalogue en ligne.
+
+Une seconde tâche, toutes les SHORTLIST_INTERVAL_SECONDS, calcule les shortlists des éléments
+en attente (shortlisted_at vide : créés, importés, ou quittés par un profil modifié) par lots
+de BATCH_SIZE, un produit de matrices creuses par lot (crud.refresh_pending_shortlists). Les
+écritures n'attendent pas ce calcul ; en contrepartie, le deck inverse d'une offre toute neuve
+peut rester incomplet quelques secondes.
+
+Chaque worker lance ses tâches ; les lots verrouillent leurs lignes avec SKIP LOCKED, les
+workers se partagent donc le travail sans s'attendre ni traiter deux fois un élément.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import crud
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL_SECONDS = float(os.getenv("LIFECYCLE_PURGE_INTERVAL_SECONDS", "300"))
+SHORTLIST_INTERVAL_SECONDS = float(os.getenv("LIFECYCLE_SHORTLIST_INTERVAL_SECONDS", "2"))
+BATCH_SIZE = 500
+KINDS = ("offers", "formations")
+
+
+class CatalogJob:
+    """
+    Applique `step(db, kind, batch_size)` (qui renvoie les ids traités) lot par lot à chaque
+    type d'élément, toutes les `interval` secondes. stats[counter] compte les éléments traités.
+    """
+    def __init__(self, name: str, step, counter: str, interval: float, session_factory=SessionLocal, batch_size: int = BATCH_SIZE):
+        self.name = name
+        self._step = step
+        self._counter = counter
+        self._session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.stats = {"runs": 0, "batches": 0, counter: 0, "failed": 0}
+
+    # --- Cycle de vie -------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Arrête le thread après le lot en cours."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        self._stopping.set()
+        thread.join(timeout)
+
+    # --- Lots ---------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("%s failed", self.name)
+            if self._stopping.wait(self.interval):
+                return
+
+    def run_once(self) -> int:
+        """Traite tout ce qui est en attente, lot par lot. Renvoie le nombre d'éléments traités."""
+        started = time.monotonic()
+        total = 0
+        for kind in KINDS:
+            while not self._stopping.is_set():
+                db = self._session_factory()
+                try:
+                    done = self._step(db, kind, self.batch_size)
+                finally:
+                    db.close()
+                self.stats["batches"] += 1
+                total += len(done)
+                if len(done) < self.batch_size:
+                    break
+        self.stats["runs"] += 1
+        self.stats[self._counter] += total
+        if total:
+            logger.info("%s: %d items %s in %.1fs", self.name, total, self._counter, time.monotonic() - started)
+        return total
+
+
+purger = CatalogJob("expiry-purger", crud.close_expired_items, "closed", PURGE_INTERVAL_SECONDS)
+shortlister = CatalogJob("shortlist-refresher", crud.refresh_pending_shortlists, "refreshed", SHORTLIST_INTERVAL_SECONDS)
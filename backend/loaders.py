@@ -0,0 +1,66 @@
+"""
+Chargement groupé le temps d'une requête HTTP, à la manière de DataLoader.
+
+Les load() émis pendant un même tour de boucle (load_many, ou plusieurs coroutines d'un
+asyncio.gather) partent en un seul appel de la fonction de crud `batch(db, clés)`, qui renvoie
+{clé: valeur}. Chaque clé n'est chargée qu'une fois par loader : les doublons et les appels
+répétés reçoivent le même résultat. Un loader vit le temps d'une requête (dépendance FastAPI),
+son cache ne sert donc jamais de données d'une requête précédente.
+"""
+import asyncio
+from typing import Callable, Hashable, Iterable
+
+from database import run_db
+
+MAX_BATCH_SIZE = 500
+
+
+class Loader:
+    def __init__(self, db, batch: Callable, max_batch_size: int = MAX_BATCH_SIZE):
+        self.db = db
+        self.batch = batch
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self._futures: dict[Hashable, asyncio.Future] = {}
+        self._queue: list = []
+        self._tasks: set = set()
+        self._lock = asyncio.Lock()  # une seule session : un lot à la fois
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._queue:
+                # Le lot part deux tours de boucle plus tard : il inclut aussi les clés des
+                # coroutines lancées dans le même tour (asyncio.gather de coroutines)
+                loop.call_soon(loop.call_soon, self._dispatch)
+            self._queue.append(key)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        task = asyncio.ensure_future(self._run(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, keys: list):
+        async with self._lock:
+            for start in range(0, len(keys), self.max_batch_size):
+                chunk = keys[start:start + self.max_batch_size]
+                try:
+                    self.batches += 1
+                    values = await run_db(self.db, self.batch, chunk)
+                except Exception as exc:
+                    # Les clés en échec sont oubliées : un nouvel appel les rechargera
+                    for key in keys[start:]:
+                        future = self._futures.pop(key)
+                        if not future.done():
+                            future.set_exception(exc)
+                    return
+                for key in chunk:
+                    if not self._futures[key].done():  # annulé si la requête a été abandonnée
+                        self._futures[key].set_result(values.get(key))
@@ -1,29 +1,83 @@
-from fastapi import FastAPI, Depends, HTTPException, status # type: ignore
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status # type: ignore
+from fastapi.responses import StreamingResponse # type: ignore
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm # type: ignore
 from sqlalchemy.orm import Session # type: ignore
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt # type: ignore
+import asyncio
+import os
 
+import catalog_import
 import crud
+import fastjson
+import lifecycle
+import loaders
+import metrics
+import replicas
 import models
+import notifications
 import schemas
-from database import SessionLocal, engine, get_db
+from broker import broker, user_channel
+from cache import etag_matches, response_cache, user_cache
+import database
+from database import get_session, run_db, session_scope
+from replicas import get_read_session
+from passwords import HasherOverloaded, password_hasher
 
 # Security
-SECRET_KEY = "your-secret-key"  # Change in production
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")  # Change in production
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = 15
+REFRESH_TOKEN_EXPIRE_DAYS = 30
+
+# Deck
+DECK_PAGE_SIZE = 20
+DECK_MAX_PAGE_SIZE = 100
+DECK_PREFETCH = 5
+
+# Messages
+MESSAGES_PAGE_SIZE = 30
+MESSAGES_MAX_PAGE_SIZE = 100
+INBOX_PAGE_SIZE = 20
+INBOX_MAX_PAGE_SIZE = 100
+
+# Matches
+MATCH_BATCH_MAX_SIZE = 500
+
+# Tableaux de bord
+DASHBOARD_DAYS = 30
+DASHBOARD_MAX_DAYS = 365
+
+# Exports NDJSON : lignes lues par lots, une session par lot
+EXPORT_CHUNK_SIZE = 1000
+
+# Profils
+MAX_USER_IDS = 100
+PROFILE_ITEMS_PAGE_SIZE = 20
+PROFILE_ITEMS_MAX_PAGE_SIZE = 100
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-pwd_context = crud.pwd_context
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = crud.get_user_by_email(db, email=email)
+busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Server busy, retry shortly",
+    headers={"Retry-After": "1"},
+)
+
+async def authenticate_user(db: Session, email: str, password: str):
+    user = await run_db(db, crud.get_user_by_email, email)
     if not user:
         return False
-    if not pwd_context.verify(password, user.hashed_password):
+    try:
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    except HasherOverloaded:
+        raise busy_exception
+    if not verified:
         return False
+    if new_hash is not None:
+        # Coût bcrypt modifié depuis le dernier hachage : on en profite pour le mettre à jour
+        await run_db(db, crud.update_user_password_hash, user.id, new_hash)
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -36,194 +90,668 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def create_tokens(user) -> dict:
+    # Le jeton d'accès porte l'id et le type : la plupart des requêtes authentifiées n'ont pas
+    # besoin de relire l'utilisateur. Il est court ; le jeton de rafraîchissement, lui, est
+    # toujours revérifié en base (compte désactivé, etc.).
+    access_token = create_access_token(
+        data={"sub": str(user.id), "user_type": user.user_type.value, "type": "access"},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    refresh_token = create_access_token(
+        data={"sub": str(user.id), "type": "refresh"},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+def decode_token(token: str, token_type: str) -> Optional[int]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") != token_type:
+        return None
+    try:
+        return int(payload.get("sub"))
+    except (TypeError, ValueError):
+        return None
+
+async def get_user_from_token(db: Session, token: str) -> Optional[schemas.User]:
+    """
+    Utilisateur d'un jeton d'accès. L'instantané vient de user_cache (TTL court, invalidé par
+    crud.update_user / crud.deactivate_user) ; la base n'est lue qu'en cas d'absence.
+    """
+    user_id = decode_token(token, "access")
+    if user_id is None:
+        return None
+    user = user_cache.get(user_id)
+    if user is None:
+        db_user = await run_db(db, crud.get_user, user_id=user_id)
+        if db_user is None:
+            return None
+        user = schemas.User.model_validate(db_user)
+        user_cache.set(user_id, user)
+    if not user.is_active:
+        return None
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_email(db, email=email)
+    user = await get_user_from_token(db, token)
     if user is None:
         raise credentials_exception
     return user
 
-models.Base.metadata.create_all(bind=engine)
+# Le schéma est géré par les migrations alembic (`alembic upgrade head`, voir migrations/)
 
 app = FastAPI()
-
-@app.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Métriques (GET /metrics) : requêtes HTTP et SQL (voir metrics.py), plus l'état des
+# composants en mémoire lu à chaque collecte
+db_engines = [database.engine, database.async_engine and database.async_engine.sync_engine]
+for replica in replicas.router.replicas:
+    db_engines += [replica.engine, replica.async_engine and replica.async_engine.sync_engine]
+for db_engine in filter(None, db_engines):
+    metrics.instrument_engine(db_engine)
+metrics.gauge("rezo_db_pool_checked_out", "Connexions du pool en cours d'utilisation",
+              lambda: (database.async_engine or database.engine).pool.checkedout())
+metrics.gauge("rezo_db_reads_total", "Sessions de lecture par destination (replicas.py)", lambda: replicas.router.stats, label="target", kind="counter")
+metrics.gauge("rezo_db_replica_lag_seconds", "Retard mesuré de chaque réplica", lambda: {
+    replica.name: replica.lag_seconds for replica in replicas.router.replicas
+}, label="replica")
+metrics.gauge("rezo_db_replica_usable", "Réplica utilisable (1) ou écarté (0)", lambda: {
+    replica.name: int(replica.usable) for replica in replicas.router.replicas
+}, label="replica")
+metrics.gauge("rezo_websocket_connections", "WebSockets abonnés dans ce processus", lambda: broker.connection_count)
+metrics.gauge("rezo_password_hash_pending", "Hachages bcrypt en attente ou en cours", lambda: password_hasher.pending)
+metrics.gauge("rezo_password_hash_stats", "Compteurs du pool de hachage", lambda: password_hasher.stats, label="stat")
+metrics.gauge("rezo_push_total", "Compteurs de l'envoi des notifications push", lambda: notifications.dispatcher.stats, label="stat", kind="counter")
+metrics.gauge("rezo_lifecycle_purge_total", "Compteurs de la purge des éléments expirés", lambda: lifecycle.purger.stats, label="stat", kind="counter")
+metrics.gauge("rezo_shortlist_refresh_total", "Compteurs du calcul des shortlists en attente", lambda: lifecycle.shortlister.stats, label="stat", kind="counter")
+metrics.gauge("rezo_cache_hits_total", "Lectures servies par un cache", lambda: {
+    "user": user_cache.hits, "response": response_cache.hits,
+}, label="cache", kind="counter")
+metrics.gauge("rezo_cache_misses_total", "Lectures absentes d'un cache", lambda: {
+    "user": user_cache.misses, "response": response_cache.misses,
+}, label="cache", kind="counter")
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.on_event("startup")
+async def start_background_services():
+    await broker.start()
+    notifications.dispatcher.start()
+    lifecycle.purger.start()
+    lifecycle.shortlister.start()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    lifecycle.purger.stop()
+    lifecycle.shortlister.stop()
+    notifications.dispatcher.stop()
+    await broker.stop()
+
+@app.post("/token", response_model=schemas.Token)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_session)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer", "user": user}
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    user_cache.set(user.id, schemas.User.model_validate(user))
+    return {**create_tokens(user), "user": user}
+
+@app.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(token_data: schemas.TokenRefresh, db: Session = Depends(get_session)):
+    user_id = decode_token(token_data.refresh_token, "refresh")
+    user = await run_db(db, crud.get_user, user_id=user_id) if user_id is not None else None
+    if user is None or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user_cache.set(user.id, schemas.User.model_validate(user))
+    return {**create_tokens(user), "user": user}
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_session)):
+    db_user = await run_db(db, crud.get_user_by_email, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     if user.password != user.password_confirm:
         raise HTTPException(status_code=400, detail="Passwords do not match")
-    return crud.create_user(db=db, user=user)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HasherOverloaded:
+        raise busy_exception
+    return await run_db(db, crud.create_user, user, hashed_password)
 
 @app.post("/users/me/device-token")
-def update_device_token(token_data: schemas.DeviceTokenUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    crud.update_user_device_token(db, user_id=current_user.id, token=token_data.device_token)
+async def update_device_token(token_data: schemas.DeviceTokenUpdate, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    await run_db(db, crud.update_user_device_token, user_id=current_user.id, token=token_data.device_token)
     return {"message": "Device token updated successfully"}
 
+@app.delete("/users/me", response_model=schemas.User)
+async def deactivate_current_user(current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    return await run_db(db, crud.deactivate_user, user_id=current_user.id)
+
 @app.patch("/users/me", response_model=schemas.User)
-def update_current_user(user_update: schemas.UserUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    updated_user = crud.update_user(db, user_id=current_user.id, user_update=user_update)
+async def update_current_user(user_update: schemas.UserUpdate, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    updated_user = await run_db(db, crud.update_user, user_id=current_user.id, user_update=user_update)
     return updated_user
 
 @app.patch("/students/me", response_model=schemas.Student)
-def update_current_student_profile(profile_data: schemas.StudentUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_current_student_profile(profile_data: schemas.StudentUpdate, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
     if current_user.user_type != models.UserType.STUDENT:
         raise HTTPException(status_code=403, detail="User is not a student")
-    updated_profile = crud.update_student_profile(db, user_id=current_user.id, profile_data=profile_data)
+    updated_profile = await run_db(db, crud.update_student_profile, user_id=current_user.id, profile_data=profile_data)
     if not updated_profile:
         raise HTTPException(status_code=404, detail="Student profile not found")
     return updated_profile
 
 @app.patch("/high-schoolers/me", response_model=schemas.HighSchooler)
-def update_current_high_schooler_profile(profile_data: schemas.HighSchoolerUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_current_high_schooler_profile(profile_data: schemas.HighSchoolerUpdate, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
     if current_user.user_type != models.UserType.HIGH_SCHOOL:
         raise HTTPException(status_code=403, detail="User is not a high schooler")
-    updated_profile = crud.update_high_schooler_profile(db, user_id=current_user.id, profile_data=profile_data)
+    updated_profile = await run_db(db, crud.update_high_schooler_profile, user_id=current_user.id, profile_data=profile_data)
     if not updated_profile:
         raise HTTPException(status_code=404, detail="High schooler profile not found")
     return updated_profile
 
 @app.patch("/companies/me", response_model=schemas.Company)
-def update_current_company_profile(profile_data: schemas.CompanyUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_current_company_profile(profile_data: schemas.CompanyUpdate, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
     if current_user.user_type != models.UserType.COMPANY:
         raise HTTPException(status_code=403, detail="User is not a company")
-    updated_profile = crud.update_company_profile(db, user_id=current_user.id, profile_data=profile_data)
+    updated_profile = await run_db(db, crud.update_company_profile, user_id=current_user.id, profile_data=profile_data)
     if not updated_profile:
         raise HTTPException(status_code=404, detail="Company profile not found")
     return updated_profile
 
 @app.patch("/universities/me", response_model=schemas.University)
-def update_current_university_profile(profile_data: schemas.UniversityUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_current_university_profile(profile_data: schemas.UniversityUpdate, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
     if current_user.user_type != models.UserType.UNIVERSITY:
         raise HTTPException(status_code=403, detail="User is not a university")
-    updated_profile = crud.update_university_profile(db, user_id=current_user.id, profile_data=profile_data)
+    updated_profile = await run_db(db, crud.update_university_profile, user_id=current_user.id, profile_data=profile_data)
     if not updated_profile:
         raise HTTPException(status_code=404, detail="University profile not found")
     return updated_profile
 
+# Annuaire : plusieurs utilisateurs et leur profil en une requête (écrans de conversation et
+# boîte de réception), ?ids=1,2,3. Réponse dans l'ordre des ids, sans doublons ni ids inconnus.
+PROFILE_FIELDS = {
+    models.UserType.STUDENT: "student",
+    models.UserType.HIGH_SCHOOL: "high_schooler",
+    models.UserType.COMPANY: "company",
+    models.UserType.UNIVERSITY: "university",
+}
+
+async def get_profile_loader(db: Session = Depends(get_read_session)) -> loaders.Loader:
+    return loaders.Loader(db, crud.get_users_with_profiles)
+
+def user_with_profile(user: models.User, profile) -> dict:
+    return {**{name: getattr(user, name) for name in schemas.User.model_fields}, PROFILE_FIELDS[user.user_type]: profile}
+
+@app.get("/users", response_model=list[schemas.UserWithProfile])
+async def read_users(ids: str, loader: loaders.Loader = Depends(get_profile_loader)):
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in ids.split(",") if user_id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be comma-separated integers")
+    if len(user_ids) > MAX_USER_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_USER_IDS} ids per request")
+    users = []
+    for found in await loader.load_many(user_ids):
+        if found is not None:
+            users.append(user_with_profile(*found))
+    return users
+
+# Page de profil : utilisateur, profil et (entreprises, universités) une page de ses offres ou
+# formations, en une requête HTTP et deux requêtes SQL au plus.
+# ?fields=user.first_name,profile,items.title ne renvoie que ces champs ("profile" : tout le
+# groupe) ; un groupe absent n'est pas renvoyé, et sans "items" les éléments ne sont pas lus.
+# Les champs d'un autre type de profil ou d'élément sont ignorés. Sans ?fields= : tout.
+PROFILE_PAGE_FIELDS = {
+    "user": set(schemas.User.model_fields),
+    "profile": set().union(*(schema.model_fields for schema in crud.PROFILE_SCHEMAS.values())),
+    "items": list(dict.fromkeys([*schemas.Offer.model_fields, *schemas.Formation.model_fields])),
+}
+
+def parse_profile_fields(fields: Optional[str]) -> dict:
+    """{groupe: noms des champs, ou None pour le groupe entier}"""
+    if fields is None:
+        return dict.fromkeys(PROFILE_PAGE_FIELDS)
+    selected = {}
+    for field in filter(None, (field.strip() for field in fields.split(","))):
+        group, _, name = field.partition(".")
+        if group not in PROFILE_PAGE_FIELDS or (name and name not in PROFILE_PAGE_FIELDS[group]):
+            raise HTTPException(status_code=400, detail=f"Unknown field: {field}")
+        if not name:
+            selected[group] = None
+        elif selected.get(group, set()) is not None:
+            selected.setdefault(group, set()).add(name)
+    return selected
+
+def pick_fields(values: dict, names: Optional[set]) -> dict:
+    return values if names is None else {name: value for name, value in values.items() if name in names}
+
+@app.get("/profiles/{user_id}", response_model=schemas.ProfilePage)
+async def read_profile(
+    user_id: int,
+    fields: Optional[str] = None,
+    items_after: Optional[int] = None,
+    items_limit: int = PROFILE_ITEMS_PAGE_SIZE,
+    db: Session = Depends(get_read_session),
+):
+    selected = parse_profile_fields(fields)
+    items_limit = max(1, min(items_limit, PROFILE_ITEMS_MAX_PAGE_SIZE))
+    item_fields = None
+    if "items" in selected:
+        item_fields = [name for name in PROFILE_PAGE_FIELDS["items"] if selected["items"] is None or name in selected["items"]]
+    page = await run_db(
+        db, crud.get_profile_page, user_id=user_id,
+        item_fields=item_fields, items_after=items_after, items_limit=items_limit + 1,
+    )
+    if page is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user, profile, items = page
+    body = {}
+    if "user" in selected:
+        body["user"] = pick_fields({name: getattr(user, name) for name in schemas.User.model_fields}, selected["user"])
+    if "profile" in selected:
+        profile_schema = crud.PROFILE_SCHEMAS[user.user_type]
+        body["profile"] = profile and pick_fields(
+            {name: getattr(profile, name) for name in profile_schema.model_fields}, selected["profile"]
+        )
+    if items is not None:
+        body["items"] = [pick_fields(item, selected["items"]) for item in items[:items_limit]]
+        body["next_cursor"] = items[items_limit - 1]["id"] if len(items) > items_limit else None
+    return fastjson.FastJSONResponse(body)
+
 @app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int, db: Session = Depends(get_read_session)):
+    db_user = await run_db(db, crud.get_user, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 @app.get("/students/user/{user_id}", response_model=schemas.Student)
-def read_student_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    db_student = crud.get_student_by_user_id(db, user_id=user_id)
+async def read_student_by_user_id(user_id: int, db: Session = Depends(get_read_session)):
+    db_student = await run_db(db, crud.get_student_by_user_id, user_id=user_id)
     if db_student is None:
         raise HTTPException(status_code=404, detail="Student not found")
     return db_student
 
 @app.get("/high_schoolers/user/{user_id}", response_model=schemas.HighSchooler)
-def read_high_schooler_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    db_high_schooler = crud.get_high_schooler_by_user_id(db, user_id=user_id)
+async def read_high_schooler_by_user_id(user_id: int, db: Session = Depends(get_read_session)):
+    db_high_schooler = await run_db(db, crud.get_high_schooler_by_user_id, user_id=user_id)
     if db_high_schooler is None:
         raise HTTPException(status_code=404, detail="High schooler not found")
     return db_high_schooler
 
 @app.get("/companies/user/{user_id}", response_model=schemas.Company)
-def read_company_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    db_company = crud.get_company_by_user_id(db, user_id=user_id)
+async def read_company_by_user_id(user_id: int, db: Session = Depends(get_read_session)):
+    db_company = await run_db(db, crud.get_company_by_user_id, user_id=user_id)
     if db_company is None:
         raise HTTPException(status_code=404, detail="Company not found")
     return db_company
 
 @app.get("/universities/user/{user_id}", response_model=schemas.University)
-def read_university_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    db_university = crud.get_university_by_user_id(db, user_id=user_id)
+async def read_university_by_user_id(user_id: int, db: Session = Depends(get_read_session)):
+    db_university = await run_db(db, crud.get_university_by_user_id, user_id=user_id)
     if db_university is None:
         raise HTTPException(status_code=404, detail="University not found")
     return db_university
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"Hello": "World"}
 
+# Listes du catalogue : réponses sérialisées gardées dans response_cache (voir cache.py),
+# invalidées par les écritures d'offres / formations. Les clients revalident (no-cache) avec
+# If-None-Match et reçoivent 304 tant que la page n'a pas changé. Les pages absentes sont lues
+# sur le primaire : lue sur un réplica en retard, une page antérieure à l'écriture serait
+# rangée sous la nouvelle génération.
+async def cached_catalog_page(request: Request, namespace: str, key: str, load):
+    generation = response_cache.generation(namespace)  # avant la lecture en base, voir cache.py
+    cached = response_cache.get(namespace, generation, key)
+    if cached is None:
+        cached = response_cache.set(namespace, generation, key, fastjson.dumps(await load()))
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def catalog_page_key(skip: int, limit: int, filters: dict) -> str:
+    return fastjson.dumps([skip, limit, filters]).decode()
+
+def keyword(q: Optional[str]) -> Optional[str]:
+    return q.strip() or None if q else None
+
+# Exports en flux : NDJSON (un objet du schéma de réponse par ligne), lu par lots de
+# EXPORT_CHUNK_SIZE avec une session (de lecture, voir replicas.py) par lot, pour ne pas
+# garder de connexion pendant que le client lit. `after` reprend un export interrompu au dernier id reçu.
+def ndjson_export(request: Request, function, after: Optional[int] = None, **kwargs) -> StreamingResponse:
+    strong = replicas.wants_primary(request)
+
+    async def chunks():
+        cursor = after
+        while True:
+            async with replicas.read_session_scope(strong) as db:
+                rows = await run_db(db, function, after=cursor, limit=EXPORT_CHUNK_SIZE, **kwargs)
+            if rows:
+                yield fastjson.ndjson(rows)
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                return
+            cursor = rows[-1]["id"]
+    return StreamingResponse(chunks(), media_type=fastjson.NDJSON_MEDIA_TYPE)
+
 # Offers
 @app.post("/companies/{company_id}/offers/", response_model=schemas.Offer)
-def create_offer_for_company(
-    company_id: int, offer: schemas.OfferCreate, db: Session = Depends(get_db)
+async def create_offer_for_company(
+    company_id: int, offer: schemas.OfferCreate, db: Session = Depends(get_session)
 ):
-    return crud.create_company_offer(db=db, offer=offer, company_id=company_id)
+    return await run_db(db, crud.create_company_offer, offer=offer, company_id=company_id)
 
+# Import en masse : corps CSV (avec en-tête) ou NDJSON, lu et inséré au fil de l'envoi.
+# Format d'après le Content-Type (text/csv, application/x-ndjson) ou ?format=csv|ndjson.
+@app.post("/companies/{company_id}/offers/import", response_model=schemas.ImportSummary)
+async def import_offers_for_company(
+    company_id: int, request: Request, file_format: Optional[str] = Query(None, alias="format"), db: Session = Depends(get_session)
+):
+    import_format = catalog_import.detect_format(request.headers.get("content-type"), file_format)
+    if import_format is None:
+        raise HTTPException(status_code=415, detail="Expected CSV or NDJSON")
+    if await run_db(db, crud.get_company, company_id=company_id) is None:
+        raise HTTPException(status_code=404, detail="Company not found")
+    return await catalog_import.import_items(
+        db, request.stream(), import_format, schemas.OfferCreate, "company_id", company_id, crud.create_company_offers
+    )
+
+@app.get("/offers/export")
+async def export_offers(request: Request, after: Optional[int] = None):
+    return ndjson_export(request, crud.get_catalog_rows_after, after, model=models.Offer, schema=schemas.Offer)
+
+# Filtres : ?industry= (secteur de l'entreprise), ?level=, ?q= (mot-clé du titre ou de la description).
+# Les valeurs d'industry et de level sont celles des facettes (GET /offers/facets).
 @app.get("/offers/", response_model=list[schemas.Offer])
-def read_offers(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    offers = crud.get_offers(db, skip=skip, limit=limit)
-    return offers
+async def read_offers(
+    request: Request, skip: int = 0, limit: int = 100,
+    industry: Optional[str] = None, q: Optional[str] = None, level: Optional[str] = None,
+    db: Session = Depends(get_session),
+):
+    filters = {"industry": industry, "q": keyword(q), "level": level}
+    return await cached_catalog_page(
+        request, "offers", catalog_page_key(skip, limit, filters),
+        lambda: run_db(db, crud.get_offers, skip=skip, limit=limit, as_rows=True, **filters),
+    )
+
+@app.get("/offers/facets", response_model=schemas.Facets)
+async def read_offer_facets(request: Request, db: Session = Depends(get_session)):
+    return await cached_catalog_page(request, "offers", "facets", lambda: run_db(db, crud.get_catalog_facets, kind="offers"))
 
 # Formations
 @app.post("/universities/{university_id}/formations/", response_model=schemas.Formation)
-def create_formation_for_university(
-    university_id: int, formation: schemas.FormationCreate, db: Session = Depends(get_db)
+async def create_formation_for_university(
+    university_id: int, formation: schemas.FormationCreate, db: Session = Depends(get_session)
+):
+    return await run_db(db, crud.create_university_formation, formation=formation, university_id=university_id)
+
+@app.post("/universities/{university_id}/formations/import", response_model=schemas.ImportSummary)
+async def import_formations_for_university(
+    university_id: int, request: Request, file_format: Optional[str] = Query(None, alias="format"), db: Session = Depends(get_session)
 ):
-    return crud.create_university_formation(db=db, formation=formation, university_id=university_id)
+    import_format = catalog_import.detect_format(request.headers.get("content-type"), file_format)
+    if import_format is None:
+        raise HTTPException(status_code=415, detail="Expected CSV or NDJSON")
+    if await run_db(db, crud.get_university, university_id=university_id) is None:
+        raise HTTPException(status_code=404, detail="University not found")
+    return await catalog_import.import_items(
+        db, request.stream(), import_format, schemas.FormationCreate, "university_id", university_id, crud.create_university_formations
+    )
+
+@app.get("/formations/export")
+async def export_formations(request: Request, after: Optional[int] = None):
+    return ndjson_export(request, crud.get_catalog_rows_after, after, model=models.Formation, schema=schemas.Formation)
 
 @app.get("/formations/", response_model=list[schemas.Formation])
-def read_formations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    formations = crud.get_formations(db, skip=skip, limit=limit)
-    return formations
+async def read_formations(
+    request: Request, skip: int = 0, limit: int = 100, q: Optional[str] = None, level: Optional[str] = None,
+    db: Session = Depends(get_session),
+):
+    filters = {"q": keyword(q), "level": level}
+    return await cached_catalog_page(
+        request, "formations", catalog_page_key(skip, limit, filters),
+        lambda: run_db(db, crud.get_formations, skip=skip, limit=limit, as_rows=True, **filters),
+    )
+
+@app.get("/formations/facets", response_model=schemas.Facets)
+async def read_formation_facets(request: Request, db: Session = Depends(get_session)):
+    return await cached_catalog_page(request, "formations", "facets", lambda: run_db(db, crud.get_catalog_facets, kind="formations"))
+
+# Tableaux de bord : candidatures / intérêts par offre ou formation, au total et par jour
+@app.get("/companies/me/dashboard", response_model=schemas.CatalogDashboard)
+async def read_company_dashboard(days: int = DASHBOARD_DAYS, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    if current_user.user_type != models.UserType.COMPANY:
+        raise HTTPException(status_code=403, detail="User is not a company")
+    dashboard = await run_db(db, crud.get_company_dashboard, user_id=current_user.id, days=max(1, min(days, DASHBOARD_MAX_DAYS)))
+    if dashboard is None:
+        raise HTTPException(status_code=404, detail="Company profile not found")
+    return dashboard
+
+@app.get("/universities/me/dashboard", response_model=schemas.CatalogDashboard)
+async def read_university_dashboard(days: int = DASHBOARD_DAYS, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    if current_user.user_type != models.UserType.UNIVERSITY:
+        raise HTTPException(status_code=403, detail="User is not a university")
+    dashboard = await run_db(db, crud.get_university_dashboard, user_id=current_user.id, days=max(1, min(days, DASHBOARD_MAX_DAYS)))
+    if dashboard is None:
+        raise HTTPException(status_code=404, detail="University profile not found")
+    return dashboard
+
+# Decks inverses : étudiants / lycéens les mieux classés pour une offre / formation du
+# propriétaire connecté, lus dans la shortlist tenue à jour par crud (voir SHORTLISTS)
+@app.get("/companies/me/offers/{offer_id}/candidates", response_model=list[schemas.Candidate])
+async def read_offer_candidates(offer_id: int, limit: int = DECK_PAGE_SIZE, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    if current_user.user_type != models.UserType.COMPANY:
+        raise HTTPException(status_code=403, detail="User is not a company")
+    candidates = await run_db(
+        db, crud.get_candidate_deck, kind="offers", owner_user_id=current_user.id, item_id=offer_id,
+        limit=max(1, min(limit, models.SHORTLIST_SIZE)),
+    )
+    if candidates is None:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    return [{**user_with_profile(user, profile), "score": score} for score, user, profile in candidates]
+
+@app.get("/universities/me/formations/{formation_id}/candidates", response_model=list[schemas.Candidate])
+async def read_formation_candidates(formation_id: int, limit: int = DECK_PAGE_SIZE, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    if current_user.user_type != models.UserType.UNIVERSITY:
+        raise HTTPException(status_code=403, detail="User is not a university")
+    candidates = await run_db(
+        db, crud.get_candidate_deck, kind="formations", owner_user_id=current_user.id, item_id=formation_id,
+        limit=max(1, min(limit, models.SHORTLIST_SIZE)),
+    )
+    if candidates is None:
+        raise HTTPException(status_code=404, detail="Formation not found")
+    return [{**user_with_profile(user, profile), "score": score} for score, user, profile in candidates]
+
+# Clôture par le propriétaire (offre pourvue, formation complète) : l'élément quitte les listes
+# et les decks, ses swipes sont archivés. Les éléments avec expires_at sont clôturés par lifecycle.py.
+@app.post("/companies/me/offers/{offer_id}/close", response_model=schemas.Offer)
+async def close_offer(offer_id: int, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    if current_user.user_type != models.UserType.COMPANY:
+        raise HTTPException(status_code=403, detail="User is not a company")
+    offer = await run_db(db, crud.close_owned_item, kind="offers", owner_user_id=current_user.id, item_id=offer_id)
+    if offer is None:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    return offer
+
+@app.post("/universities/me/formations/{formation_id}/close", response_model=schemas.Formation)
+async def close_formation(formation_id: int, current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    if current_user.user_type != models.UserType.UNIVERSITY:
+        raise HTTPException(status_code=403, detail="User is not a university")
+    formation = await run_db(db, crud.close_owned_item, kind="formations", owner_user_id=current_user.id, item_id=formation_id)
+    if formation is None:
+        raise HTTPException(status_code=404, detail="Formation not found")
+    return formation
+
+# Deck : offres / formations pas encore swipées par l'utilisateur connecté
+# Mêmes filtres que les listes ; la première page (sans curseur) porte les facettes du catalogue.
+@app.get("/me/deck/offers", response_model=schemas.OfferDeck)
+async def read_offer_deck(
+    cursor: Optional[int] = None, limit: int = DECK_PAGE_SIZE,
+    industry: Optional[str] = None, q: Optional[str] = None, level: Optional[str] = None,
+    current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session),
+):
+    if current_user.user_type != models.UserType.STUDENT:
+        raise HTTPException(status_code=403, detail="User is not a student")
+    limit = max(1, min(limit, DECK_MAX_PAGE_SIZE))
+    # On demande une ligne de plus pour savoir s'il reste une page après celle-ci
+    offers = await run_db(
+        db, crud.get_offer_deck, user_id=current_user.id, cursor=cursor, limit=limit + 1,
+        industry=industry, q=keyword(q), level=level,
+    )
+    next_cursor = offers[limit - 1].id if len(offers) > limit else None
+    facets = await run_db(db, crud.get_catalog_facets, kind="offers") if cursor is None else None
+    return {"items": offers[:limit], "next_cursor": next_cursor, "prefetch": DECK_PREFETCH, "facets": facets}
+
+@app.get("/me/deck/formations", response_model=schemas.FormationDeck)
+async def read_formation_deck(
+    cursor: Optional[int] = None, limit: int = DECK_PAGE_SIZE, q: Optional[str] = None, level: Optional[str] = None,
+    current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session),
+):
+    if current_user.user_type != models.UserType.HIGH_SCHOOL:
+        raise HTTPException(status_code=403, detail="User is not a high schooler")
+    limit = max(1, min(limit, DECK_MAX_PAGE_SIZE))
+    formations = await run_db(
+        db, crud.get_formation_deck, user_id=current_user.id, cursor=cursor, limit=limit + 1, q=keyword(q), level=level,
+    )
+    next_cursor = formations[limit - 1].id if len(formations) > limit else None
+    facets = await run_db(db, crud.get_catalog_facets, kind="formations") if cursor is None else None
+    return {"items": formations[:limit], "next_cursor": next_cursor, "prefetch": DECK_PREFETCH, "facets": facets}
 
 # Conversations and Messages
 @app.post("/conversations/", response_model=schemas.Conversation)
-def create_conversation(conversation: schemas.ConversationCreate, db: Session = Depends(get_db)):
-    return crud.create_conversation(db=db, conversation=conversation)
+async def create_conversation(conversation: schemas.ConversationCreate, db: Session = Depends(get_session)):
+    return await run_db(db, crud.create_conversation, conversation=conversation)
 
 @app.get("/conversations/{conversation_id}", response_model=schemas.Conversation)
-def read_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    db_conversation = crud.get_conversation(db, conversation_id=conversation_id)
+async def read_conversation(conversation_id: int, db: Session = Depends(get_session)):
+    db_conversation = await run_db(db, crud.get_conversation, conversation_id=conversation_id)
     if db_conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     return db_conversation
 
 @app.get("/users/{user_id}/conversations/", response_model=list[schemas.ConversationDetail])
-def read_conversations_for_user(user_id: int, db: Session = Depends(get_db)):
-    conversations = crud.get_conversations_for_user(db, user_id=user_id)
+async def read_conversations_for_user(user_id: int, before: Optional[int] = None, limit: int = INBOX_PAGE_SIZE, db: Session = Depends(get_session)):
+    limit = max(1, min(limit, INBOX_MAX_PAGE_SIZE))
+    conversations = await run_db(db, crud.get_conversations_for_user, user_id=user_id, before=before, limit=limit)
     return conversations
 
+@app.post("/conversations/{conversation_id}/read", response_model=schemas.ReadState)
+async def mark_conversation_read(
+    conversation_id: int, read: Optional[schemas.MarkRead] = None,
+    current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session),
+):
+    read_state = await run_db(
+        db, crud.mark_conversation_read, conversation_id=conversation_id, user_id=current_user.id,
+        message_id=read.message_id if read is not None else None,
+    )
+    if read_state is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return read_state
+
+# Badge de l'app : non-lus tenus à jour par l'envoi des messages et le marquage, sans comptage
+@app.get("/me/unread", response_model=schemas.UnreadSummary)
+async def read_unread_summary(current_user: schemas.User = Depends(get_current_user), db: Session = Depends(get_session)):
+    return await run_db(db, crud.get_unread_summary, user_id=current_user.id)
+
 @app.post("/messages/", response_model=schemas.Message)
-def create_message(message: schemas.MessageCreate, db: Session = Depends(get_db)):
-    return crud.create_message(db=db, message=message)
+async def create_message(message: schemas.MessageCreate, db: Session = Depends(get_session)):
+    return await run_db(db, crud.create_message, message=message)
 
 @app.get("/conversations/{conversation_id}/messages/", response_model=list[schemas.Message])
-def read_messages_for_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    messages = crud.get_messages_for_conversation(db, conversation_id=conversation_id)
-    return messages
+async def read_messages_for_conversation(
+    conversation_id: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = MESSAGES_PAGE_SIZE,
+    db: Session = Depends(get_session),
+):
+    # Sur le primaire : l'historique est relu juste après un envoi, un réplica en retard cacherait le message
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both.")
+    limit = max(1, min(limit, MESSAGES_MAX_PAGE_SIZE))
+    messages = await run_db(
+        db, crud.get_messages_for_conversation,
+        conversation_id=conversation_id, before=before, after=after, limit=limit, as_rows=True,
+    )
+    return fastjson.FastJSONResponse(messages)
+
+@app.get("/conversations/{conversation_id}/messages/export")
+async def export_messages_for_conversation(request: Request, conversation_id: int, after: Optional[int] = None):
+    """Tout l'historique (depuis le message `after`), un schemas.Message par ligne."""
+    return ndjson_export(request, crud.get_message_rows_after, after, conversation_id=conversation_id)
+
+# Temps réel : les nouveaux messages des conversations de l'utilisateur sont poussés sur ce WebSocket.
+# Le jeton est passé en paramètre (?token=...), les clients WebSocket ne pouvant pas tous fixer d'en-têtes.
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: str):
+    async with session_scope() as db:
+        user = await get_user_from_token(db, token)
+    if user is None or not user.is_active:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    channel = user_channel(user.id)
+    queue = broker.subscribe(channel)
+
+    async def push():
+        while True:
+            await websocket.send_json(await queue.get())
+
+    async def drain():
+        # Le client n'envoie rien d'utile ; on lit seulement pour détecter la déconnexion
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(push()), asyncio.create_task(drain())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        broker.unsubscribe(channel, queue)
 
 # Matches
 @app.post("/api/matches/", response_model=schemas.MatchResponse)
-def create_match_endpoint(match: schemas.MatchCreate, db: Session = Depends(get_db)):
+async def create_match_endpoint(match: schemas.MatchCreate, db: Session = Depends(get_session)):
     # On vérifie qu'on a bien soit une offre, soit une formation, mais pas les deux
     if not (match.offer_id is None) ^ (match.formation_id is None):
         raise HTTPException(status_code=400, detail="Either offer_id or formation_id must be provided, but not both.")
     
-    # On pourrait ajouter une vérification pour s'assurer que l'utilisateur ou l'offre/formation existent
-    
-    return crud.create_match(db=db, match_data=match)
+    result = await run_db(db, crud.create_match, match_data=match)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Offer or formation not found or closed")
+    return result
+
+@app.post("/api/matches/batch", response_model=schemas.MatchBatchResponse)
+async def create_match_batch_endpoint(batch: schemas.MatchBatchCreate, db: Session = Depends(get_session)):
+    # Swipes mis en file hors connexion : un seul appel à la reconnexion, un résultat par élément
+    if len(batch.items) > MATCH_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MATCH_BATCH_MAX_SIZE} swipes per batch.")
+    return await run_db(db, crud.create_match_batch, user_id=batch.user_id, items=batch.items)
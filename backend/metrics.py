@@ -0,0 +1,248 @@
+"""
+Instrumentation des requêtes HTTP et de la base, exposée au format Prometheus (GET /metrics).
+
+- MetricsMiddleware (ASGI) : durée, statut, temps passé en base et nombre de requêtes SQL de
+  chaque requête HTTP, par route (le gabarit, "/users/{user_id}/conversations/", pas l'URL).
+- instrument_engine() : hooks SQLAlchemy before/after_cursor_execute. Ils imputent chaque
+  requête SQL à la requête HTTP en cours (variable de contexte, qui suit crud dans le
+  threadpool comme dans run_sync) ; hors requête HTTP (threads de fond, scripts), elle n'est
+  comptée que globalement.
+- Requêtes SQL lentes (METRICS_SLOW_QUERY_MS > 0) : journalisées avec la route et le SQL.
+- Mode dev (METRICS_DEV_MODE=true) : avertissement quand une requête HTTP dépasse
+  QUERY_BUDGET requêtes SQL (c'est ainsi qu'un N+1 se voit), et en-têtes X-Query-Count /
+  X-DB-Time-Ms sur les réponses.
+- gauge() : valeurs lues au moment du rendu (pool de connexions, caches, hachage, push...).
+
+Les métriques sont celles du processus : avec plusieurs workers, Prometheus les agrège.
+"""
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import event # type: ignore
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("METRICS_SLOW_QUERY_MS", "0"))  # 0 : pas de journal
+DEV_MODE = os.getenv("METRICS_DEV_MODE", "false").lower() in ("1", "true", "yes")
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "10"))
+SLOW_QUERY_MAX_CHARS = 2000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    scope: dict
+    statements: int = 0
+    db_seconds: float = 0.0
+
+    @property
+    def route(self) -> str:
+        # Gabarit de la route trouvée par le routeur ; "unmatched" pour les 404 (cardinalité bornée)
+        return getattr(self.scope.get("route"), "path", None) or "unmatched"
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name, self.documentation, self.label_names = name, documentation, labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.documentation, self.label_names = name, documentation, labels
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}  # labels -> [compte par borne..., somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted((labels, list(series)) for labels, series in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in values:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    Valeur lue au rendu. `read` renvoie un nombre, ou {valeur d'étiquette: nombre} si `label`
+    est donné. kind="counter" pour les compteurs tenus ailleurs (stats des caches, du push...).
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable, label: Optional[str] = None, kind: str = "gauge"):
+        self.name, self.documentation, self.read, self.label, self.kind = name, documentation, read, label, kind
+
+    def render(self) -> list[str]:
+        try:
+            value = self.read()
+        except Exception:  # une source en erreur ne doit pas casser tout /metrics
+            logger.exception("Gauge %s failed", self.name)
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.label is None:
+            lines.append(f"{self.name} {value}")
+        else:
+            lines += [f"{self.name}{_labels((self.label,), (key,))} {item}" for key, item in sorted(value.items())]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return ("\n".join(lines) + "\n").encode()
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "rezo_http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status"),
+))
+http_duration = registry.register(Histogram(
+    "rezo_http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "route"),
+))
+http_db_duration = registry.register(Histogram(
+    "rezo_http_request_db_seconds", "Temps passé en base par requête HTTP", ("method", "route"),
+))
+http_statements = registry.register(Histogram(
+    "rezo_http_request_statements", "Requêtes SQL par requête HTTP", ("method", "route"), STATEMENT_BUCKETS,
+))
+db_statements = registry.register(Counter(
+    "rezo_db_statements_total", "Requêtes SQL exécutées (requêtes HTTP et tâches de fond)", ("context",),
+))
+db_duration = registry.register(Histogram("rezo_db_statement_duration_seconds", "Durée des requêtes SQL"))
+slow_statements = registry.register(Counter("rezo_db_slow_statements_total", "Requêtes SQL au-delà de METRICS_SLOW_QUERY_MS"))
+budget_exceeded = registry.register(Counter(
+    "rezo_http_query_budget_exceeded_total", "Requêtes HTTP au-delà de QUERY_BUDGET (mode dev)", ("method", "route"),
+))
+
+
+def gauge(name: str, documentation: str, read: Callable, label: Optional[str] = None, kind: str = "gauge"):
+    return registry.register(Gauge(name, documentation, read, label, kind))
+
+
+def instrument_engine(engine):
+    """Hooks de mesure sur un moteur synchrone (pour le moteur async : async_engine.sync_engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started_at"].pop()
+        db_duration.observe(elapsed)
+        request = current_request.get()
+        db_statements.inc("http" if request is not None else "background")
+        if request is not None:
+            request.statements += 1
+            request.db_seconds += elapsed
+        if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+            slow_statements.inc()
+            logger.warning(
+                "Slow query (%.1f ms, route %s): %s", elapsed * 1000,
+                request.route if request is not None else "-", statement[:SLOW_QUERY_MAX_CHARS],
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        connection = context.connection
+        if connection is not None and connection.info.get("metrics_started_at"):
+            connection.info["metrics_started_at"].pop()
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_metrics(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if DEV_MODE:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-query-count", str(stats.statements).encode()),
+                        (b"x-db-time-ms", f"{stats.db_seconds * 1000:.1f}".encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request.reset(token)
+            route, method = stats.route, scope["method"]
+            http_requests.inc(method, route, status_code)
+            http_duration.observe(time.perf_counter() - started, method, route)
+            http_db_duration.observe(stats.db_seconds, method, route)
+            http_statements.observe(stats.statements, method, route)
+            if DEV_MODE and stats.statements > QUERY_BUDGET:
+                budget_exceeded.inc(method, route)
+                logger.warning(
+                    "%s %s ran %d SQL statements (budget %d)", method, route, stats.statements, QUERY_BUDGET,
+                )
+
@@ -0,0 +1,102 @@
+"""Schéma initial (tel que créé par create_all avant les migrations)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String()),
+        sa.Column("hashed_password", sa.String()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("user_type", sa.Enum("STUDENT", "HIGH_SCHOOL", "COMPANY", "UNIVERSITY", name="usertype")),
+        sa.Column("first_name", sa.String()),
+        sa.Column("last_name", sa.String()),
+        sa.Column("device_token", sa.String(), nullable=True),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    for table in ("students", "high_schoolers", "companies", "universities"):
+        columns = {
+            "students": [sa.Column("skills", sa.String(), nullable=True), sa.Column("level", sa.String(), nullable=True)],
+            "high_schoolers": [sa.Column("current_school", sa.String(), nullable=True), sa.Column("strong_subjects", sa.String(), nullable=True)],
+            "companies": [sa.Column("industry", sa.String(), nullable=True), sa.Column("website", sa.String(), nullable=True)],
+            "universities": [sa.Column("accreditations", sa.String(), nullable=True), sa.Column("website", sa.String(), nullable=True)],
+        }[table]
+        op.create_table(
+            table,
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            *columns,
+        )
+        op.create_index(f"ix_{table}_id", table, ["id"])
+
+    op.create_table(
+        "offers",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String()),
+        sa.Column("description", sa.String()),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id")),
+    )
+    op.create_index("ix_offers_id", "offers", ["id"])
+    op.create_index("ix_offers_title", "offers", ["title"])
+
+    op.create_table(
+        "formations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("title", sa.String()),
+        sa.Column("description", sa.String()),
+        sa.Column("university_id", sa.Integer(), sa.ForeignKey("universities.id")),
+    )
+    op.create_index("ix_formations_id", "formations", ["id"])
+    op.create_index("ix_formations_title", "formations", ["title"])
+
+    op.create_table(
+        "conversations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("participant1_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("participant2_id", sa.Integer(), sa.ForeignKey("users.id")),
+    )
+    op.create_index("ix_conversations_id", "conversations", ["id"])
+
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("content", sa.String()),
+        sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Column("conversation_id", sa.Integer(), sa.ForeignKey("conversations.id")),
+        sa.Column("timestamp", sa.String()),
+    )
+    op.create_index("ix_messages_id", "messages", ["id"])
+
+    op.create_table(
+        "matches",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("offer_id", sa.Integer(), sa.ForeignKey("offers.id"), nullable=True),
+        sa.Column("formation_id", sa.Integer(), sa.ForeignKey("formations.id"), nullable=True),
+    )
+    op.create_index("ix_matches_id", "matches", ["id"])
+
+
+def downgrade():
+    for table in (
+        "matches", "messages", "conversations", "formations", "offers",
+        "universities", "companies", "high_schoolers", "students", "users",
+    ):
+        op.drop_table(table)
+    sa.Enum(name="usertype").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,37 @@
+"""Horodatage des messages en timestamptz, index de l'historique par curseur
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("UPDATE messages SET timestamp = now()::text WHERE timestamp IS NULL OR timestamp = ''")
+    op.alter_column(
+        "messages", "timestamp",
+        type_=sa.DateTime(timezone=True),
+        postgresql_using="timestamp::timestamptz",
+        server_default=sa.func.now(),
+        nullable=False,
+    )
+    op.create_index("ix_messages_conversation_id_timestamp_id", "messages", ["conversation_id", "timestamp", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_messages_conversation_id_timestamp_id", table_name="messages")
+    op.alter_column(
+        "messages", "timestamp",
+        type_=sa.String(),
+        postgresql_using="timestamp::text",
+        server_default=None,
+        nullable=True,
+    )
@@ -0,0 +1,47 @@
+"""Résumé dénormalisé des conversations (dernier message, dernière activité)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("conversations", sa.Column("last_message_id", sa.Integer(), nullable=True))
+    op.add_column(
+        "conversations",
+        sa.Column("last_activity_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_foreign_key("fk_conversations_last_message_id", "conversations", "messages", ["last_message_id"], ["id"])
+    op.execute("""
+        UPDATE conversations c SET last_message_id = m.id, last_activity_at = m.timestamp
+        FROM (
+            SELECT DISTINCT ON (conversation_id) conversation_id, id, timestamp
+            FROM messages ORDER BY conversation_id, timestamp DESC, id DESC
+        ) m
+        WHERE m.conversation_id = c.id
+    """)
+    op.create_index(
+        "ix_conversations_participant1_id_last_activity_at", "conversations",
+        ["participant1_id", "last_activity_at", "id"],
+    )
+    op.create_index(
+        "ix_conversations_participant2_id_last_activity_at", "conversations",
+        ["participant2_id", "last_activity_at", "id"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_conversations_participant2_id_last_activity_at", table_name="conversations")
+    op.drop_index("ix_conversations_participant1_id_last_activity_at", table_name="conversations")
+    op.drop_constraint("fk_conversations_last_message_id", "conversations", type_="foreignkey")
+    op.drop_column("conversations", "last_activity_at")
+    op.drop_column("conversations", "last_message_id")
@@ -0,0 +1,22 @@
+"""Swipes "pass" : colonne matches.is_like
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("matches", sa.Column("is_like", sa.Boolean(), server_default=sa.true(), nullable=False))
+
+
+def downgrade():
+    op.drop_column("matches", "is_like")
@@ -0,0 +1,75 @@
+"""Unicité des matches et des conversations (paire normalisée), index des clés étrangères
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+FK_INDEXES = [
+    ("ix_students_user_id", "students", ["user_id"]),
+    ("ix_high_schoolers_user_id", "high_schoolers", ["user_id"]),
+    ("ix_companies_user_id", "companies", ["user_id"]),
+    ("ix_universities_user_id", "universities", ["user_id"]),
+    ("ix_offers_company_id", "offers", ["company_id"]),
+    ("ix_formations_university_id", "formations", ["university_id"]),
+    ("ix_messages_sender_id", "messages", ["sender_id"]),
+    ("ix_matches_offer_id", "matches", ["offer_id"]),
+    ("ix_matches_formation_id", "matches", ["formation_id"]),
+]
+
+
+def upgrade():
+    # Matches en double : on garde le plus ancien
+    op.execute("""
+        DELETE FROM matches WHERE id NOT IN (
+            SELECT min(id) FROM matches GROUP BY user_id, offer_id, formation_id
+        )
+    """)
+
+    # Conversations : participant1_id <= participant2_id, puis fusion des doublons dans la plus ancienne
+    op.execute("""
+        UPDATE conversations SET participant1_id = participant2_id, participant2_id = participant1_id
+        WHERE participant1_id > participant2_id
+    """)
+    op.execute("""
+        CREATE TEMPORARY TABLE conversation_merges ON COMMIT DROP AS
+        SELECT id, min(id) OVER (PARTITION BY participant1_id, participant2_id) AS keep_id
+        FROM conversations
+    """)
+    op.execute("DELETE FROM conversation_merges WHERE id = keep_id")
+    op.execute("""
+        UPDATE messages m SET conversation_id = cm.keep_id
+        FROM conversation_merges cm WHERE m.conversation_id = cm.id
+    """)
+    op.execute("DELETE FROM conversations WHERE id IN (SELECT id FROM conversation_merges)")
+    op.execute("""
+        UPDATE conversations c SET last_message_id = m.id, last_activity_at = m.timestamp
+        FROM (
+            SELECT DISTINCT ON (conversation_id) conversation_id, id, timestamp
+            FROM messages ORDER BY conversation_id, timestamp DESC, id DESC
+        ) m
+        WHERE m.conversation_id = c.id AND c.id IN (SELECT keep_id FROM conversation_merges)
+    """)
+
+    op.create_index("uq_conversations_participants", "conversations", ["participant1_id", "participant2_id"], unique=True)
+    op.create_check_constraint("ck_conversations_participants_ordered", "conversations", "participant1_id <= participant2_id")
+    op.create_index("uq_matches_user_id_offer_id", "matches", ["user_id", "offer_id"], unique=True)
+    op.create_index("uq_matches_user_id_formation_id", "matches", ["user_id", "formation_id"], unique=True)
+    for name, table, columns in FK_INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(FK_INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_index("uq_matches_user_id_formation_id", table_name="matches")
+    op.drop_index("uq_matches_user_id_offer_id", table_name="matches")
+    op.drop_constraint("ck_conversations_participants_ordered", "conversations", type_="check")
+    op.drop_index("uq_conversations_participants", table_name="conversations")
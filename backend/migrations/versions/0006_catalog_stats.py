@@ -0,0 +1,62 @@
+"""Compteurs par offre / formation (totaux et par jour) pour les tableaux de bord
+
+Les compteurs sont initialisés depuis matches. conversations_opened part de 0 : on ne sait
+pas, pour les conversations existantes, quel swipe les a ouvertes.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# (table des totaux, table par jour, colonne de l'élément, table de l'élément)
+STATS_TABLES = [
+    ("offer_stats", "offer_daily_stats", "offer_id", "offers"),
+    ("formation_stats", "formation_daily_stats", "formation_id", "formations"),
+]
+
+
+def _counters():
+    return [
+        sa.Column(name, sa.Integer(), server_default="0", nullable=False)
+        for name in ("swipes", "likes", "conversations_opened")
+    ]
+
+
+def upgrade():
+    for totals, daily, item_column, items in STATS_TABLES:
+        op.create_table(
+            totals,
+            sa.Column(item_column, sa.Integer(), sa.ForeignKey(f"{items}.id"), primary_key=True),
+            *_counters(),
+        )
+        op.create_table(
+            daily,
+            sa.Column(item_column, sa.Integer(), sa.ForeignKey(f"{items}.id"), primary_key=True),
+            sa.Column("day", sa.Date(), primary_key=True),
+            *_counters(),
+        )
+        op.execute(f"""
+            INSERT INTO {totals} ({item_column}, swipes, likes)
+            SELECT {item_column}, count(*), count(*) FILTER (WHERE is_like)
+            FROM matches WHERE {item_column} IS NOT NULL GROUP BY {item_column}
+        """)
+        op.execute(f"""
+            INSERT INTO {daily} ({item_column}, day, swipes, likes)
+            SELECT {item_column}, (created_at AT TIME ZONE 'UTC')::date AS day, count(*), count(*) FILTER (WHERE is_like)
+            FROM matches WHERE {item_column} IS NOT NULL AND created_at IS NOT NULL
+            GROUP BY {item_column}, day
+        """)
+
+
+def downgrade():
+    for totals, daily, _, _ in reversed(STATS_TABLES):
+        op.drop_table(daily)
+        op.drop_table(totals)
@@ -0,0 +1,46 @@
+"""Filtres du catalogue : niveau des offres / formations, index du secteur, table des facettes
+
+Les facettes sont initialisées depuis offers x companies ; les niveaux sont nouveaux, donc vides.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ("offers", "formations"):
+        op.add_column(table, sa.Column("level", sa.String(), nullable=True))
+        op.create_index(f"ix_{table}_level", table, ["level"])
+    op.create_index("ix_companies_industry", "companies", ["industry"])
+
+    op.create_table(
+        "catalog_facets",
+        sa.Column("kind", sa.String(), primary_key=True),
+        sa.Column("facet", sa.String(), primary_key=True),
+        sa.Column("value", sa.String(), primary_key=True),
+        sa.Column("count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute("""
+        INSERT INTO catalog_facets (kind, facet, value, count)
+        SELECT 'offers', 'industry', c.industry, count(*)
+        FROM offers o JOIN companies c ON c.id = o.company_id
+        WHERE c.industry IS NOT NULL AND c.industry <> ''
+        GROUP BY c.industry
+    """)
+
+
+def downgrade():
+    op.drop_table("catalog_facets")
+    op.drop_index("ix_companies_industry", table_name="companies")
+    for table in ("formations", "offers"):
+        op.drop_index(f"ix_{table}_level", table_name=table)
+        op.drop_column(table, "level")
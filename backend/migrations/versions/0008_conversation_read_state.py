@@ -0,0 +1,34 @@
+"""État de lecture des conversations : repère et compteur de non-lus par participant
+
+Les conversations existantes sont considérées comme lues jusqu'à leur dernier message : pas de
+badge rétroactif sur tout l'historique.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for side in (1, 2):
+        op.add_column("conversations", sa.Column(f"participant{side}_last_read_message_id", sa.Integer(), nullable=True))
+        op.add_column("conversations", sa.Column(f"participant{side}_unread_count", sa.Integer(), server_default="0", nullable=False))
+    op.execute("""
+        UPDATE conversations
+        SET participant1_last_read_message_id = last_message_id, participant2_last_read_message_id = last_message_id
+        WHERE last_message_id IS NOT NULL
+    """)
+
+
+def downgrade():
+    for side in (2, 1):
+        op.drop_column("conversations", f"participant{side}_unread_count")
+        op.drop_column("conversations", f"participant{side}_last_read_message_id")
@@ -0,0 +1,45 @@
+"""Decks inverses : shortlists par offre / formation, updated_at des profils
+
+Les shortlists partent vides ; scripts/build_shortlists.py les calcule pour le catalogue existant.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+# (table des shortlists, colonne de l'élément, table de l'élément)
+SHORTLIST_TABLES = [
+    ("offer_shortlists", "offer_id", "offers"),
+    ("formation_shortlists", "formation_id", "formations"),
+]
+
+
+def upgrade():
+    for table in ("students", "high_schoolers"):
+        op.add_column(table, sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False))
+        op.create_index(f"ix_{table}_updated_at", table, ["updated_at"])
+    for shortlists, item_column, items in SHORTLIST_TABLES:
+        op.create_table(
+            shortlists,
+            sa.Column(item_column, sa.Integer(), sa.ForeignKey(f"{items}.id"), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("score", sa.Float(), nullable=False),
+        )
+        op.create_index(f"ix_{shortlists}_{item_column}_score", shortlists, [item_column, "score"])
+        op.create_index(f"ix_{shortlists}_user_id", shortlists, ["user_id"])
+
+
+def downgrade():
+    for shortlists, _, _ in reversed(SHORTLIST_TABLES):
+        op.drop_table(shortlists)
+    for table in ("high_schoolers", "students"):
+        op.drop_index(f"ix_{table}_updated_at", table_name=table)
+        op.drop_column(table, "updated_at")
@@ -0,0 +1,57 @@
+"""Cycle de vie du catalogue : publication, expiration et clôture, index partiels, archive des swipes
+
+Les offres et formations existantes restent en ligne (published_at = date de la migration,
+sans expiration).
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+# (table, colonne du propriétaire)
+CATALOG_TABLES = [("offers", "company_id"), ("formations", "university_id")]
+
+
+def upgrade():
+    for table, owner_column in CATALOG_TABLES:
+        op.add_column(table, sa.Column("published_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False))
+        op.add_column(table, sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True))
+        op.add_column(table, sa.Column("closed_at", sa.DateTime(timezone=True), nullable=True))
+        live = sa.text("closed_at IS NULL")
+        op.create_index(f"ix_{table}_live_id", table, ["id"], postgresql_where=live, sqlite_where=live)
+        op.create_index(f"ix_{table}_live_{owner_column}_id", table, [owner_column, "id"], postgresql_where=live, sqlite_where=live)
+        expiring = sa.text("closed_at IS NULL AND expires_at IS NOT NULL")
+        op.create_index(f"ix_{table}_live_expires_at", table, ["expires_at"], postgresql_where=expiring, sqlite_where=expiring)
+        closed = sa.text("closed_at IS NOT NULL")
+        op.create_index(f"ix_{table}_closed_at", table, ["closed_at"], postgresql_where=closed, sqlite_where=closed)
+
+    op.create_table(
+        "matches_archive",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("match_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("offer_id", sa.Integer(), sa.ForeignKey("offers.id"), nullable=True),
+        sa.Column("formation_id", sa.Integer(), sa.ForeignKey("formations.id"), nullable=True),
+        sa.Column("is_like", sa.Boolean(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    for column in ("user_id", "offer_id", "formation_id"):
+        op.create_index(f"ix_matches_archive_{column}", "matches_archive", [column])
+
+
+def downgrade():
+    op.drop_table("matches_archive")
+    for table, owner_column in reversed(CATALOG_TABLES):
+        for index in ("closed_at", "live_expires_at", f"live_{owner_column}_id", "live_id"):
+            op.drop_index(f"ix_{table}_{index}", table_name=table)
+        for column in ("closed_at", "expires_at", "published_at"):
+            op.drop_column(table, column)
@@ -0,0 +1,32 @@
+"""Shortlists calculées en tâche de fond : shortlisted_at sur offres et formations
+
+Les éléments existants restent en attente (shortlisted_at vide) : la tâche de fond de
+lifecycle.py recalcule leurs shortlists après la migration.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+TABLES = ["offers", "formations"]
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column("shortlisted_at", sa.DateTime(timezone=True), nullable=True))
+        pending = sa.text("closed_at IS NULL AND shortlisted_at IS NULL")
+        op.create_index(f"ix_{table}_live_pending_shortlist_id", table, ["id"], postgresql_where=pending, sqlite_where=pending)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(f"ix_{table}_live_pending_shortlist_id", table_name=table)
+        op.drop_column(table, "shortlisted_at")
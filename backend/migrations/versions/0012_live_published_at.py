@@ -0,0 +1,30 @@
+"""Index partiel (published_at, id) des offres et formations en ligne
+
+Sert au rattrapage des créations par les index en mémoire (ranking.RelevanceIndex.sync), relues
+sur une marge de published_at plutôt qu'au-delà du dernier id vu.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18
+"""
+from alembic import op # type: ignore
+import sqlalchemy as sa # type: ignore
+
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+TABLES = ["offers", "formations"]
+
+
+def upgrade():
+    live = sa.text("closed_at IS NULL")
+    for table in TABLES:
+        op.create_index(f"ix_{table}_live_published_at_id", table, ["published_at", "id"], postgresql_where=live, sqlite_where=live)
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_index(f"ix_{table}_live_published_at_id", table_name=table)
@@ -1,6 +1,6 @@
-from sqlalchemy import Boolean, Column, Integer, String, Enum, ForeignKey, DateTime
+from sqlalchemy import Boolean, CheckConstraint, Column, Date, Float, Integer, String, Enum, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship # type: ignore
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, true
 from database import Base
 import enum
 
@@ -25,26 +25,29 @@ class User(Base):
 class Student(Base):
     __tablename__ = "students"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     skills = Column(String, nullable=True) # Ex: "Python, Flutter, SQL"
     level = Column(String, nullable=True) # Ex: "Master 2"
+    # Rattrapage de ranking.student_index par les autres workers
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
 
     user = relationship("User")
 
 class HighSchooler(Base):
     __tablename__ = "high_schoolers"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     current_school = Column(String, nullable=True)
     strong_subjects = Column(String, nullable=True) # Ex: "Maths, Physique"
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False, index=True)
 
     user = relationship("User")
 
 class Company(Base):
     __tablename__ = "companies"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    industry = Column(String, nullable=True) # Ex: "Tech, Finance"
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    industry = Column(String, nullable=True, index=True) # Ex: "Tech, Finance"
     website = Column(String, nullable=True)
 
     user = relationship("User")
@@ -53,7 +56,7 @@ class Company(Base):
 class University(Base):
     __tablename__ = "universities"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     accreditations = Column(String, nullable=True)
     website = Column(String, nullable=True)
 
@@ -65,42 +68,110 @@ class Offer(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    company_id = Column(Integer, ForeignKey("companies.id"))
+    level = Column(String, nullable=True, index=True) # Ex: "Master 2", comme Student.level
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
+
+    # Cycle de vie : en ligne de published_at à closed_at (clôture par l'entreprise, ou par
+    # lifecycle.py une fois expires_at passé). Listes, decks et exports ne lisent que les
+    # éléments en ligne (crud._live), servis par les index partiels ci-dessous.
+    published_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+    # Shortlist du deck inverse calculée (vide : en attente de la tâche de fond de lifecycle.py)
+    shortlisted_at = Column(DateTime(timezone=True), nullable=True)
 
     company = relationship("Company", back_populates="offers")
 
+    __table_args__ = (
+        Index("ix_offers_live_id", "id", postgresql_where=closed_at.is_(None), sqlite_where=closed_at.is_(None)),
+        Index("ix_offers_live_company_id_id", "company_id", "id", postgresql_where=closed_at.is_(None), sqlite_where=closed_at.is_(None)),
+        # Purge des expirées
+        Index("ix_offers_live_expires_at", "expires_at", postgresql_where=closed_at.is_(None) & expires_at.isnot(None), sqlite_where=closed_at.is_(None) & expires_at.isnot(None)),
+        # Rattrapage des clôtures et des créations par les index en mémoire (ranking.RelevanceIndex.sync)
+        Index("ix_offers_closed_at", "closed_at", postgresql_where=closed_at.isnot(None), sqlite_where=closed_at.isnot(None)),
+        Index("ix_offers_live_published_at_id", "published_at", "id", postgresql_where=closed_at.is_(None), sqlite_where=closed_at.is_(None)),
+        # Shortlists en attente (lifecycle.py)
+        Index("ix_offers_live_pending_shortlist_id", "id", postgresql_where=closed_at.is_(None) & shortlisted_at.is_(None), sqlite_where=closed_at.is_(None) & shortlisted_at.is_(None)),
+    )
+
 class Formation(Base):
     __tablename__ = "formations"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(String)
-    university_id = Column(Integer, ForeignKey("universities.id"))
+    level = Column(String, nullable=True, index=True) # Ex: "Licence"
+    university_id = Column(Integer, ForeignKey("universities.id"), index=True)
+
+    # Cycle de vie : comme Offer
+    published_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+    shortlisted_at = Column(DateTime(timezone=True), nullable=True)
 
     university = relationship("University", back_populates="formations")
 
+    __table_args__ = (
+        Index("ix_formations_live_id", "id", postgresql_where=closed_at.is_(None), sqlite_where=closed_at.is_(None)),
+        Index("ix_formations_live_university_id_id", "university_id", "id", postgresql_where=closed_at.is_(None), sqlite_where=closed_at.is_(None)),
+        Index("ix_formations_live_expires_at", "expires_at", postgresql_where=closed_at.is_(None) & expires_at.isnot(None), sqlite_where=closed_at.is_(None) & expires_at.isnot(None)),
+        Index("ix_formations_closed_at", "closed_at", postgresql_where=closed_at.isnot(None), sqlite_where=closed_at.isnot(None)),
+        Index("ix_formations_live_published_at_id", "published_at", "id", postgresql_where=closed_at.is_(None), sqlite_where=closed_at.is_(None)),
+        Index("ix_formations_live_pending_shortlist_id", "id", postgresql_where=closed_at.is_(None) & shortlisted_at.is_(None), sqlite_where=closed_at.is_(None) & shortlisted_at.is_(None)),
+    )
+
 class Conversation(Base):
     __tablename__ = "conversations"
     id = Column(Integer, primary_key=True, index=True)
+    # Paire normalisée (participant1_id <= participant2_id, voir crud.normalized_pair) :
+    # une seule conversation par paire d'utilisateurs
     participant1_id = Column(Integer, ForeignKey("users.id"))
     participant2_id = Column(Integer, ForeignKey("users.id"))
 
+    # Résumé dénormalisé, mis à jour par crud.create_message dans la même transaction
+    last_message_id = Column(Integer, ForeignKey("messages.id", use_alter=True, name="fk_conversations_last_message_id"), nullable=True)
+    last_activity_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # État de lecture de chaque participant, tenu par crud.create_message et crud.mark_conversation_read :
+    # dernier message lu (repère par id) et messages de l'autre participant reçus depuis
+    participant1_last_read_message_id = Column(Integer, nullable=True)
+    participant2_last_read_message_id = Column(Integer, nullable=True)
+    participant1_unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    participant2_unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     participant1 = relationship("User", foreign_keys=[participant1_id])
     participant2 = relationship("User", foreign_keys=[participant2_id])
-    messages = relationship("Message", back_populates="conversation")
+    messages = relationship("Message", back_populates="conversation", foreign_keys="Message.conversation_id")
+    last_message = relationship("Message", foreign_keys=[last_message_id], post_update=True)
+
+    __table_args__ = (
+        # Boîte de réception : conversations d'un participant, les plus récentes d'abord
+        Index("ix_conversations_participant1_id_last_activity_at", "participant1_id", "last_activity_at", "id"),
+        Index("ix_conversations_participant2_id_last_activity_at", "participant2_id", "last_activity_at", "id"),
+        Index("uq_conversations_participants", "participant1_id", "participant2_id", unique=True),
+        CheckConstraint("participant1_id <= participant2_id", name="ck_conversations_participants_ordered"),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String)
-    sender_id = Column(Integer, ForeignKey("users.id"))
+    sender_id = Column(Integer, ForeignKey("users.id"), index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
-    timestamp = Column(String)  # Pour simplifier, on utilise une string pour le timestamp
+    # Horodatage fixé par le serveur ; l'id départage les messages d'une même transaction
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     sender = relationship("User")
-    conversation = relationship("Conversation", back_populates="messages")
+    conversation = relationship("Conversation", back_populates="messages", foreign_keys=[conversation_id])
+
+    __table_args__ = (
+        # Historique d'une conversation : tri et pagination par curseur sans tri en mémoire
+        Index("ix_messages_conversation_id_timestamp_id", "conversation_id", "timestamp", "id"),
+    )
 
 class Match(Base):
     __tablename__ = "matches"
+    # created_at revient dans le RETURNING de l'INSERT, sans SELECT après coup
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -109,10 +180,103 @@ class Match(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # Sur quoi l'action a été faite (une seule des deux sera remplie)
-    offer_id = Column(Integer, ForeignKey("offers.id"), nullable=True)
-    formation_id = Column(Integer, ForeignKey("formations.id"), nullable=True)
+    offer_id = Column(Integer, ForeignKey("offers.id"), nullable=True, index=True)
+    formation_id = Column(Integer, ForeignKey("formations.id"), nullable=True, index=True)
+
+    # True : "like" (ouvre une conversation) ; False : "pass" (retire seulement l'élément du deck)
+    is_like = Column(Boolean, nullable=False, default=True, server_default=true())
 
     # Relation pour accéder à l'utilisateur depuis un match
     user = relationship("User")
     offer = relationship("Offer")
     formation = relationship("Formation")
+
+    __table_args__ = (
+        # Un seul swipe par utilisateur et par élément ; sert aussi l'exclusion du deck
+        Index("uq_matches_user_id_offer_id", "user_id", "offer_id", unique=True),
+        Index("uq_matches_user_id_formation_id", "user_id", "formation_id", unique=True),
+    )
+
+# Swipes des offres et formations clôturées, déplacés hors de matches par crud._close_items :
+# matches (exclusion des decks, doublons) ne grossit qu'avec le catalogue en ligne.
+# Mêmes colonnes, plus l'id d'origine (match_id).
+class ArchivedMatch(Base):
+    __tablename__ = "matches_archive"
+    id = Column(Integer, primary_key=True)
+    match_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True))
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    offer_id = Column(Integer, ForeignKey("offers.id"), nullable=True, index=True)
+    formation_id = Column(Integer, ForeignKey("formations.id"), nullable=True, index=True)
+    is_like = Column(Boolean, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+# Statistiques des offres et formations, tenues à jour par crud.create_match / create_match_batch
+# dans la transaction du swipe (crud._record_swipe_stats) : les tableaux de bord les lisent en
+# O(nombre d'offres) sans parcourir matches.
+# swipes : utilisateurs distincts (un seul swipe par utilisateur et par élément), likes compris.
+# conversations_opened : conversations créées par un like sur cet élément.
+STAT_COUNTERS = ("swipes", "likes", "conversations_opened")
+
+class StatCounters:
+    swipes = Column(Integer, nullable=False, default=0, server_default="0")
+    likes = Column(Integer, nullable=False, default=0, server_default="0")
+    conversations_opened = Column(Integer, nullable=False, default=0, server_default="0")
+
+class OfferStats(StatCounters, Base):
+    __tablename__ = "offer_stats"
+    offer_id = Column(Integer, ForeignKey("offers.id"), primary_key=True)
+
+class FormationStats(StatCounters, Base):
+    __tablename__ = "formation_stats"
+    formation_id = Column(Integer, ForeignKey("formations.id"), primary_key=True)
+
+# Mêmes compteurs par jour (UTC)
+class OfferDailyStats(StatCounters, Base):
+    __tablename__ = "offer_daily_stats"
+    offer_id = Column(Integer, ForeignKey("offers.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+class FormationDailyStats(StatCounters, Base):
+    __tablename__ = "formation_daily_stats"
+    formation_id = Column(Integer, ForeignKey("formations.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+# Nombre d'offres / formations par valeur de filtre (facettes des listes et des decks), tenu à
+# jour dans la transaction des écritures du catalogue (crud._bump_facets) : lu sans GROUP BY.
+# kind : "offers" ou "formations" ; facet : "industry" (secteur de l'entreprise) ou "level".
+# Les éléments sans valeur ne sont pas comptés ; une ligne peut retomber à 0.
+class CatalogFacet(Base):
+    __tablename__ = "catalog_facets"
+    kind = Column(String, primary_key=True)
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0, server_default="0")
+
+# Decks inverses : les SHORTLIST_SIZE profils les mieux classés pour chaque offre (étudiants) ou
+# formation (lycéens), calculés par la tâche de fond de lifecycle.py (éléments en attente) et
+# ajustés par crud au PATCH des profils.
+# score : celui de l'offre dans le deck du profil (ranking.RelevanceIndex.top_profiles).
+SHORTLIST_SIZE = 50
+
+class ShortlistEntry:
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+
+class OfferShortlist(ShortlistEntry, Base):
+    __tablename__ = "offer_shortlists"
+    offer_id = Column(Integer, ForeignKey("offers.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_offer_shortlists_offer_id_score", "offer_id", "score"),
+        Index("ix_offer_shortlists_user_id", "user_id"),
+    )
+
+class FormationShortlist(ShortlistEntry, Base):
+    __tablename__ = "formation_shortlists"
+    formation_id = Column(Integer, ForeignKey("formations.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_formation_shortlists_formation_id_score", "formation_id", "score"),
+        Index("ix_formation_shortlists_user_id", "user_id"),
+    )
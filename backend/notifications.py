@@ -0,0 +1,314 @@
+"""
+Notifications push (nouveaux matches, nouveaux messages), envoyées hors du chemin des requêtes.
+
+crud.create_match / crud.create_message appellent notify(), qui ne fait que déposer la
+notification dans une file. Un thread dédié la vide par fenêtres de COALESCE_SECONDS :
+- il résout les device_token de tous les destinataires en une requête ;
+- il regroupe les notifications d'un même appareil en une seule ("3 nouvelles notifications") ;
+- il envoie par lots de BATCH_SIZE au fournisseur ;
+- il réessaie les échecs temporaires avec un délai exponentiel ;
+- il efface les device_token que le fournisseur déclare invalides.
+
+Le fournisseur est derrière PushSender, choisi par PUSH_PROVIDER : FCMPushSender en
+production ("fcm", firebase-admin), LogPushSender par défaut (rien n'est envoyé, un
+avertissement le signale au démarrage), FakePushSender pour les tests et pour mesurer le
+débit de la chaîne sans réseau ("fake").
+"""
+import collections
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import models
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+COALESCE_SECONDS = float(os.getenv("PUSH_COALESCE_SECONDS", "1.0"))
+BATCH_SIZE = 500  # maximum accepté par FCM pour un envoi groupé
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+QUEUE_SIZE = 10000
+FAKE_SENT_SIZE = 10000  # messages gardés par FakePushSender
+
+
+@dataclass
+class PushNotification:
+    user_id: int
+    title: str
+    body: str
+    data: dict = field(default_factory=dict)
+
+
+@dataclass
+class PushMessage:
+    token: str
+    title: str
+    body: str
+    data: dict = field(default_factory=dict)
+    attempts: int = 0
+
+
+# Résultat d'un envoi, par message
+SENT = "sent"
+RETRY = "retry"
+INVALID_TOKEN = "invalid_token"
+
+
+class PushSender:
+    def send(self, messages: list[PushMessage]) -> list[str]:
+        """Envoie un lot et renvoie un résultat (SENT, RETRY, INVALID_TOKEN) par message, dans l'ordre."""
+        raise NotImplementedError
+
+
+class LogPushSender(PushSender):
+    """Sans fournisseur configuré : les messages sont seulement journalisés (niveau DEBUG)."""
+
+    def send(self, messages):
+        for message in messages:
+            logger.debug("Push not sent (no provider): %s", message.title)
+        return [SENT] * len(messages)
+
+
+class FakePushSender(PushSender):
+    """
+    Tests : garde les derniers messages en mémoire (FAKE_SENT_SIZE au plus). `invalid_tokens`
+    et `failures` simulent les réponses du fournisseur.
+    """
+
+    def __init__(self, latency: float = 0.0, invalid_tokens=(), failures: int = 0):
+        self.latency = latency
+        self.invalid_tokens = set(invalid_tokens)
+        self.failures = failures
+        self.sent: collections.deque[PushMessage] = collections.deque(maxlen=FAKE_SENT_SIZE)
+        self.batches = 0
+
+    def send(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        self.batches += 1
+        results = []
+        for message in messages:
+            if message.token in self.invalid_tokens:
+                results.append(INVALID_TOKEN)
+            elif self.failures > 0:
+                self.failures -= 1
+                results.append(RETRY)
+            else:
+                self.sent.append(message)
+                results.append(SENT)
+        return results
+
+
+class FCMPushSender(PushSender):
+    def __init__(self):
+        import firebase_admin # type: ignore
+        from firebase_admin import messaging # type: ignore
+
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app()  # GOOGLE_APPLICATION_CREDENTIALS
+        self._messaging = messaging
+
+    def send(self, messages):
+        messaging = self._messaging
+        response = messaging.send_each([
+            messaging.Message(
+                token=message.token,
+                notification=messaging.Notification(title=message.title, body=message.body),
+                data={key: str(value) for key, value in message.data.items()},
+            )
+            for message in messages
+        ])
+        results = []
+        for item in response.responses:
+            if item.success:
+                results.append(SENT)
+            elif isinstance(item.exception, (messaging.UnregisteredError, messaging.SenderIdMismatchError)):
+                results.append(INVALID_TOKEN)
+            else:
+                results.append(RETRY)
+        return results
+
+
+class PushDispatcher:
+    def __init__(self, sender: PushSender, session_factory=SessionLocal, coalesce_seconds: float = COALESCE_SECONDS):
+        self.sender = sender
+        self._session_factory = session_factory
+        self.coalesce_seconds = coalesce_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._retries: list = []  # tas de (échéance, n°, PushMessage)
+        self._sequence = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.stats = {
+            "enqueued": 0, "dropped": 0, "coalesced": 0, "sent": 0,
+            "retried": 0, "failed": 0, "invalid_tokens": 0, "batches": 0,
+        }
+
+    # --- Côté requêtes ------------------------------------------------------
+
+    def notify(self, user_id: int, title: str, body: str, data: Optional[dict] = None):
+        """Non bloquant. Ignoré si le dispatcher n'est pas démarré ou si la file est pleine."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(PushNotification(user_id, title, body, data or {}))
+            self.stats["enqueued"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    # --- Cycle de vie -------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not isinstance(self.sender, FCMPushSender):
+            logger.warning("No push provider configured (PUSH_PROVIDER=fcm): notifications will not be delivered")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="push-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Vide la file en cours puis arrête le thread (les réessais encore en attente sont abandonnés)."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        self._stopping.set()
+        thread.join(timeout)
+
+    # --- Thread d'envoi -----------------------------------------------------
+
+    def _run(self):
+        while True:
+            window = self._collect_window()
+            if window:
+                try:
+                    self._dispatch(window)
+                except Exception:
+                    logger.exception("Push dispatch failed, %d notifications lost", len(window))
+            self._send_due_retries()
+            if self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _collect_window(self) -> list[PushNotification]:
+        # On attend la première notification (ou l'échéance d'un réessai), puis on laisse
+        # la fenêtre se remplir pour regrouper les rafales
+        timeout = 0.5
+        if self._retries:
+            timeout = max(0.0, min(timeout, self._retries[0][0] - time.monotonic()))
+        try:
+            first = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+        window = [first]
+        deadline = time.monotonic() + (0 if self._stopping.is_set() else self.coalesce_seconds)
+        while len(window) < BATCH_SIZE * 4:
+            remaining = deadline - time.monotonic()
+            try:
+                window.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return window
+
+    def _dispatch(self, window: list[PushNotification]):
+        tokens = self._device_tokens({notification.user_id for notification in window})
+        by_token: dict[str, list[PushNotification]] = {}
+        for notification in window:
+            token = tokens.get(notification.user_id)
+            if token:
+                by_token.setdefault(token, []).append(notification)
+
+        messages = []
+        for token, notifications in by_token.items():
+            latest = notifications[-1]
+            if len(notifications) == 1:
+                messages.append(PushMessage(token, latest.title, latest.body, latest.data))
+            else:
+                self.stats["coalesced"] += len(notifications) - 1
+                messages.append(PushMessage(
+                    token, latest.title, f"{len(notifications)} nouvelles notifications", latest.data
+                ))
+        self._send(messages)
+
+    def _send(self, messages: list[PushMessage]):
+        invalid = []
+        for start in range(0, len(messages), BATCH_SIZE):
+            batch = messages[start:start + BATCH_SIZE]
+            try:
+                results = self.sender.send(batch)
+            except Exception:
+                logger.exception("Push provider error")
+                results = [RETRY] * len(batch)
+            self.stats["batches"] += 1
+            for message, result in zip(batch, results):
+                if result == SENT:
+                    self.stats["sent"] += 1
+                elif result == INVALID_TOKEN:
+                    invalid.append(message.token)
+                else:
+                    self._schedule_retry(message)
+        if invalid:
+            self.stats["invalid_tokens"] += len(invalid)
+            self._forget_tokens(invalid)
+
+    def _schedule_retry(self, message: PushMessage):
+        message.attempts += 1
+        if message.attempts >= MAX_ATTEMPTS:
+            self.stats["failed"] += 1
+            return
+        self.stats["retried"] += 1
+        due = time.monotonic() + RETRY_BASE_SECONDS * 2 ** (message.attempts - 1)
+        heapq.heappush(self._retries, (due, next(self._sequence), message))
+
+    def _send_due_retries(self):
+        now = time.monotonic()
+        due = []
+        while self._retries and self._retries[0][0] <= now:
+            due.append(heapq.heappop(self._retries)[2])
+        if due:
+            self._send(due)
+
+    # --- Accès base ---------------------------------------------------------
+
+    def _device_tokens(self, user_ids: set[int]) -> dict[int, str]:
+        db = self._session_factory()
+        try:
+            rows = db.query(models.User.id, models.User.device_token).filter(
+                models.User.id.in_(user_ids), models.User.device_token.isnot(None)
+            )
+            return {user_id: token for user_id, token in rows}
+        finally:
+            db.close()
+
+    def _forget_tokens(self, tokens: list[str]):
+        db = self._session_factory()
+        try:
+            db.query(models.User).filter(models.User.device_token.in_(tokens)).update(
+                {models.User.device_token: None}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+def create_sender() -> PushSender:
+    provider = os.getenv("PUSH_PROVIDER", "log")
+    if provider == "fcm":
+        return FCMPushSender()
+    if provider == "fake":
+        return FakePushSender()
+    return LogPushSender()
+
+
+dispatcher = PushDispatcher(create_sender())
+
+
+def notify(user_id: int, title: str, body: str, data: Optional[dict] = None):
+    dispatcher.notify(user_id, title, body, data)
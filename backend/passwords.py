@@ -0,0 +1,80 @@
+"""
+Hachage et vérification des mots de passe hors de la boucle d'évènements.
+
+bcrypt coûte ~100-300 ms de CPU par appel. Appelé directement depuis un endpoint async,
+il gèle toute l'API pendant ce temps. Ici chaque calcul part dans un pool de threads
+dédié (bcrypt relâche le GIL), de taille bornée pour ne pas affamer le reste du serveur,
+et la file d'attente est elle-même bornée : au-delà, on refuse (503) plutôt que de
+laisser la latence de toutes les connexions exploser.
+
+Le coût est réglé par BCRYPT_ROUNDS. Quand il change, les anciens hachages sont
+recalculés à la connexion suivante (verify_and_update).
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext # type: ignore
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HasherOverloaded(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        # pending n'est modifié que depuis la boucle d'évènements ; le reste depuis les threads du pool
+        self.pending = 0
+        self.stats = {
+            "completed": 0, "rejected": 0, "rehashed": 0, "max_pending": 0,
+            "wait_seconds_total": 0.0, "work_seconds_total": 0.0,
+        }
+
+    async def _run(self, function, *args):
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HasherOverloaded()
+        self.pending += 1
+        self.stats["max_pending"] = max(self.stats["max_pending"], self.pending)
+        queued_at = time.monotonic()
+
+        def job():
+            started_at = time.monotonic()
+            try:
+                return function(*args)
+            finally:
+                finished_at = time.monotonic()
+                with self._lock:
+                    self.stats["completed"] += 1
+                    self.stats["wait_seconds_total"] += started_at - queued_at
+                    self.stats["work_seconds_total"] += finished_at - started_at
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """(mot de passe correct, nouveau hachage ou None si le coût actuel est déjà le bon)."""
+        verified, new_hash = await self._run(pwd_context.verify_and_update, password, hashed_password)
+        if verified and new_hash is not None:
+            self.stats["rehashed"] += 1
+        return verified, new_hash
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,591 @@
+"""
+Classement des offres / formations par pertinence avec le profil de l'utilisateur.
+
+Chaque offre (titre + description) est découpée en termes normalisés et rangée
+comme une ligne d'une matrice creuse de fréquences (CSR) gardée en mémoire, doublée
+d'un index inversé (pour chaque terme, les lignes qui le contiennent).
+Le profil (Student.skills, HighSchooler.strong_subjects) est découpé de la même
+façon au moment de la requête ; le cosinus TF-IDF contre toutes les offres ne lit
+que les listes des quelques termes du profil, le reste est du calcul vectoriel
+sur des tableaux NumPy de la taille du catalogue.
+
+L'IDF n'est pas figé dans la matrice : on garde les fréquences brutes et le nombre
+de documents par terme, et on applique l'IDF au moment du score. Ajouter une offre
+revient donc à ajouter une ligne, sans jamais reconstruire l'index.
+
+Sens inverse (decks des entreprises et universités) : ProfileIndex range les profils par
+terme ; top_profiles() note un lot d'offres contre leurs candidats (le score que chaque offre
+a dans le deck de chacun) en un produit de matrices creuses, et scores_for() donne les
+meilleures offres d'un profil modifié.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional
+
+import numpy as np # type: ignore
+from scipy import sparse # type: ignore
+from sqlalchemy import func # type: ignore
+
+import models
+
+STOP_WORDS = {
+    # Français
+    "au", "aux", "avec", "ce", "ces", "dans", "de", "des", "du", "en", "et", "la", "le",
+    "les", "leur", "ou", "par", "pas", "pour", "qui", "que", "sur", "un", "une", "vous",
+    "nous", "est", "son", "sa", "ses", "se", "ne", "plus",
+    # Anglais
+    "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of",
+    "on", "or", "the", "to", "with", "we", "you", "our",
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+
+# Intervalle minimal entre deux rattrapages depuis la base (offres créées par un autre worker)
+SYNC_INTERVAL_SECONDS = 5.0
+# Lignes lues par requête au chargement et au rattrapage
+SYNC_BATCH_SIZE = 5000
+
+# Les normes des offres dépendent de l'IDF, donc du nombre d'offres. On ne les recalcule
+# toutes que lorsque ce nombre a bougé de plus de 1 % ; entre-temps l'écart est négligeable.
+NORM_REFRESH_DRIFT = 0.01
+
+# Profils modifiés, offres créées et clôturées : relus depuis (dernier horodatage vu - marge), une
+# transaction pouvant commiter après une ligne plus récente
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """Minuscules, sans accents, découpé sur tout ce qui n'est pas alphanumérique ("C++" et "C#" sont gardés)."""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return [t for t in TOKEN_RE.findall(text) if t not in STOP_WORDS and (len(t) > 1 or t in ("c", "r"))]
+
+
+def item_terms(title: Optional[str], description: Optional[str]) -> Counter:
+    # Le titre compte double : "Développeur Flutter" en dit plus qu'une mention dans la description
+    terms = Counter(tokenize(description))
+    for term in tokenize(title):
+        terms[term] += 2
+    return terms
+
+
+class _Postings:
+    """Liste des lignes contenant un terme, avec le poids du terme dans chacune."""
+    __slots__ = ("rows", "weights", "size")
+
+    def __init__(self, rows=None, weights=None):
+        self.rows = np.zeros(4, dtype=np.int32) if rows is None else rows
+        self.weights = np.zeros(4, dtype=np.float32) if weights is None else weights
+        self.size = 0 if rows is None else rows.size
+
+    def extend(self, rows: np.ndarray, weights: np.ndarray):
+        end = self.size + rows.size
+        if end > self.rows.size:
+            self.rows = _grow(self.rows, end)
+            self.weights = _grow(self.weights, end)
+        self.rows[self.size:end] = rows
+        self.weights[self.size:end] = weights
+        self.size = end
+
+
+class RelevanceIndex:
+    def __init__(self, model):
+        self._model = model
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._published_synced_at = None  # dernier published_at vu
+        self._closed_synced_at = None  # dernier closed_at vu
+        self._last_sync = 0.0
+
+        self.vocabulary: dict[str, int] = {}
+        self._df = np.zeros(1024, dtype=np.float64)
+        self._postings: list[_Postings] = []
+
+        # Buffers CSR qui grossissent par doublement : ajouter une ligne est amorti O(nnz de la ligne)
+        self._indptr = np.zeros(1025, dtype=np.int64)
+        self._indices = np.zeros(16384, dtype=np.int32)
+        self._data = np.zeros(16384, dtype=np.float32)
+        self._item_ids = np.zeros(1024, dtype=np.int64)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._norms = np.zeros(1024, dtype=np.float64)
+        self._n_rows = 0
+        self._nnz = 0
+        self._n_alive = 0
+        self._norms_n_docs = 0
+        self._row_of: dict[int, int] = {}
+
+    # --- Écriture ---------------------------------------------------------
+
+    def add(self, item_id: int, title: Optional[str], description: Optional[str]):
+        """Indexe (ou ré-indexe) une seule offre. Sans effet tant que l'index n'a pas été chargé."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._add(item_id, item_terms(title, description))
+            self._refresh_norms()
+
+    def add_many(self, items: Iterable[tuple[int, Optional[str], Optional[str]]]):
+        """Indexe un lot de (id, titre, description) en une passe (imports en masse). Même condition que add()."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._add_batch([(item_id, item_terms(title, description)) for item_id, title, description in items])
+            self._refresh_norms()
+
+    def add_missing(self, items: Iterable[tuple[int, Optional[str], Optional[str]]]):
+        """Comme add_many, pour ceux de ces éléments que l'index n'a pas encore (créés par un autre worker depuis sync())."""
+        with self._lock:
+            if not self._loaded:
+                return
+            missing = [(item_id, item_terms(title, description)) for item_id, title, description in items if item_id not in self._row_of]
+            if missing:
+                self._add_batch(missing)
+                self._refresh_norms()
+
+    def remove(self, item_id: int):
+        self.remove_many([item_id])
+
+    def remove_many(self, item_ids: Iterable[int]):
+        """Retire des offres (clôturées) de l'index. Les ids absents sont ignorés."""
+        with self._lock:
+            for item_id in item_ids:
+                self._remove(item_id)
+            self._refresh_norms()
+
+    def _add(self, item_id: int, terms: Counter):
+        self._add_batch([(item_id, terms)])
+
+    def _add_batch(self, batch: list[tuple[int, Counter]]):
+        """Ajoute un lot de lignes en une passe vectorisée (chargement initial et rattrapage)."""
+        for item_id, _ in batch:
+            self._remove(item_id)
+        vocabulary = self.vocabulary
+        columns, counts, lengths = [], [], []
+        for _, terms in batch:
+            for term, count in terms.items():
+                column = vocabulary.get(term)
+                if column is None:
+                    column = len(vocabulary)
+                    vocabulary[term] = column
+                    self._postings.append(_Postings())
+                columns.append(column)
+                counts.append(count)
+            lengths.append(len(terms))
+        columns = np.array(columns, dtype=np.int32)
+        weights = (1.0 + np.log(np.array(counts, dtype=np.float32))).astype(np.float32)
+        if len(vocabulary) > self._df.size:
+            self._df = _grow(self._df, len(vocabulary))
+
+        first_row, n_new = self._n_rows, len(batch)
+        if first_row + n_new > self._item_ids.size:
+            self._item_ids = _grow(self._item_ids, first_row + n_new)
+            self._alive = _grow(self._alive, first_row + n_new)
+            self._norms = _grow(self._norms, first_row + n_new)
+        if first_row + n_new + 1 > self._indptr.size:
+            self._indptr = _grow(self._indptr, first_row + n_new + 1)
+        start, end = self._nnz, self._nnz + columns.size
+        if end > self._indices.size:
+            self._indices = _grow(self._indices, end)
+            self._data = _grow(self._data, end)
+
+        rows = np.arange(first_row, first_row + n_new, dtype=np.int32)
+        entry_rows = np.repeat(rows, lengths)
+        self._indices[start:end] = columns
+        self._data[start:end] = weights
+        self._indptr[first_row + 1:first_row + n_new + 1] = start + np.cumsum(lengths)
+        self._df[:len(vocabulary)] += np.bincount(columns, minlength=len(vocabulary))
+        for row, (item_id, _) in zip(range(first_row, first_row + n_new), batch):
+            self._item_ids[row] = item_id
+            self._row_of[item_id] = row
+        self._alive[first_row:first_row + n_new] = True
+        self._nnz = end
+        self._n_rows += n_new
+        self._n_alive += n_new
+
+        # Index inversé : on regroupe les entrées du lot par terme
+        order = np.argsort(columns, kind="stable")
+        sorted_columns = columns[order]
+        bounds = np.flatnonzero(np.diff(sorted_columns)) + 1
+        for lo, hi in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [sorted_columns.size]))):
+            if lo < hi:
+                self._postings[sorted_columns[lo]].extend(entry_rows[order[lo:hi]], weights[order[lo:hi]])
+
+        # Normes des nouvelles lignes avec l'IDF courant ; les autres attendent _refresh_norms()
+        idf = self._idf(self._n_alive, self._df[columns])
+        squared = np.bincount(entry_rows - first_row, weights=(weights * idf) ** 2, minlength=n_new)
+        self._norms[first_row:first_row + n_new] = np.sqrt(squared)
+
+    def _remove(self, item_id: int):
+        row = self._row_of.pop(item_id, None)
+        if row is None:
+            return
+        start, end = self._indptr[row], self._indptr[row + 1]
+        self._df[self._indices[start:end]] -= 1
+        self._alive[row] = False
+        self._n_alive -= 1
+        # Les lignes mortes restent dans les buffers ; on compacte quand elles deviennent majoritaires
+        if self._n_rows > 1024 and self._n_alive < self._n_rows // 2:
+            self._compact()
+
+    def _compact(self):
+        # Nouveaux buffers plutôt qu'une réécriture sur place : un rank() en cours garde ses vues intactes
+        rows = np.flatnonzero(self._alive[:self._n_rows])
+        matrix = self._matrix()[rows]
+        self._n_rows = rows.size
+        self._nnz = matrix.nnz
+        self._indptr = _resized(matrix.indptr, self._indptr.size)
+        self._indices = _resized(matrix.indices, self._indices.size)
+        self._data = _resized(matrix.data, self._data.size)
+        self._item_ids = _resized(self._item_ids[rows], self._item_ids.size)
+        self._alive = _resized(np.ones(self._n_rows, dtype=bool), self._alive.size)
+        self._norms = _resized(self._norms[rows], self._norms.size)
+        self._row_of = {int(item_id): row for row, item_id in enumerate(self._item_ids[:self._n_rows])}
+        columns = matrix.tocsc()
+        self._postings = [
+            _Postings(
+                columns.indices[columns.indptr[c]:columns.indptr[c + 1]].astype(np.int32),
+                columns.data[columns.indptr[c]:columns.indptr[c + 1]].astype(np.float32),
+            )
+            for c in range(len(self.vocabulary))
+        ]
+
+    def _refresh_norms(self):
+        if abs(self._n_alive - self._norms_n_docs) <= NORM_REFRESH_DRIFT * self._norms_n_docs:
+            return
+        # Même largeur que _matrix() (au moins une colonne, même sans aucun terme)
+        idf = self._idf(self._n_alive, self._df[:max(len(self.vocabulary), 1)])
+        squared = self._matrix(self._data[:self._nnz].astype(np.float64) ** 2)
+        self._norms = _resized(np.sqrt(squared @ (idf ** 2)), self._norms.size)
+        self._norms_n_docs = self._n_alive
+
+    # --- Synchronisation avec la base --------------------------------------
+
+    def sync(self, db):
+        """
+        Charge l'index au premier appel (offres en ligne seulement), puis rattrape les lignes
+        créées et les clôtures depuis (par exemple par un autre worker). Les lignes déjà
+        indexées via add() ne sont pas relues.
+
+        Les requêtes sont lues entièrement (.all()) avant de prendre le verrou : en mode async,
+        sync() tourne dans un greenlet qui rend la main à la boucle à chaque lecture, et une
+        autre requête bloquée sur le verrou bloquerait toute la boucle.
+        """
+        if self._loaded and time.monotonic() - self._last_sync < SYNC_INTERVAL_SECONDS:
+            return
+        model = self._model
+        if self._loaded:
+            # Les requêtes concurrentes ne relancent pas le même rattrapage
+            self._last_sync = time.monotonic()
+            closed = db.query(model.id, model.closed_at).filter(model.closed_at.isnot(None))
+            if self._closed_synced_at is not None:
+                closed = closed.filter(model.closed_at > self._closed_synced_at - SYNC_OVERLAP)
+            closed = closed.all()
+            with self._lock:
+                for item_id, closed_at in closed:
+                    self._remove(item_id)
+                    self._closed_synced_at = max(self._closed_synced_at or closed_at, closed_at)
+            # Créations : relues depuis (dernier published_at vu - marge), comme les clôtures. Un
+            # id plus petit que ceux déjà vus peut commiter après eux ; published_at (début de sa
+            # transaction) reste dans la marge. Seuls les textes des ids inconnus sont relus.
+            recent = db.query(model.id, model.published_at).filter(model.closed_at.is_(None))
+            if self._published_synced_at is not None:
+                recent = recent.filter(model.published_at > self._published_synced_at - SYNC_OVERLAP)
+            recent = recent.all()
+            with self._lock:
+                unseen = [item_id for item_id, _ in recent if item_id not in self._row_of]
+            for start in range(0, len(unseen), SYNC_BATCH_SIZE):
+                self._add_rows(
+                    db.query(model.id, model.title, model.description)
+                    .filter(model.id.in_(unseen[start:start + SYNC_BATCH_SIZE]), model.closed_at.is_(None))
+                    .all()
+                )
+            if recent:
+                latest = max(published_at for _, published_at in recent)
+                self._published_synced_at = max(self._published_synced_at or latest, latest)
+        else:
+            # Chargement complet, sans les offres clôturées : seules les clôtures suivantes seront à retirer
+            self._closed_synced_at = db.query(func.max(model.closed_at)).scalar()
+            self._published_synced_at = db.query(func.max(model.published_at)).scalar()
+            # Par pages de SYNC_BATCH_SIZE, le verrou n'étant tenu que pour ajouter chaque page
+            after = 0
+            while True:
+                rows = (
+                    db.query(model.id, model.title, model.description)
+                    .filter(model.id > after, model.closed_at.is_(None))
+                    .order_by(model.id)
+                    .limit(SYNC_BATCH_SIZE)
+                    .all()
+                )
+                self._add_rows(rows)
+                if len(rows) < SYNC_BATCH_SIZE:
+                    break
+                after = rows[-1].id
+        with self._lock:
+            self._refresh_norms()
+            self._loaded = True
+            self._last_sync = time.monotonic()
+
+    def _add_rows(self, rows):
+        # Tokenisation hors du verrou ; sans effet sur les lignes déjà indexées (add(), autre sync())
+        batch = [(item_id, item_terms(title, description)) for item_id, title, description in rows]
+        with self._lock:
+            batch = [(item_id, terms) for item_id, terms in batch if item_id not in self._row_of]
+            if batch:
+                self._add_batch(batch)
+
+    # --- Lecture ------------------------------------------------------------
+
+    def _matrix(self, data=None):
+        return sparse.csr_matrix(
+            (self._data[:self._nnz] if data is None else data, self._indices[:self._nnz], self._indptr[:self._n_rows + 1]),
+            shape=(self._n_rows, max(len(self.vocabulary), 1)),
+        )
+
+    def _idf(self, n_docs: int, df: np.ndarray) -> np.ndarray:
+        # IDF lissé : un terme présent partout garde un poids de 1
+        return np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+
+    def rank(
+        self, profile_text: Optional[str], exclude: Iterable[int] = (), cursor: Optional[int] = None, limit: int = 20,
+    ) -> list[int]:
+        """
+        Renvoie les ids des `limit` offres les plus pertinentes pour ce profil, triées par
+        (score décroissant, id croissant), en sautant `exclude` et tout ce qui précède `cursor`
+        (id de la dernière offre reçue) dans cet ordre.
+        """
+        return next(self.ranked(profile_text, exclude, cursor, first=limit), [])
+
+    def ranked(
+        self, profile_text: Optional[str], exclude: Iterable[int] = (), cursor: Optional[int] = None,
+        first: int = 20, largest: int = 2000,
+    ) -> Iterator[list[int]]:
+        """
+        Le classement de rank(), par tranches : les `first` premiers ids, puis la suite par
+        tranches deux fois plus larges à chaque fois (au plus `largest`). Les scores ne sont
+        calculés qu'une fois ; la suite n'est triée, en une fois, que si on la demande.
+        """
+        query_terms = Counter(tokenize(profile_text))
+        with self._lock:
+            n_rows = self._n_rows
+            if n_rows == 0:
+                return
+            item_ids = self._item_ids[:n_rows]
+            norms = self._norms[:n_rows]
+            keep = self._alive[:n_rows].copy()
+            postings = self._query_postings(query_terms)
+            cursor_row = self._row_of.get(cursor) if cursor is not None else None
+            for item_id in exclude:
+                row = self._row_of.get(item_id)
+                if row is not None:
+                    keep[row] = False
+
+        scores = _scores(n_rows, postings, norms)
+
+        if cursor_row is not None:
+            cursor_score = scores[cursor_row]
+            keep &= (scores < cursor_score) | ((scores == cursor_score) & (item_ids > cursor))
+        elif cursor is not None:
+            # Curseur inconnu (offre supprimée) : on repart de l'ordre par id
+            keep &= item_ids > cursor
+
+        # En général assez d'offres ont un score non nul : inutile de trier tout le catalogue
+        matching = keep & (scores > 0)
+        candidates = np.flatnonzero(matching if np.count_nonzero(matching) >= first else keep)
+        if candidates.size > first:
+            # Sélection partielle en O(n), puis tri complet seulement sur les ex aequo du seuil
+            candidate_scores = scores[candidates]
+            threshold = np.partition(candidate_scores, candidates.size - first)[candidates.size - first]
+            candidates = candidates[candidate_scores >= threshold]
+        head = candidates[np.lexsort((item_ids[candidates], -scores[candidates]))[:first]]
+        yield [int(item_id) for item_id in item_ids[head]]
+        if head.size < first:
+            return
+
+        keep[head] = False
+        rest = np.flatnonzero(keep)
+        rest = rest[np.lexsort((item_ids[rest], -scores[rest]))]
+        start, size = 0, first
+        while start < rest.size:
+            size = min(size * 2, largest)
+            yield [int(item_id) for item_id in item_ids[rest[start:start + size]]]
+            start += size
+
+    def scores_for(self, profile_text: Optional[str], limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """(ids, scores) des `limit` offres de meilleur score (non nul) pour ce profil, le score de rank(), par score décroissant."""
+        query_terms = Counter(tokenize(profile_text))
+        with self._lock:
+            n_rows = self._n_rows
+            item_ids = self._item_ids[:n_rows]
+            norms = self._norms[:n_rows]
+            alive = self._alive[:n_rows].copy()
+            postings = self._query_postings(query_terms)
+        scores = _scores(n_rows, postings, norms)
+        matching = np.flatnonzero(alive & (scores > 0))
+        top = matching[_top(scores[matching], item_ids[matching], limit)]
+        return item_ids[top], scores[top]
+
+    def top_profiles(self, item_ids: list[int], profiles: dict[int, Counter], limit: int) -> list[list[tuple[int, float]]]:
+        """
+        Pour chaque offre de `item_ids`, les `limit` profils ({user_id: termes de tokenize()}) où
+        elle a le meilleur score, en (user_id, score) par score décroissant : le score que rank()
+        lui donne dans le deck de chaque profil. Un seul produit de matrices creuses par lot,
+        (offres x termes) @ (termes x profils) ; une offre absente de l'index n'a aucun profil.
+        """
+        user_ids = np.fromiter(profiles, dtype=np.int64, count=len(profiles))
+        with self._lock:
+            n_rows, n_terms = self._n_rows, max(len(self.vocabulary), 1)
+            positions = [(position, row) for position, row in enumerate(map(self._row_of.get, item_ids)) if row is not None]
+            if not positions or not profiles:
+                return [[] for _ in item_ids]
+            idf = self._idf(self._n_alive, self._df[:n_terms])
+            norms = self._norms[[row for _, row in positions]]
+            select_rows = sparse.csr_matrix(
+                (np.ones(len(positions)), ([position for position, _ in positions], [row for _, row in positions])),
+                shape=(len(item_ids), n_rows),
+            )
+            items = select_rows @ self._matrix().astype(np.float64)
+            # Profils : mêmes poids que rank() (termes connus de l'index, idf courant, norme du profil)
+            columns, weights, indptr = [], [], [0]
+            vocabulary = self.vocabulary
+            for terms in profiles.values():
+                known = [(vocabulary[term], count) for term, count in terms.items() if term in vocabulary]
+                if known:
+                    profile_columns = np.array([column for column, _ in known])
+                    profile_weights = (1.0 + np.log([count for _, count in known])) * idf[profile_columns]
+                    columns.extend(profile_columns.tolist())
+                    weights.extend((profile_weights / np.sqrt(np.sum(profile_weights ** 2))).tolist())
+                indptr.append(len(columns))
+
+        inverse_norms = np.zeros(len(item_ids))
+        inverse_norms[[position for position, _ in positions]] = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        items = sparse.diags(inverse_norms) @ items @ sparse.diags(idf)
+        profile_matrix = sparse.csr_matrix((weights, columns, indptr), shape=(len(profiles), n_terms))
+        scores = (items @ profile_matrix.T).tocsr()
+
+        best = []
+        for position in range(len(item_ids)):
+            start, end = scores.indptr[position], scores.indptr[position + 1]
+            row_scores, row_users = scores.data[start:end], user_ids[scores.indices[start:end]]
+            positive = row_scores > 0
+            row_scores, row_users = row_scores[positive], row_users[positive]
+            top = _top(row_scores, row_users, limit)
+            best.append([(int(user_id), float(score)) for user_id, score in zip(row_users[top], row_scores[top])])
+        return best
+
+    def _query_postings(self, query_terms: Counter) -> list:
+        # Sous le verrou : (poids du terme dans le profil, idf, lignes, poids dans les lignes) par terme connu
+        postings = []
+        for term, count in query_terms.items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                idf = self._idf(self._n_alive, self._df[column])
+                entry = self._postings[column]
+                postings.append(((1.0 + np.log(count)) * idf, idf, entry.rows[:entry.size], entry.weights[:entry.size]))
+        return postings
+
+
+class ProfileIndex:
+    """
+    Profils (Student.skills, HighSchooler.strong_subjects) par terme, pour les decks inverses :
+    les candidats d'une offre sont les profils qui partagent au moins un terme avec elle, trouvés
+    sans parcourir la table. Clés : user_id. add() suit les PATCH de ce worker ; sync() rattrape
+    les profils modifiés ailleurs (colonne updated_at, relue avec une marge pour les transactions
+    commitées en retard).
+    """
+
+    def __init__(self, model, text_column: str):
+        self._model = model
+        self._text_column = text_column
+        self._lock = threading.Lock()
+        self._terms: dict[int, Counter] = {}
+        self._postings: dict[str, set[int]] = {}
+        self._loaded = False
+        self._synced_at = None
+        self._last_sync = 0.0
+
+    def add(self, user_id: int, text: Optional[str]):
+        with self._lock:
+            self._set(user_id, Counter(tokenize(text)))
+
+    def _set(self, user_id: int, terms: Counter):
+        for term in self._terms.pop(user_id, ()):
+            users = self._postings[term]
+            users.discard(user_id)
+            if not users:
+                del self._postings[term]
+        if terms:
+            self._terms[user_id] = terms
+            for term in terms:
+                self._postings.setdefault(term, set()).add(user_id)
+
+    def sync(self, db):
+        # Lecture puis tokenisation hors du verrou, comme RelevanceIndex.sync
+        if self._loaded and time.monotonic() - self._last_sync < SYNC_INTERVAL_SECONDS:
+            return
+        model = self._model
+        if self._loaded:
+            self._last_sync = time.monotonic()
+        query = db.query(model.user_id, getattr(model, self._text_column), model.updated_at)
+        if self._synced_at is not None:
+            query = query.filter(model.updated_at > self._synced_at - SYNC_OVERLAP)
+        profiles = [(user_id, Counter(tokenize(text)), updated_at) for user_id, text, updated_at in query.all()]
+        with self._lock:
+            for user_id, terms, updated_at in profiles:
+                self._set(user_id, terms)
+                if updated_at is not None and (self._synced_at is None or updated_at > self._synced_at):
+                    self._synced_at = updated_at
+            self._loaded = True
+            self._last_sync = time.monotonic()
+
+    def candidates(self, terms: Iterable[str]) -> dict[int, Counter]:
+        """{user_id: termes} des profils qui contiennent au moins un de ces termes."""
+        with self._lock:
+            users = set().union(*(self._postings.get(term, ()) for term in terms))
+            return {user_id: self._terms[user_id] for user_id in users}
+
+
+def _scores(n_rows: int, postings: list, norms: np.ndarray) -> np.ndarray:
+    # Produit scalaire profil x offres : chaque offre apparaît au plus une fois par liste
+    scores = np.zeros(n_rows, dtype=np.float64)
+    query_norm = np.sqrt(sum(weight ** 2 for weight, _, _, _ in postings))
+    for weight, idf, rows, weights in postings:
+        scores[rows] += (weight / query_norm) * idf * weights
+    np.divide(scores, norms, out=scores, where=norms > 0)
+    return scores
+
+
+def _top(scores: np.ndarray, ids: np.ndarray, limit: int) -> np.ndarray:
+    """Positions des `limit` meilleurs (score décroissant, id croissant) : sélection partielle, puis tri du reste."""
+    candidates = np.arange(scores.size)
+    if scores.size > limit:
+        threshold = np.partition(scores, scores.size - limit)[scores.size - limit]
+        candidates = np.flatnonzero(scores >= threshold)
+    return candidates[np.lexsort((ids[candidates], -scores[candidates]))[:limit]]
+
+
+def has_terms(text: Optional[str]) -> bool:
+    return bool(tokenize(text))
+
+
+def _grow(array: np.ndarray, needed: int) -> np.ndarray:
+    size = array.size
+    while size < needed:
+        size *= 2
+    return _resized(array, size)
+
+
+def _resized(array: np.ndarray, size: int) -> np.ndarray:
+    resized = np.zeros(size, dtype=array.dtype)
+    resized[:array.size] = array
+    return resized
+
+
+offer_index = RelevanceIndex(models.Offer)
+formation_index = RelevanceIndex(models.Formation)
+student_index = ProfileIndex(models.Student, "skills")
+high_schooler_index = ProfileIndex(models.HighSchooler, "strong_subjects")
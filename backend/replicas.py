@@ -0,0 +1,168 @@
+"""
+Routage des lectures vers les réplicas (DATABASE_REPLICA_URLS, URLs séparées par des virgules).
+
+get_read_session remplace get_session dans les endpoints de lecture qui tolèrent un léger
+retard (profils, exports). Les écritures, et les lectures qui doivent voir une écriture
+récente (deck, boîte de réception, historique des messages relu après un envoi, remplissage
+du cache du catalogue), restent sur get_session, donc sur le primaire.
+
+Chaque réplica est vérifié au plus toutes les REPLICA_CHECK_SECONDS, au moment d'une lecture :
+- indisponible (connexion impossible, ou coupure constatée pendant une requête) ;
+- en retard de plus de REPLICA_MAX_LAG_SECONDS (PostgreSQL en recovery : âge de la dernière
+  transaction rejouée, 0 quand tout le WAL reçu est rejoué).
+Il est alors écarté jusqu'à la vérification suivante. Sans réplica utilisable, la lecture
+va au primaire. Les réplicas utilisables sont pris à tour de rôle.
+
+Un client qui vient d'écrire peut exiger le primaire avec l'en-tête X-Read-Consistency: strong.
+
+Essai local : deux bases PostgreSQL, ou deux fichiers SQLite (mode sync) :
+    DATABASE_URL=sqlite:///primary.db DATABASE_REPLICA_URLS=sqlite:///replica.db
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Request # type: ignore
+from fastapi.concurrency import run_in_threadpool # type: ignore
+from sqlalchemy import create_engine, event, text # type: ignore
+from sqlalchemy.engine import make_url # type: ignore
+from sqlalchemy.orm import sessionmaker # type: ignore
+
+import database
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+
+CONSISTENCY_HEADER = "x-read-consistency"
+
+POSTGRES_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(url, connect_args=database.sync_connect_args(url), **database.pool_options)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
+        self.async_engine = None
+        if database.DATABASE_MODE == "async":
+            from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine # type: ignore
+
+            self.async_engine = create_async_engine(
+                make_url(url).set(drivername="postgresql+asyncpg"),
+                connect_args=database.async_connect_args(), **database.pool_options,
+            )
+            self.session_factory = async_sessionmaker(
+                bind=self.async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+            )
+        self.available = True
+        self.lag_seconds = 0.0
+        self.checked_at = float("-inf")
+        self._checking = False
+        for engine in filter(None, (self.engine, self.async_engine and self.async_engine.sync_engine)):
+            event.listen(engine, "handle_error", self._on_error)
+
+    @property
+    def usable(self) -> bool:
+        return self.available and self.lag_seconds <= REPLICA_MAX_LAG_SECONDS
+
+    def check(self):
+        """Disponibilité et retard (connexion synchrone, appelée hors de la boucle)."""
+        try:
+            with self.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    self.lag_seconds = float(connection.execute(text(POSTGRES_LAG_QUERY)).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    self.lag_seconds = 0.0
+            if not self.available:
+                logger.info("Replica %s is back", self.name)
+            self.available = True
+        except Exception as exc:
+            if self.available:
+                logger.warning("Replica %s unavailable: %s", self.name, exc)
+            self.available = False
+        finally:
+            self.checked_at = time.monotonic()
+
+    async def refresh(self):
+        if self._checking or time.monotonic() - self.checked_at < REPLICA_CHECK_SECONDS:
+            return
+        self._checking = True
+        try:
+            await run_in_threadpool(self.check)
+        finally:
+            self._checking = False
+
+    def _on_error(self, context):
+        # Coupure pendant une vraie requête : écarté jusqu'à la prochaine vérification
+        if context.is_disconnect:
+            self.available = False
+            self.checked_at = time.monotonic()
+
+
+class ReplicaRouter:
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self._turn = itertools.count()
+        self.stats = {"replica": 0, "primary": 0, "fallback": 0}
+
+    async def pick(self) -> Optional[Replica]:
+        if not self.replicas:
+            return None
+        await asyncio.gather(*(replica.refresh() for replica in self.replicas))
+        usable = [replica for replica in self.replicas if replica.usable]
+        if not usable:
+            return None
+        return usable[next(self._turn) % len(usable)]
+
+    def session_factory(self, replica: Optional[Replica]):
+        if replica is not None:
+            return replica.session_factory
+        return database.AsyncSessionLocal if database.DATABASE_MODE == "async" else database.SessionLocal
+
+
+router = ReplicaRouter(DATABASE_REPLICA_URLS)
+
+
+@asynccontextmanager
+async def read_session_scope(strong: bool = False):
+    """Session de lecture hors injection de dépendances (exports en flux, une par lot)."""
+    replica = None
+    if strong:
+        router.stats["primary"] += 1
+    else:
+        replica = await router.pick()
+        router.stats["replica" if replica is not None else ("fallback" if router.replicas else "primary")] += 1
+    factory = router.session_factory(replica)
+    if database.DATABASE_MODE == "async":
+        async with factory() as db:
+            yield db
+    else:
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+def wants_primary(request: Request) -> bool:
+    return request.headers.get(CONSISTENCY_HEADER, "").lower() == "strong"
+
+
+async def get_read_session(request: Request):
+    """Dépendance des endpoints de lecture : session sur un réplica utilisable, sinon sur le primaire."""
+    async with read_session_scope(strong=wants_primary(request)) as db:
+        yield db
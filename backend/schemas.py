@@ -1,13 +1,17 @@
 from pydantic import BaseModel, ConfigDict # type: ignore
 from models import UserType
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None
     token_type: str
     user: 'User'
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class UserBase(BaseModel):
     email: str
     user_type: UserType
@@ -28,6 +32,8 @@ class User(UserBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+Token.model_rebuild()
+
 class StudentBase(BaseModel):
     user_id: int
     skills: Optional[str] = None
@@ -98,9 +104,42 @@ class UniversityUpdate(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+# Annuaire (GET /users?ids=) : l'utilisateur et le profil de son type (un seul des quatre est
+# rempli), sans les offres / formations des entreprises et universités
+class CompanySummary(CompanyBase):
+    id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class UniversitySummary(UniversityBase):
+    id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class UserWithProfile(User):
+    student: Optional[Student] = None
+    high_schooler: Optional[HighSchooler] = None
+    company: Optional[CompanySummary] = None
+    university: Optional[UniversitySummary] = None
+
+# Deck inverse d'une offre / formation : candidats de sa shortlist, meilleur score d'abord
+class Candidate(UserWithProfile):
+    score: float
+
+# Page de profil (GET /profiles/{user_id}) : champs de User, du schéma du profil (Student,
+# HighSchooler, CompanySummary, UniversitySummary) et d'Offer / Formation. Avec ?fields=,
+# seuls les groupes et champs demandés sont présents.
+class ProfilePage(BaseModel):
+    user: Optional[dict] = None
+    profile: Optional[dict] = None
+    items: Optional[list[dict]] = None
+    next_cursor: Optional[int] = None
+
 class OfferBase(BaseModel):
     title: str
     description: str
+    level: Optional[str] = None
+    expires_at: Optional[datetime] = None # clôture automatique passé cette date (lifecycle.py)
     company_id: int
 
 class OfferCreate(OfferBase):
@@ -108,12 +147,16 @@ class OfferCreate(OfferBase):
 
 class Offer(OfferBase):
     id: int
+    published_at: Optional[datetime] = None
+    closed_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 class FormationBase(BaseModel):
     title: str
     description: str
+    level: Optional[str] = None
+    expires_at: Optional[datetime] = None # clôture automatique passé cette date (lifecycle.py)
     university_id: int
 
 class FormationCreate(FormationBase):
@@ -121,12 +164,47 @@ class FormationCreate(FormationBase):
 
 class Formation(FormationBase):
     id: int
+    published_at: Optional[datetime] = None
+    closed_at: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)
 
 Company.model_rebuild()
 University.model_rebuild()
 
+# Import en masse (CSV / NDJSON) d'offres ou de formations
+class ImportRowError(BaseModel):
+    line: int # ligne du fichier où commence l'enregistrement
+    errors: list[dict]
+
+class ImportSummary(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    errors: list[ImportRowError]
+    errors_truncated: bool = False # au-delà de catalog_import.MAX_REPORTED_ERRORS
+
+# Facettes : nombre d'éléments par valeur, par filtre ({"industry": [...], "level": [...]})
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+Facets = dict[str, list[FacetCount]]
+
+# Pages de la pile de swipe : next_cursor est l'id à renvoyer pour la page suivante,
+# prefetch le nombre de cartes restantes à partir duquel l'app doit la demander.
+class OfferDeck(BaseModel):
+    items: list[Offer]
+    next_cursor: Optional[int] = None
+    prefetch: int
+    facets: Optional[Facets] = None # première page seulement
+
+class FormationDeck(BaseModel):
+    items: list[Formation]
+    next_cursor: Optional[int] = None
+    prefetch: int
+    facets: Optional[Facets] = None
+
 class ConversationBase(BaseModel):
     participant1_id: int
     participant2_id: int
@@ -144,13 +222,14 @@ class MessageBase(BaseModel):
     content: str
     sender_id: int
     conversation_id: int
-    timestamp: str
 
+# L'horodatage est fixé par le serveur (un éventuel "timestamp" envoyé par le client est ignoré)
 class MessageCreate(MessageBase):
     pass
 
 class Message(MessageBase):
     id: int
+    timestamp: datetime
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -161,9 +240,24 @@ class ConversationDetail(BaseModel):
     id: int
     other_participant: User
     last_message: Optional[Message] = None
+    last_activity_at: Optional[datetime] = None
+    last_read_message_id: Optional[int] = None
+    unread_count: int = 0
 
     model_config = ConfigDict(from_attributes=True)
 
+# État de lecture (POST /conversations/{id}/read) et badge (GET /me/unread)
+class MarkRead(BaseModel):
+    message_id: Optional[int] = None # dernier message affiché ; par défaut, le dernier de la conversation
+
+class ReadState(BaseModel):
+    last_read_message_id: Optional[int] = None
+    unread_count: int
+
+class UnreadSummary(BaseModel):
+    total: int
+    conversations: dict[int, int] # id de conversation -> non-lus, pour celles qui en ont
+
 
 
 
@@ -179,6 +273,7 @@ class Match(BaseModel):
     user_id: int
     offer_id: Optional[int] = None
     formation_id: Optional[int] = None
+    is_like: bool = True
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -188,5 +283,46 @@ class MatchResponse(BaseModel):
     is_new_conversation: bool
     conversation_id: Optional[int] = None
 
+# Swipes envoyés en lot (actions mises en file hors connexion par l'application)
+class SwipeItem(BaseModel):
+    offer_id: Optional[int] = None
+    formation_id: Optional[int] = None
+    is_like: bool = True
+
+class MatchBatchCreate(BaseModel):
+    user_id: int
+    items: list[SwipeItem]
+
+class MatchBatchItemResult(BaseModel):
+    index: int # position dans la requête
+    status: str # "created", "duplicate", "invalid" ou "not_found"
+    match_id: Optional[int] = None
+    conversation_id: Optional[int] = None
+    is_new_conversation: bool = False
+
+class MatchBatchResponse(BaseModel):
+    created: int
+    results: list[MatchBatchItemResult]
+
 class DeviceTokenUpdate(BaseModel):
     device_token: str
+
+# Tableaux de bord entreprise / université (compteurs tenus à jour par crud._record_swipe_stats)
+class StatCounters(BaseModel):
+    swipes: int = 0 # utilisateurs distincts ayant swipé, likes compris
+    likes: int = 0
+    conversations_opened: int = 0
+
+class DailyStats(StatCounters):
+    day: date
+
+class CatalogItemStats(StatCounters):
+    id: int # id de l'offre ou de la formation
+    title: Optional[str] = None
+    daily: list[DailyStats] # jours sans activité omis
+
+class CatalogDashboard(BaseModel):
+    owner_id: int # id de l'entreprise ou de l'université
+    since: date
+    totals: StatCounters
+    items: list[CatalogItemStats]
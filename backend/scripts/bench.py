@@ -0,0 +1,329 @@
+"""
+Banc d'essai des endpoints chauds : charge mixte, percentiles de latence et nombre de
+requêtes SQL par requête HTTP, résultats en JSON pour comparer les commits entre eux.
+
+L'application tourne dans le processus (httpx + ASGITransport, démarrage/arrêt compris) :
+on mesure le serveur et la base, pas le réseau. La base est :
+- SQLite (--sqlite) : fichier temporaire créé par create_all, rien à installer ;
+- PostgreSQL (DATABASE_URL / POSTGRES_*) : base migrée (alembic upgrade head) et dédiée
+  au banc, vidée au départ (--reset obligatoire, TRUNCATE de toutes les tables).
+
+Le jeu de données (étudiants, entreprises, offres, swipes, conversations, messages) et le
+tirage des opérations sont déterministes (--seed). Chaque client virtuel enchaîne les
+opérations de WORKLOAD selon leurs poids. Le login coûte un bcrypt, comme en production :
+BCRYPT_ROUNDS (voir passwords.py) permet d'en réduire la part sur une petite machine.
+
+    cd backend && python scripts/bench.py --sqlite --output bench.json
+    cd backend && python scripts/bench.py --reset --compare bench.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "bench-password"
+
+# (nom, poids) : la part de chaque opération dans la charge
+WORKLOAD = [
+    ("login", 1),
+    ("catalog", 4),
+    ("deck", 3),
+    ("swipe", 3),
+    ("inbox", 2),
+    ("send_message", 2),
+    ("read_messages", 3),
+]
+
+# Requêtes SQL de la requête HTTP en cours (la requête s'exécute dans la tâche du client)
+statement_counter: contextvars.ContextVar = contextvars.ContextVar("statement_counter", default=None)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite", action="store_true", help="base SQLite temporaire au lieu de PostgreSQL")
+    parser.add_argument("--reset", action="store_true", help="vider la base PostgreSQL avant le banc")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--companies", type=int, default=50)
+    parser.add_argument("--offers-per-company", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=3000, help="requêtes mesurées (hors échauffement)")
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="fichier JSON des résultats")
+    parser.add_argument("--compare", help="résultats JSON d'un run précédent à comparer")
+    return parser.parse_args()
+
+
+def seed_dataset(args, rng: random.Random) -> dict:
+    from sqlalchemy import insert # type: ignore
+
+    import models
+    from database import SessionLocal
+    from passwords import pwd_context
+
+    hashed_password = pwd_context.hash(PASSWORD)
+    db = SessionLocal()
+    try:
+        def users(prefix, user_type, count):
+            return db.execute(insert(models.User).returning(models.User.id), [
+                {"email": f"{prefix}-{i}@bench.invalid", "hashed_password": hashed_password, "is_active": True,
+                 "user_type": user_type, "first_name": prefix.title(), "last_name": str(i)}
+                for i in range(count)
+            ]).scalars().all()
+
+        student_ids = users("student", models.UserType.STUDENT, args.students)
+        company_user_ids = users("company", models.UserType.COMPANY, args.companies)
+        db.execute(insert(models.Student), [{"user_id": user_id, "skills": "python sql"} for user_id in student_ids])
+        company_ids = db.execute(insert(models.Company).returning(models.Company.id, models.Company.user_id), [
+            {"user_id": user_id} for user_id in company_user_ids
+        ]).all()
+        offer_owners = dict(db.execute(insert(models.Offer).returning(models.Offer.id, models.Offer.company_id), [
+            {"title": f"Offre {company_id}-{i}", "description": "Stage développeur python sql " * 4, "company_id": company_id}
+            for company_id, _ in company_ids for i in range(args.offers_per_company)
+        ]).all())
+        offer_ids = sorted(offer_owners)
+        company_owner = dict(company_ids)
+
+        # Historique : chaque étudiant a déjà swipé quelques offres et discute avec leurs entreprises
+        matches, pairs = [], set()
+        for student_id in student_ids:
+            for offer_id in rng.sample(offer_ids, 5):
+                matches.append({"user_id": student_id, "offer_id": offer_id, "is_like": True})
+                pairs.add(tuple(sorted((student_id, company_owner[offer_owners[offer_id]]))))
+        db.execute(insert(models.Match), matches)
+        conversations = db.execute(insert(models.Conversation).returning(
+            models.Conversation.id, models.Conversation.participant1_id, models.Conversation.participant2_id
+        ), [
+            {"participant1_id": participant1_id, "participant2_id": participant2_id} for participant1_id, participant2_id in sorted(pairs)
+        ]).all()
+        db.execute(insert(models.Message), [
+            {"content": f"Message {i}", "sender_id": (participant1_id, participant2_id)[i % 2], "conversation_id": conversation_id}
+            for conversation_id, participant1_id, participant2_id in conversations for i in range(10)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    conversations_by_user = {}
+    for conversation_id, participant1_id, participant2_id in conversations:
+        for user_id in (participant1_id, participant2_id):
+            conversations_by_user.setdefault(user_id, []).append(conversation_id)
+    return {
+        "students": [(user_id, i) for i, user_id in enumerate(student_ids)],
+        "offers": offer_ids,
+        "conversations": conversations_by_user,
+    }
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Client:
+    """Un client virtuel : un étudiant, son jeton, ses conversations."""
+
+    def __init__(self, http, data: dict, student, rng: random.Random, samples: dict, recording):
+        self.http = http
+        self.data = data
+        self.user_id, self.index = student
+        self.email = f"student-{self.index}@bench.invalid"
+        self.conversations = data["conversations"].get(self.user_id, [])
+        self.rng = rng
+        self.samples = samples
+        self.recording = recording
+        self.token = None
+
+    async def request(self, operation: str, method: str, url: str, expected=(200,), **kwargs):
+        counter = [0]
+        statement_counter.set(counter)
+        started = time.perf_counter()
+        response = await self.http.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        if self.recording():
+            sample = self.samples.setdefault(operation, {"latencies": [], "statements": [], "errors": 0})
+            sample["latencies"].append(elapsed)
+            sample["statements"].append(counter[0])
+            sample["errors"] += response.status_code not in expected
+        return response
+
+    async def login(self):
+        response = await self.request("login", "POST", "/token", data={"username": self.email, "password": PASSWORD})
+        if response.status_code == 200:
+            self.token = response.json()["access_token"]
+
+    async def run(self, operation: str):
+        if operation == "login" or self.token is None:
+            return await self.login()
+        if operation == "catalog":
+            skip = self.rng.randrange(0, max(1, len(self.data["offers"]) - 20), 20)
+            return await self.request("catalog", "GET", f"/offers/?skip={skip}&limit=20")
+        if operation == "deck":
+            return await self.request("deck", "GET", "/me/deck/offers", headers={"Authorization": f"Bearer {self.token}"})
+        if operation == "swipe":
+            offer_id = self.rng.choice(self.data["offers"])
+            return await self.request("swipe", "POST", "/api/matches/", json={"user_id": self.user_id, "offer_id": offer_id})
+        if operation == "inbox":
+            return await self.request("inbox", "GET", f"/users/{self.user_id}/conversations/")
+        if not self.conversations:
+            return await self.request("inbox", "GET", f"/users/{self.user_id}/conversations/")
+        conversation_id = self.rng.choice(self.conversations)
+        if operation == "send_message":
+            return await self.request("send_message", "POST", "/messages/", json={
+                "content": "Bonjour, je suis intéressé", "sender_id": self.user_id, "conversation_id": conversation_id,
+            })
+        return await self.request("read_messages", "GET", f"/conversations/{conversation_id}/messages/")
+
+
+async def drive(app, data: dict, args) -> tuple[dict, float]:
+    import httpx # type: ignore
+
+    samples: dict = {}
+    operations, weights = zip(*WORKLOAD)
+    total = args.warmup + args.requests
+    issued = 0
+    measuring = {"on": False, "started": 0.0}
+
+    def next_slot():
+        nonlocal issued
+        if issued >= total:
+            return None
+        issued += 1
+        if issued == args.warmup + 1:
+            measuring["on"], measuring["started"] = True, time.perf_counter()
+        return issued
+
+    async def worker(number: int):
+        rng = random.Random(args.seed * 1000 + number)
+        client = Client(http, data, data["students"][number % len(data["students"])], rng, samples, lambda: measuring["on"])
+        while next_slot() is not None:
+            await client.run(rng.choices(operations, weights)[0])
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+    return samples, time.perf_counter() - measuring["started"]
+
+
+def summarize(samples: dict, duration: float) -> dict:
+    def stats(latencies, statements, errors):
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": round(len(latencies) / duration, 1) if duration else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "statements_per_request": round(sum(statements) / len(statements), 2) if statements else 0.0,
+        }
+
+    endpoints = {operation: stats(**sample) for operation, sample in sorted(samples.items())}
+    overall = stats(
+        [latency for sample in samples.values() for latency in sample["latencies"]],
+        [count for sample in samples.values() for count in sample["statements"]],
+        sum(sample["errors"] for sample in samples.values()),
+    )
+    return {"overall": overall, "endpoints": endpoints}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict, previous=None):
+    header = f"{'opération':<15}{'req':>7}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'SQL/req':>9}"
+    print(header)
+    rows = list(report["results"]["endpoints"].items()) + [("TOTAL", report["results"]["overall"])]
+    for name, stats in rows:
+        line = (
+            f"{name:<15}{stats['requests']:>7}{stats['errors']:>5}{stats['throughput_rps']:>9}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['statements_per_request']:>9}"
+        )
+        if previous is not None:
+            before = previous["overall"] if name == "TOTAL" else previous["endpoints"].get(name)
+            if before and before["p95_ms"]:
+                line += f"   p95 {100 * (stats['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.0f}%"
+                line += f"   SQL/req {stats['statements_per_request'] - before['statements_per_request']:+.2f}"
+        print(line)
+
+
+def main() -> int:
+    args = parse_args()
+    if args.sqlite:
+        database_file = tempfile.NamedTemporaryFile(prefix="rezo-bench-", suffix=".db", delete=False).name
+        os.environ["DATABASE_URL"] = f"sqlite:///{database_file}"
+        os.environ["DATABASE_MODE"] = "sync"
+
+    from sqlalchemy import event # type: ignore
+
+    import database
+    import models
+
+    if database.engine.dialect.name == "sqlite":
+        models.Base.metadata.create_all(bind=database.engine)
+    elif not args.reset:
+        print("PostgreSQL : --reset requis (la base du banc est vidée au départ)")
+        return 2
+    else:
+        with database.engine.begin() as connection:
+            tables = ", ".join(table.name for table in models.Base.metadata.sorted_tables)
+            connection.exec_driver_sql(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.async_engine is not None else [])
+    for engine in engines:
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            counter = statement_counter.get()
+            if counter is not None:
+                counter[0] += 1
+
+    rng = random.Random(args.seed)
+    data = seed_dataset(args, rng)
+
+    import main as app_module
+
+    samples, duration = asyncio.run(drive(app_module.app, data, args))
+    report = {
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "database": database.engine.dialect.name,
+        "database_mode": database.DATABASE_MODE,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "duration_s": round(duration, 3),
+        "results": summarize(samples, duration),
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)["results"]
+    print_report(report, previous)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.sqlite:
+        database.engine.dispose()
+        os.unlink(database_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
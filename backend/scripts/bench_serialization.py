@@ -0,0 +1,118 @@
+"""
+Compare le débit des grandes listes : chemin ORM + response_model (objets ORM validés par
+pydantic puis encodés avec json, comme FastAPI le fait pour un response_model) contre le
+chemin rapide (lignes projetées + fastjson).
+
+Les données synthétiques sont insérées dans une transaction annulée à la fin ; le script
+marche sur PostgreSQL comme sur SQLite.
+
+    cd backend && python scripts/bench_serialization.py [--rows 5000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter # type: ignore
+from sqlalchemy import insert # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+
+import crud
+import fastjson
+import models
+import schemas
+from database import engine
+
+
+def seed(db: Session, rows: int) -> dict:
+    users = db.execute(insert(models.User).returning(models.User.id), [
+        {"email": f"bench-{role}@example.invalid", "hashed_password": "", "is_active": True,
+         "user_type": user_type, "first_name": "Bench", "last_name": role}
+        for role, user_type in (("company", models.UserType.COMPANY), ("student", models.UserType.STUDENT))
+    ]).scalars().all()
+    company_id = db.execute(insert(models.Company).returning(models.Company.id), {"user_id": users[0]}).scalar_one()
+    db.execute(insert(models.Offer), [
+        {"title": f"Offre {i}", "description": "Description de l'offre " * 8, "company_id": company_id}
+        for i in range(rows)
+    ])
+    conversation_id = db.execute(
+        insert(models.Conversation).returning(models.Conversation.id),
+        {"participant1_id": min(users), "participant2_id": max(users)},
+    ).scalar_one()
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    db.execute(insert(models.Message), [
+        {"content": f"Message {i}", "sender_id": users[i % 2], "conversation_id": conversation_id,
+         "timestamp": start + timedelta(seconds=i)}
+        for i in range(rows)
+    ])
+    db.flush()
+    return {"conversation_id": conversation_id}
+
+
+def response_model_path(schema, load):
+    """Ce que fait FastAPI avec un response_model : validation des objets ORM, puis json.dumps."""
+    adapter = TypeAdapter(list[schema])
+
+    def run():
+        items = adapter.validate_python(load(), from_attributes=True)
+        return json.dumps(adapter.dump_python(items, mode="json"), ensure_ascii=False, separators=(",", ":")).encode()
+    return run
+
+
+def measure(run, repeat: int) -> float:
+    run()  # préchauffage
+    started = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        db = Session(bind=connection, join_transaction_mode="create_savepoint")
+        try:
+            ids = seed(db, args.rows)
+            cases = [
+                (
+                    "offres",
+                    response_model_path(schemas.Offer, lambda: crud.get_offers(db, limit=args.rows)),
+                    lambda: fastjson.dumps(crud.get_offers(db, limit=args.rows, as_rows=True)),
+                ),
+                (
+                    "messages",
+                    response_model_path(schemas.Message, lambda: crud.get_messages_for_conversation(
+                        db, ids["conversation_id"], limit=args.rows)),
+                    lambda: fastjson.dumps(crud.get_messages_for_conversation(
+                        db, ids["conversation_id"], limit=args.rows, as_rows=True)),
+                ),
+            ]
+            for label, current, fast in cases:
+                if json.loads(current()) != json.loads(fast()):
+                    print(f"{label}: les deux chemins ne produisent pas le même JSON")
+                    return 1
+                # Les objets ORM restent dans la session : on la vide pour mesurer des lectures complètes
+                db.expunge_all()
+                current_seconds = measure(lambda: (current(), db.expunge_all()), args.repeat)
+                fast_seconds = measure(fast, args.repeat)
+                print(
+                    f"{label:<10} response_model : {args.rows / current_seconds:>10,.0f} lignes/s   "
+                    f"rapide : {args.rows / fast_seconds:>10,.0f} lignes/s   x{current_seconds / fast_seconds:.1f}"
+                )
+        finally:
+            db.close()
+            transaction.rollback()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Calcule les shortlists des decks inverses pour tout le catalogue en ligne (offres et formations).
+
+Ensuite, la tâche de fond de lifecycle.py les tient à jour (éléments créés, profils modifiés) :
+ce script sert à repartir de zéro après un import direct en base, sans attendre les workers.
+Il remet tout le catalogue en ligne en attente puis calcule les shortlists par lots de
+BATCH_SIZE éléments, un commit par lot.
+
+    cd backend && python scripts/build_shortlists.py [offers|formations]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud
+from database import SessionLocal
+
+BATCH_SIZE = 500
+
+
+def build(kind: str) -> int:
+    item_model = crud.SHORTLISTS[kind].item_model
+    db = SessionLocal()
+    try:
+        db.query(item_model).filter(item_model.closed_at.is_(None)).update(
+            {item_model.shortlisted_at: None}, synchronize_session=False
+        )
+        db.commit()
+        done = 0
+        while True:
+            refreshed = crud.refresh_pending_shortlists(db, kind, BATCH_SIZE)
+            done += len(refreshed)
+            if len(refreshed) < BATCH_SIZE:
+                return done
+    finally:
+        db.close()
+
+
+def main() -> int:
+    kinds = sys.argv[1:] or list(crud.SHORTLISTS)
+    for kind in kinds:
+        if kind not in crud.SHORTLISTS:
+            print(f"Inconnu : {kind} (attendu : {', '.join(crud.SHORTLISTS)})")
+            return 2
+        print(f"{kind} : {build(kind)} shortlists calculées")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
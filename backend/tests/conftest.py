@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+
+# Les modules du backend s'importent à plat (comme depuis backend/) ; aucune base n'est ouverte
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "rezo-tests.db"))
+
+import pytest # type: ignore
+
+
+@pytest.fixture
+def fresh_indexes(monkeypatch):
+    """Index en mémoire neufs (ranking, crud.SHORTLISTS), rattrapés à chaque appel de sync()."""
+    import crud
+    import models
+    import ranking
+
+    monkeypatch.setattr(ranking, "SYNC_INTERVAL_SECONDS", 0)
+    indexes = {
+        "offer_index": ranking.RelevanceIndex(models.Offer),
+        "formation_index": ranking.RelevanceIndex(models.Formation),
+        "student_index": ranking.ProfileIndex(models.Student, "skills"),
+        "high_schooler_index": ranking.ProfileIndex(models.HighSchooler, "strong_subjects"),
+    }
+    for name, index in indexes.items():
+        monkeypatch.setattr(ranking, name, index)
+    monkeypatch.setitem(crud.SHORTLISTS, "offers", crud.SHORTLISTS["offers"]._replace(
+        item_index=indexes["offer_index"], profile_index=indexes["student_index"],
+    ))
+    monkeypatch.setitem(crud.SHORTLISTS, "formations", crud.SHORTLISTS["formations"]._replace(
+        item_index=indexes["formation_index"], profile_index=indexes["high_schooler_index"],
+    ))
+    return indexes
+
+
+@pytest.fixture
+def db(fresh_indexes):
+    """Session sur une base SQLite vide, avec des index en mémoire neufs."""
+    import database
+    import models
+
+    models.Base.metadata.drop_all(bind=database.engine)
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    """make_user(user_type, email=None) : utilisateur et son profil, comme POST /users/."""
+    import crud
+    import models
+    import schemas
+
+    created = []
+
+    def make(user_type: models.UserType, email: str = None):
+        created.append(user_type)
+        user = schemas.UserCreate(
+            email=email or f"{user_type.value}-{len(created)}@example.invalid", user_type=user_type,
+            first_name="Prénom", last_name=str(len(created)), password="x", password_confirm="x",
+        )
+        return crud.create_user(db, user, hashed_password="x")
+
+    return make
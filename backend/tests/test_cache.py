@@ -0,0 +1,33 @@
+import cache
+
+
+def make_store(monkeypatch, ttl: float = 10):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return cache.MemoryResponseStore(maxsize=10, max_bytes=1024, ttl=ttl), now
+
+
+def test_memory_entries_expire_after_ttl(monkeypatch):
+    store, now = make_store(monkeypatch)
+    response = cache.CachedResponse(cache.make_etag(b"[]"), b"[]")
+    store.set("offers", 0, "page", response)
+    now[0] += 9
+    assert store.get("offers", 0, "page") == response
+    # Écriture passée par un autre worker : cette génération n'a pas bougé, seule l'échéance borne le retard
+    now[0] += 2
+    assert store.get("offers", 0, "page") is None
+    assert store.size_bytes == 0
+
+
+def test_memory_invalidate_drops_namespace(monkeypatch):
+    store, _ = make_store(monkeypatch)
+    store.set("offers", 0, "page", cache.CachedResponse('"a"', b"a"))
+    store.set("formations", 0, "page", cache.CachedResponse('"b"', b"b"))
+    store.invalidate("offers")
+    assert store.generation("offers") == 1
+    assert store.get("offers", 0, "page") is None
+    # Page calculée avant l'écriture : pas rangée
+    store.set("offers", 0, "page", cache.CachedResponse('"a"', b"a"))
+    assert store.get("offers", 0, "page") is None
+    assert store.get("formations", 0, "page").body == b"b"
+    assert store.size_bytes == 1
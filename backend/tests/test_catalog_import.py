@@ -0,0 +1,35 @@
+import asyncio
+
+import catalog_import
+import schemas
+
+
+def read_records(data: bytes, file_format: str = catalog_import.CSV):
+    async def chunks():
+        yield data
+
+    async def collect():
+        return [record async for record in catalog_import._records(chunks(), file_format)]
+
+    return asyncio.run(collect())
+
+
+def test_csv_blank_optional_columns_are_none():
+    records = read_records(
+        b"title,description,level,expires_at\n"
+        b"Dev Python,Backend,,\n"
+        b"Data,\"SQL, Python\", ,2030-01-01T00:00:00Z\n"
+    )
+    assert [fields for _, fields, _ in records] == [
+        {"title": "Dev Python", "description": "Backend", "level": None, "expires_at": None},
+        {"title": "Data", "description": "SQL, Python", "level": None, "expires_at": "2030-01-01T00:00:00Z"},
+    ]
+    offers = [schemas.OfferCreate.model_validate({**fields, "company_id": 1}) for _, fields, _ in records]
+    assert [offer.level for offer in offers] == [None, None]
+    assert offers[0].expires_at is None
+    assert offers[1].expires_at.year == 2030
+
+
+def test_csv_blank_required_column_is_reported():
+    (_, fields, _), = read_records(b"title,description\n,Backend\n")
+    assert fields == {"title": None, "description": "Backend"}
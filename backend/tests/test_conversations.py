@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+
+import crud
+import models
+import schemas
+
+
+def open_conversation(db, make_user):
+    student = make_user(models.UserType.STUDENT)
+    company = make_user(models.UserType.COMPANY)
+    conversation = crud.create_conversation(db, schemas.ConversationCreate(participant1_id=student.id, participant2_id=company.id))
+    return student.id, company.id, conversation.id
+
+
+def send(db, conversation_id: int, sender_id: int, content: str = "Bonjour"):
+    return crud.create_message(db, schemas.MessageCreate(content=content, sender_id=sender_id, conversation_id=conversation_id)).id
+
+
+def unread(db, user_id: int):
+    return crud.get_unread_summary(db, user_id)
+
+
+def test_send_counts_unread_for_the_recipient_only(db, make_user):
+    student, company, conversation = open_conversation(db, make_user)
+    for _ in range(3):
+        send(db, conversation, company)
+    assert unread(db, student) == {"total": 3, "conversations": {conversation: 3}}
+    assert unread(db, company) == {"total": 0, "conversations": {}}
+
+    # Répondre vaut lecture pour l'expéditeur
+    reply = send(db, conversation, student)
+    assert unread(db, student)["total"] == 0
+    assert unread(db, company) == {"total": 1, "conversations": {conversation: 1}}
+    [inbox] = crud.get_conversations_for_user(db, student)
+    assert (inbox.last_read_message_id, inbox.unread_count) == (reply, 0)
+
+
+def test_mark_read_up_to_the_last_message(db, make_user):
+    student, company, conversation = open_conversation(db, make_user)
+    last = [send(db, conversation, company) for _ in range(2)][-1]
+    assert crud.mark_conversation_read(db, conversation, student) == {"last_read_message_id": last, "unread_count": 0}
+    assert unread(db, student)["total"] == 0
+    # Au-delà du dernier message : ramené au dernier
+    assert crud.mark_conversation_read(db, conversation, student, message_id=last + 100)["last_read_message_id"] == last
+
+
+def test_mark_read_partially_counts_the_remaining_messages(db, make_user):
+    student, company, conversation = open_conversation(db, make_user)
+    first, _, _ = (send(db, conversation, company) for _ in range(3))
+    assert crud.mark_conversation_read(db, conversation, student, message_id=first) == {"last_read_message_id": first, "unread_count": 2}
+    assert unread(db, student) == {"total": 2, "conversations": {conversation: 2}}
+
+
+def test_mark_read_with_an_older_message_never_moves_back(db, make_user):
+    student, company, conversation = open_conversation(db, make_user)
+    first, second, third = (send(db, conversation, company) for _ in range(3))
+    crud.mark_conversation_read(db, conversation, student)
+    assert crud.mark_conversation_read(db, conversation, student, message_id=first) == {"last_read_message_id": third, "unread_count": 0}
+
+    # Un nouveau message après un marquage partiel ne remet pas les anciens en non-lus
+    fourth = send(db, conversation, company)
+    assert crud.mark_conversation_read(db, conversation, student, message_id=second) == {"last_read_message_id": third, "unread_count": 1}
+    assert crud.mark_conversation_read(db, conversation, student, message_id=fourth)["unread_count"] == 0
+
+
+def test_mark_read_by_a_non_participant(db, make_user):
+    _, company, conversation = open_conversation(db, make_user)
+    send(db, conversation, company)
+    outsider = make_user(models.UserType.STUDENT)
+    assert crud.mark_conversation_read(db, conversation, outsider.id) is None
+    assert crud.mark_conversation_read(db, conversation + 1, company) is None
+
+
+def backdate(db, conversation_id: int, day: int):
+    db.query(models.Conversation).filter(models.Conversation.id == conversation_id).update(
+        {models.Conversation.last_activity_at: datetime(2020, 1, day, tzinfo=timezone.utc)}
+    )
+    db.commit()
+
+
+def test_inbox_summary_follows_the_last_message(db, make_user):
+    student, company, conversation = open_conversation(db, make_user)
+    [empty] = crud.get_conversations_for_user(db, student)
+    assert empty.last_message is None and empty.last_activity_at is not None
+    assert empty.other_participant.id == company
+
+    send(db, conversation, company, "Premier")
+    backdate(db, conversation, 1)
+    last = send(db, conversation, student, "Second")
+    [inbox] = crud.get_conversations_for_user(db, company)
+    assert (inbox.last_message.id, inbox.last_message.content) == (last, "Second")
+    assert inbox.last_activity_at.year > 2020
+    assert inbox.other_participant.id == student
+
+
+def test_inbox_is_ordered_by_last_activity_and_paginated(db, make_user):
+    student, company, older = open_conversation(db, make_user)
+    other_company = make_user(models.UserType.COMPANY).id
+    newer = crud.create_conversation(db, schemas.ConversationCreate(participant1_id=other_company, participant2_id=student)).id
+    backdate(db, older, 1)
+    backdate(db, newer, 2)
+    assert [c.id for c in crud.get_conversations_for_user(db, student)] == [newer, older]
+
+    # Un message remonte sa conversation en tête
+    send(db, older, company)
+    assert [c.id for c in crud.get_conversations_for_user(db, student)] == [older, newer]
+    assert [c.id for c in crud.get_conversations_for_user(db, student, limit=1)] == [older]
+    assert [c.id for c in crud.get_conversations_for_user(db, student, before=older)] == [newer]
+    assert crud.get_conversations_for_user(db, student, before=newer) == []
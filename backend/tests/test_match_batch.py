@@ -0,0 +1,63 @@
+import crud
+import models
+import schemas
+
+
+def catalog(db, make_user):
+    student = make_user(models.UserType.STUDENT)
+    company_user = make_user(models.UserType.COMPANY)
+    company = crud.get_company_by_user_id(db, company_user.id)
+    offers = [
+        crud.create_company_offer(db, schemas.OfferCreate(title=f"Offre {n}", description="python", company_id=company.id), company.id).id
+        for n in range(3)
+    ]
+    return student.id, company_user.id, offers
+
+
+def swipe(db, user_id: int, *items: dict):
+    return crud.create_match_batch(db, user_id, [schemas.SwipeItem(**item) for item in items])
+
+
+def test_batch_statuses(db, make_user):
+    student, company, (first, second, closed) = catalog(db, make_user)
+    crud.close_owned_item(db, "offers", company, closed)
+
+    response = swipe(
+        db, student,
+        {"offer_id": first},
+        {"offer_id": first, "is_like": False},  # même élément plus loin dans le lot
+        {"offer_id": second, "is_like": False},
+        {},  # ni offre ni formation
+        {"offer_id": first, "formation_id": 1},  # les deux
+        {"offer_id": 999},
+        {"offer_id": closed},
+    )
+
+    assert [result["status"] for result in response["results"]] == [
+        "created", "duplicate", "created", "invalid", "invalid", "not_found", "not_found",
+    ]
+    assert [result["index"] for result in response["results"]] == list(range(7))
+    assert response["created"] == 2
+    # Le premier swipe d'un élément dans le lot est celui qui compte
+    likes = dict(db.query(models.Match.offer_id, models.Match.is_like).filter(models.Match.user_id == student))
+    assert likes == {first: True, second: False}
+
+
+def test_batch_skips_swipes_already_recorded(db, make_user):
+    student, _, (first, second, _) = catalog(db, make_user)
+    swipe(db, student, {"offer_id": first})
+    response = swipe(db, student, {"offer_id": first}, {"offer_id": second})
+    assert [result["status"] for result in response["results"]] == ["duplicate", "created"]
+    assert db.query(models.Match).filter(models.Match.user_id == student).count() == 2
+
+
+def test_batch_opens_one_conversation_per_owner(db, make_user):
+    student, company, (first, second, third) = catalog(db, make_user)
+    response = swipe(db, student, {"offer_id": first, "is_like": False}, {"offer_id": second}, {"offer_id": third})
+    passed, opening, joining = response["results"]
+    assert "conversation_id" not in passed
+    assert opening["is_new_conversation"] is True and "is_new_conversation" not in joining
+    assert opening["conversation_id"] == joining["conversation_id"] == crud.get_conversation_between_users(db, student, company).id
+
+    dashboard = crud.get_company_dashboard(db, company)
+    assert dashboard["totals"] == {"swipes": 3, "likes": 2, "conversations_opened": 1}
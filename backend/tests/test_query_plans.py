@@ -0,0 +1,250 @@
+"""
+Vérifie que les requêtes chaudes de crud passent par les index prévus (PostgreSQL seulement).
+
+Tout se passe dans une transaction annulée à la fin : on y insère un jeu de données
+synthétique de forme réaliste (beaucoup de swipes et de conversations par utilisateur),
+on lance ANALYZE pour que le planificateur ait des statistiques, puis chaque vérification
+appelle une fonction de crud, capture le SQL émis et le passe à EXPLAIN (FORMAT JSON).
+Les parcours séquentiels sont ensuite désactivés : sur des tables de cette taille le
+planificateur les préférerait parfois, et c'est l'utilisabilité des index qu'on contrôle.
+Un index attendu peut être un tuple d'alternatives équivalentes.
+
+Ignoré sans TEST_POSTGRES_URL, l'URL d'une base PostgreSQL migrée (qui peut être celle de
+développement : rien n'y reste) :
+
+    cd backend && alembic upgrade head && TEST_POSTGRES_URL=postgresql+psycopg2://... python -m pytest tests/test_query_plans.py
+"""
+import json
+import os
+
+import pytest # type: ignore
+from sqlalchemy import create_engine, event, text # type: ignore
+from sqlalchemy.orm import Session # type: ignore
+
+import crud
+import models
+import ranking
+
+POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL non configurée")
+
+# Jeu de données : (table, requête d'insertion). Les identifiants viennent des séquences.
+SEED = [
+    ("users", """
+        INSERT INTO users (email, hashed_password, is_active, user_type, first_name, last_name)
+        SELECT 'plan-check-' || g || '@example.invalid', '', true,
+               (CASE WHEN g <= 2000 THEN 'STUDENT' WHEN g <= 2500 THEN 'HIGH_SCHOOL'
+                     WHEN g <= 2550 THEN 'COMPANY' ELSE 'UNIVERSITY' END)::usertype,
+               'Plan', 'Check'
+        FROM generate_series(1, 2570) g
+    """),
+    ("students", "INSERT INTO students (user_id, skills) SELECT id, NULL FROM users WHERE user_type = 'STUDENT' AND email LIKE 'plan-check-%'"),
+    ("high_schoolers", "INSERT INTO high_schoolers (user_id) SELECT id FROM users WHERE user_type = 'HIGH_SCHOOL' AND email LIKE 'plan-check-%'"),
+    ("companies", "INSERT INTO companies (user_id, industry) SELECT id, 'Secteur ' || id % 5 FROM users WHERE user_type = 'COMPANY' AND email LIKE 'plan-check-%'"),
+    ("universities", "INSERT INTO universities (user_id) SELECT id FROM users WHERE user_type = 'UNIVERSITY' AND email LIKE 'plan-check-%'"),
+    ("offers", """
+        INSERT INTO offers (title, description, company_id)
+        SELECT 'Offre ' || g, '', c.id FROM generate_series(1, 40) g CROSS JOIN companies c
+    """),
+    ("formations", """
+        INSERT INTO formations (title, description, university_id)
+        SELECT 'Formation ' || g, '', u.id FROM generate_series(1, 25) g CROSS JOIN universities u
+    """),
+    # Historique : catalogue publié depuis longtemps sauf les derniers éléments, trois sur quatre
+    # déjà clôturés, quelques-uns expirés en attente de la purge
+    ("offers", "UPDATE offers SET published_at = now() - interval '30 days' WHERE id % 50 <> 0"),
+    ("offers", "UPDATE offers SET closed_at = now() - interval '1 day' WHERE id % 4 <> 0"),
+    ("offers", "UPDATE offers SET expires_at = now() - interval '1 hour' WHERE closed_at IS NULL AND id % 16 = 0"),
+    ("formations", "UPDATE formations SET closed_at = now() - interval '1 day' WHERE id % 4 <> 0"),
+    ("matches", """
+        INSERT INTO matches (user_id, offer_id)
+        SELECT s.user_id, o.id FROM students s JOIN offers o ON o.id % 40 = s.id % 40
+        ON CONFLICT DO NOTHING
+    """),
+    ("matches", """
+        INSERT INTO matches (user_id, formation_id)
+        SELECT h.user_id, f.id FROM high_schoolers h JOIN formations f ON f.id % 25 = h.id % 25
+        ON CONFLICT DO NOTHING
+    """),
+    ("conversations", """
+        INSERT INTO conversations (participant1_id, participant2_id)
+        SELECT least(s.user_id, c.user_id), greatest(s.user_id, c.user_id)
+        FROM students s JOIN companies c ON c.id % 5 = s.id % 5
+        ON CONFLICT DO NOTHING
+    """),
+    ("messages", """
+        INSERT INTO messages (content, sender_id, conversation_id, timestamp)
+        SELECT 'Message ' || g, c.participant1_id, c.id, now() - g * interval '1 minute'
+        FROM conversations c CROSS JOIN generate_series(1, 10) g
+        WHERE c.participant1_id % 4 = 0
+    """),
+]
+
+SAMPLE_IDS = """
+    SELECT
+        (SELECT min(user_id) FROM students WHERE user_id IN (SELECT id FROM users WHERE email LIKE 'plan-check-%')),
+        (SELECT min(user_id) FROM high_schoolers WHERE user_id IN (SELECT id FROM users WHERE email LIKE 'plan-check-%')),
+        (SELECT min(user_id) FROM companies WHERE user_id IN (SELECT id FROM users WHERE email LIKE 'plan-check-%')),
+        (SELECT max(id) FROM offers WHERE closed_at IS NULL),
+        (SELECT max(conversation_id) FROM messages),
+        (SELECT max(id) FROM messages),
+        (SELECT c.user_id FROM companies c JOIN offers o ON o.company_id = c.id WHERE o.id = (SELECT max(id) FROM offers WHERE closed_at IS NULL))
+"""
+
+CHECKS = [
+    (
+        "conversation entre deux utilisateurs",
+        lambda db, ids: crud.get_conversation_between_users(db, ids["company"], ids["student"]),
+        {"uq_conversations_participants"},
+    ),
+    (
+        "swipe : propriétaire et conversation existante",
+        lambda db, ids: crud._match_counterpart(db, ids["student"], models.Offer.company, ids["offer"]),
+        {"uq_conversations_participants"},
+    ),
+    (
+        "deck d'offres (exclusion des swipes)",
+        lambda db, ids: crud.get_offer_deck(db, user_id=ids["student"]),
+        {"ix_students_user_id", "uq_matches_user_id_offer_id"},
+    ),
+    (
+        "deck de formations (exclusion des swipes)",
+        lambda db, ids: crud.get_formation_deck(db, user_id=ids["high_schooler"]),
+        {"ix_high_schoolers_user_id", "uq_matches_user_id_formation_id"},
+    ),
+    (
+        "historique d'une conversation",
+        lambda db, ids: crud.get_messages_for_conversation(db, conversation_id=ids["conversation"], before=ids["message"]),
+        {"ix_messages_conversation_id_timestamp_id"},
+    ),
+    (
+        "boîte de réception",
+        lambda db, ids: crud.get_conversations_for_user(db, user_id=ids["student"]),
+        # participant1_id est aussi la première colonne de l'index unique de la paire
+        {("ix_conversations_participant1_id_last_activity_at", "uq_conversations_participants"), "ix_conversations_participant2_id_last_activity_at"},
+    ),
+    (
+        "badge des non-lus",
+        lambda db, ids: crud.get_unread_summary(db, user_id=ids["student"]),
+        {("ix_conversations_participant1_id_last_activity_at", "uq_conversations_participants"), "ix_conversations_participant2_id_last_activity_at"},
+    ),
+    (
+        "profil entreprise et ses offres",
+        lambda db, ids: crud.get_company_by_user_id(db, user_id=ids["company"]),
+        {"ix_companies_user_id", "ix_offers_company_id"},
+    ),
+    (
+        "offres filtrées par secteur",
+        lambda db, ids: crud.get_offers(db, industry="Secteur 1", as_rows=True),
+        # Peu d'entreprises par secteur : l'index de la clé étrangère seul est aussi un bon plan
+        {"ix_companies_industry", ("ix_offers_live_company_id_id", "ix_offers_live_id", "ix_offers_company_id")},
+    ),
+    (
+        "liste des offres en ligne",
+        lambda db, ids: crud.get_offers(db, as_rows=True),
+        {"ix_offers_live_id"},
+    ),
+    (
+        "facettes des offres",
+        lambda db, ids: crud.get_catalog_facets(db, kind="offers"),
+        {"catalog_facets_pkey"},
+    ),
+    (
+        "deck inverse d'une offre",
+        lambda db, ids: crud.get_candidate_deck(db, kind="offers", owner_user_id=ids["offer_owner"], item_id=ids["offer"]),
+        {("ix_offer_shortlists_offer_id_score", "offer_shortlists_pkey")},
+    ),
+    (
+        "tableau de bord entreprise",
+        lambda db, ids: crud.get_company_dashboard(db, user_id=ids["company"]),
+        {"ix_offers_company_id", "offer_stats_pkey", "offer_daily_stats_pkey"},
+    ),
+    (
+        "shortlists en attente",
+        lambda db, ids: crud.refresh_pending_shortlists(db, "offers", limit=50),
+        {"ix_offers_live_pending_shortlist_id"},
+    ),
+    (
+        # Chargement puis rattrapage (SYNC_INTERVAL_SECONDS à 0 dans les tests)
+        "rattrapage des créations par l'index en mémoire",
+        lambda db, ids: [ranking.offer_index.sync(db) for _ in range(2)],
+        {"ix_offers_live_published_at_id", "ix_offers_closed_at"},
+    ),
+    (
+        # En dernier : clôture pour de bon les offres expirées du jeu de données
+        "purge des offres expirées",
+        lambda db, ids: crud.close_expired_items(db, kind="offers"),
+        {"ix_offers_live_expires_at"},
+    ),
+]
+
+
+def seed(connection) -> dict:
+    for _, statement in SEED:
+        connection.execute(text(statement))
+    for table in dict.fromkeys(table for table, _ in SEED):
+        connection.exec_driver_sql(f"ANALYZE {table}")
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    row = connection.execute(text(SAMPLE_IDS)).one()
+    return dict(zip(("student", "high_schooler", "company", "offer", "conversation", "message", "offer_owner"), row))
+
+
+def _index_names(plan: dict) -> set[str]:
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", ()):
+        names |= _index_names(child)
+    return names
+
+
+def explain(connection, function, ids: dict) -> set[str]:
+    """Index utilisés par l'ensemble des requêtes émises par `function(db, ids)`."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    db = Session(bind=connection, join_transaction_mode="create_savepoint")
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        function(db, ids)
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+        db.close()
+
+    used = set()
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith("SELECT"):
+            continue
+        rows = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        plan = rows if isinstance(rows, list) else json.loads(rows)
+        used |= _index_names(plan[0]["Plan"])
+    return used
+
+
+@pytest.fixture(scope="module")
+def planned():
+    """Connexion dans une transaction annulée à la fin du module, et les ids du jeu de données."""
+    engine = create_engine(POSTGRES_URL)
+    try:
+        with engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                yield connection, seed(connection)
+            finally:
+                transaction.rollback()
+    finally:
+        engine.dispose()
+
+
+# Dans l'ordre de CHECKS : la purge, qui clôture des offres, reste la dernière
+@pytest.mark.parametrize("function, expected", [check[1:] for check in CHECKS], ids=[check[0] for check in CHECKS])
+def test_hot_query_uses_index(planned, fresh_indexes, function, expected):
+    connection, ids = planned
+    used = explain(connection, function, ids)
+    missing = [
+        " | ".join(index) if isinstance(index, tuple) else index
+        for index in expected
+        if not (set(index) & used if isinstance(index, tuple) else index in used)
+    ]
+    assert not missing, f"index absents des plans : {', '.join(sorted(missing))} (utilisés : {', '.join(sorted(used)) or 'aucun'})"
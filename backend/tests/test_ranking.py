@@ -0,0 +1,50 @@
+from sqlalchemy import func # type: ignore
+
+import models
+import ranking
+
+
+def add_offer(db, offer_id: int, title: str, description: str):
+    db.add(models.Offer(id=offer_id, title=title, description=description))
+    db.commit()
+
+
+def test_sync_indexes_lower_id_committed_after_a_higher_one(db):
+    add_offer(db, 10, "Dev Python", "python backend")
+    ranking.offer_index.sync(db)
+    assert ranking.offer_index.rank("python") == [10]
+
+    # Id attribué avant 10 mais commité après : au-dessous du plus grand id déjà vu
+    add_offer(db, 5, "Dev Python", "python sql")
+    ranking.offer_index.sync(db)
+    assert sorted(ranking.offer_index.rank("python")) == [5, 10]
+
+
+def test_sync_drops_closed_offers(db):
+    add_offer(db, 1, "Dev Python", "python")
+    add_offer(db, 2, "Data", "python sql")
+    ranking.offer_index.sync(db)
+    db.query(models.Offer).filter(models.Offer.id == 1).update({models.Offer.closed_at: func.now()})
+    db.commit()
+    ranking.offer_index.sync(db)
+    assert ranking.offer_index.rank("python") == [2]
+
+
+def test_ranked_scores_once_and_walks_the_whole_order(db, monkeypatch):
+    texts = ["python sql", "python", "sql excel", "java spring", "python flutter"]
+    for offer_id in range(1, 61):
+        add_offer(db, offer_id, "Offre", texts[offer_id % len(texts)])
+    ranking.offer_index.sync(db)
+    calls = []
+    scores = ranking._scores
+    monkeypatch.setattr(ranking, "_scores", lambda *args: calls.append(args) or scores(*args))
+
+    slices = list(ranking.offer_index.ranked("python sql", exclude=[1], first=5, largest=16))
+
+    assert len(calls) == 1
+    assert [len(ids) for ids in slices] == [5, 10, 16, 16, 12]
+    ids, matching_scores = ranking.offer_index.scores_for("python sql", 100)
+    positive = dict(zip(ids.tolist(), matching_scores.tolist()))
+    expected = sorted((offer_id for offer_id in range(2, 61)), key=lambda offer_id: (-positive.get(offer_id, 0.0), offer_id))
+    assert sum(slices, []) == expected
+    assert ranking.offer_index.rank("python sql", exclude=[1], limit=5) == expected[:5]
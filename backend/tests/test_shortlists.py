@@ -0,0 +1,114 @@
+import pytest # type: ignore
+from sqlalchemy import func # type: ignore
+
+import crud
+import models
+import ranking
+import schemas
+
+
+@pytest.fixture
+def company(db, make_user):
+    user = make_user(models.UserType.COMPANY)
+    return user.id, crud.get_company_by_user_id(db, user.id).id
+
+
+def student(db, make_user, skills: str):
+    user_id = make_user(models.UserType.STUDENT).id
+    crud.update_student_profile(db, user_id, schemas.StudentUpdate(skills=skills))
+    return user_id
+
+
+def offer(db, company, title: str, description: str):
+    return crud.create_company_offer(db, schemas.OfferCreate(title=title, description=description, company_id=company[1]), company[1]).id
+
+
+def deck(db, company, offer_id: int):
+    return [(user.id, score) for score, user, _ in crud.get_candidate_deck(db, "offers", company[0], offer_id)]
+
+
+def shortlisted(db, user_id: int):
+    return {offer_id for (offer_id,) in db.query(models.OfferShortlist.offer_id).filter(models.OfferShortlist.user_id == user_id)}
+
+
+def pending(db):
+    return {offer_id for (offer_id,) in db.query(models.Offer.id).filter(models.Offer.shortlisted_at.is_(None))}
+
+
+def test_job_scores_pending_offers_against_matching_profiles(db, make_user, company):
+    both = student(db, make_user, "python sql")
+    python = student(db, make_user, "python")
+    student(db, make_user, "cuisine")
+    offer_id = offer(db, company, "Dev Python", "python sql backend")
+
+    # Création : rien de calculé dans la requête, l'offre attend la tâche de fond
+    assert deck(db, company, offer_id) == []
+    assert pending(db) == {offer_id}
+
+    assert crud.refresh_pending_shortlists(db, "offers") == [offer_id]
+    expected = []
+    for user_id, skills in ((both, "python sql"), (python, "python")):
+        ids, scores = ranking.offer_index.scores_for(skills, 10)
+        expected.append((user_id, dict(zip(ids.tolist(), scores.tolist()))[offer_id]))
+    assert deck(db, company, offer_id) == pytest.approx(sorted(expected, key=lambda entry: -entry[1]))
+    assert pending(db) == set()
+    assert crud.refresh_pending_shortlists(db, "offers") == []
+
+
+def test_job_keeps_the_best_profiles_only(db, make_user, company, monkeypatch):
+    monkeypatch.setattr(models, "SHORTLIST_SIZE", 2)
+    best = student(db, make_user, "python sql backend")
+    second = student(db, make_user, "python sql")
+    student(db, make_user, "python excel marketing vente")
+    offer_id = offer(db, company, "Dev Python", "python sql backend")
+    crud.refresh_pending_shortlists(db, "offers")
+    assert [user_id for user_id, _ in deck(db, company, offer_id)] == [best, second]
+
+
+def test_closed_offers_drop_out_of_shortlists(db, make_user, company, monkeypatch):
+    user_id = student(db, make_user, "python")
+    kept, closed, closed_elsewhere, closed_pending = (offer(db, company, "Dev Python", "python") for _ in range(4))
+    crud.close_owned_item(db, "offers", company[0], closed_pending)
+    assert crud.refresh_pending_shortlists(db, "offers") == [kept, closed, closed_elsewhere]
+    assert shortlisted(db, user_id) == {kept, closed, closed_elsewhere}
+
+    crud.close_owned_item(db, "offers", company[0], closed)
+    assert shortlisted(db, user_id) == {kept, closed_elsewhere}
+    assert deck(db, company, closed) == []
+
+    # Clôturée par un autre worker : l'index de celui-ci l'a encore, le PATCH ne l'y remet pas
+    monkeypatch.setattr(ranking, "SYNC_INTERVAL_SECONDS", 3600)
+    db.query(models.Offer).filter(models.Offer.id == closed_elsewhere).update({models.Offer.closed_at: func.now()})
+    db.query(models.OfferShortlist).filter(models.OfferShortlist.offer_id == closed_elsewhere).delete()
+    db.commit()
+    crud.update_student_profile(db, user_id, schemas.StudentUpdate(skills="python sql"))
+    assert shortlisted(db, user_id) == {kept}
+
+
+def test_profile_update_only_refreshes_its_top_offers(db, make_user, company, monkeypatch):
+    monkeypatch.setattr(models, "SHORTLIST_SIZE", 2)
+    offers = [
+        offer(db, company, "Dev Python", "python sql"),
+        offer(db, company, "Data", "python sql excel"),
+        offer(db, company, "Dev Python", "python"),
+        offer(db, company, "Marketing", "python marketing vente excel"),
+    ]
+    crud.refresh_pending_shortlists(db, "offers")
+    user_id = student(db, make_user, "python")
+
+    top, _ = ranking.offer_index.scores_for("python", 2)
+    assert shortlisted(db, user_id) == set(top.tolist())
+    assert pending(db) == set()
+
+    # Les offres qu'il quitte attendent la tâche de fond, qui les recalcule
+    crud.update_student_profile(db, user_id, schemas.StudentUpdate(skills="cuisine"))
+    assert shortlisted(db, user_id) == set()
+    assert pending(db) == set(top.tolist())
+    assert sorted(crud.refresh_pending_shortlists(db, "offers")) == sorted(top.tolist())
+
+    # Au-delà de son top-k, il n'entre qu'au prochain calcul de l'offre
+    crud.update_student_profile(db, user_id, schemas.StudentUpdate(skills="python"))
+    db.query(models.Offer).update({models.Offer.shortlisted_at: None})
+    db.commit()
+    crud.refresh_pending_shortlists(db, "offers")
+    assert shortlisted(db, user_id) == set(offers)